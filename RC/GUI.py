@@ -243,6 +243,12 @@ if 'selected_client' not in st.session_state:
     st.session_state.selected_client = None
 if 'server_conversations' not in st.session_state:
     st.session_state.server_conversations = {}
+if 'server_history_pages' not in st.session_state:
+    st.session_state.server_history_pages = {}
+if 'server_tcp_mode' not in st.session_state:
+    st.session_state.server_tcp_mode = 'threaded'
+if 'server_outbound_policy' not in st.session_state:
+    st.session_state.server_outbound_policy = 'drop_oldest'
 
 from chatserver import ChatServer
 from chatclient import ChatClient
@@ -294,6 +300,7 @@ elif st.session_state.mode == "server":
             st.session_state.connected_clients = []
             st.session_state.selected_client = None
             st.session_state.server_conversations = {}
+            st.session_state.server_history_pages = {}
             st.rerun()
     
     st.markdown("---")
@@ -308,9 +315,30 @@ elif st.session_state.mode == "server":
         if not st.session_state.server_running:
             st.session_state.server_protocol = protocol
         
+        if protocol == "TCP":
+            tcp_engine = st.radio("⚙ TCP Engine", ["Threaded", "Event loop"],
+                                  index=0 if st.session_state.server_tcp_mode == 'threaded' else 1,
+                                  disabled=st.session_state.server_running,
+                                  key="server_tcp_mode_radio",
+                                  help="Event loop serves every client from one thread (scales to thousands of connections)")
+            if not st.session_state.server_running:
+                st.session_state.server_tcp_mode = 'threaded' if tcp_engine == "Threaded" else 'eventloop'
+            
+            policies = ['drop_oldest', 'disconnect', 'block']
+            outbound_policy = st.selectbox("🐢 Slow clients", policies,
+                                           index=policies.index(st.session_state.server_outbound_policy),
+                                           disabled=st.session_state.server_running,
+                                           key="server_outbound_policy_select",
+                                           help="What to do when a client's outbound queue is full")
+            if not st.session_state.server_running:
+                st.session_state.server_outbound_policy = outbound_policy
+        
         host = st.text_input("🌐 Host Address", value="0.0.0.0", disabled=st.session_state.server_running)
         port = st.number_input("🔌 Port", value=5555, min_value=1024, max_value=65535, 
                               disabled=st.session_state.server_running)
+        metrics_port = st.number_input("📈 Metrics port (0 = off)", value=0, min_value=0, max_value=65535,
+                                       disabled=st.session_state.server_running,
+                                       help="Serves Prometheus metrics on http://host:port/metrics")
         
         if protocol == "TCP" and not st.session_state.server_running:
             st.markdown("""
@@ -340,7 +368,10 @@ elif st.session_state.mode == "server":
         if not st.session_state.server_running:
             if st.button("▶ Start Server", use_container_width=True, type="primary"):
                 if 'server' not in st.session_state:
-                    st.session_state.server = ChatServer(host, port, st.session_state.server_protocol, use_ssl=True)
+                    st.session_state.server = ChatServer(host, port, st.session_state.server_protocol, use_ssl=True,
+                                                         tcp_mode=st.session_state.server_tcp_mode,
+                                                         outbound_policy=st.session_state.server_outbound_policy)
+                st.session_state.server.metrics_port = metrics_port or None
                 if st.session_state.server.start():
                     st.session_state.server_running = True
                     st.rerun()
@@ -450,6 +481,18 @@ elif st.session_state.mode == "server":
             with chat_container:
                 current_client_messages = st.session_state.server_conversations.get(st.session_state.selected_client, [])
                 
+                # Older messages live in the server's spill segment: fetched page by page on demand
+                store = st.session_state.server.conversations
+                pages = st.session_state.server_history_pages.get(st.session_state.selected_client, 0)
+                if store.spilled(st.session_state.selected_client) > pages * 50:
+                    if st.button("⬆ Load older messages", key=f"older_{st.session_state.selected_client}"):
+                        st.session_state.server_history_pages[st.session_state.selected_client] = pages + 1
+                        st.rerun()
+                older = []
+                for page in range(pages - 1, -1, -1):
+                    older += store.page(st.session_state.selected_client, page, 50)
+                current_client_messages = older + current_client_messages
+                
                 if current_client_messages:
                     for msg in current_client_messages:
                         encrypted_class = "message-encrypted" if ssl_enabled else ""
@@ -531,6 +574,13 @@ elif st.session_state.mode == "server":
                     if stats['min_latency'] > 0:
                         st.metric("Min", f"{stats['min_latency']:.2f} ms")
                     
+                    if stats['latency_lifetime']['count'] > 0:
+                        lifetime = stats['latency_lifetime']
+                        st.caption(f"Last {min(lifetime['count'], 1024)}: p50 {stats['p50_latency']:.2f} | p95 {stats['p95_latency']:.2f} | "
+                                   f"p99 {stats['p99_latency']:.2f} ms")
+                        st.caption(f"Lifetime ({lifetime['count']}): p50 {lifetime['p50']:.2f} | p99 {lifetime['p99']:.2f} | "
+                                   f"p99.9 {lifetime['p999']:.2f} ms")
+                    
                     st.markdown("---")
                     st.markdown("#### 📨 Messages")
                     col1, col2 = st.columns(2)
@@ -539,10 +589,20 @@ elif st.session_state.mode == "server":
                     with col2:
                         st.metric("Received", stats['received_count'])
                     
+                    if st.session_state.server_protocol == 'TCP':
+                        st.markdown("---")
+                        st.markdown("#### 📤 Outbound Queue")
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            st.metric("Queued", stats['queued_messages'])
+                        with col2:
+                            st.metric("Dropped", stats['outbound_dropped'])
+                        st.caption(f"Policy: {stats['outbound_policy']} | {stats['outbound_bytes'] / 1024:.1f} KB queued")
+                    
                     if st.session_state.server_protocol == 'UDP':
                         st.markdown("---")
                         st.markdown("#### 🔄 Reliability")
-                        st.info(f"🎲 Simulation: {stats['configured_loss_rate']:.0f}% loss | Timeout: {stats['ack_timeout']}s | Max retries: {stats['max_retries']}")
+                        st.info(f"🎲 Simulation: {stats['configured_loss_rate']:.0f}% loss | RTO: {stats['rto'] * 1000:.0f} ms (SRTT {stats['srtt']:.1f} ms) | Max retries: {stats['max_retries']}")
                         
                         col1, col2 = st.columns(2)
                         with col1:
@@ -711,7 +771,7 @@ elif st.session_state.mode == "client":
                             st.session_state.nickname = st.session_state.client_nickname
                             st.rerun()
                         else:
-                            st.error("❌ Failed to connect to server")
+                            st.error(f"❌ Failed to connect to server: {st.session_state.client.last_error}")
                 with col_b:
                     if st.button("🔙 Back to Sign In", use_container_width=True, type="secondary"):
                         st.session_state.client_signed_in = False
@@ -882,6 +942,10 @@ elif st.session_state.mode == "client":
                     with col2:
                         st.metric("Max Lat", f"{stats['max_latency']:.1f}ms" if stats['max_latency'] > 0 else "N/A")
                     
+                    if stats['latency_lifetime']['count'] > 0:
+                        st.caption(f"p50 {stats['p50_latency']:.1f} | p95 {stats['p95_latency']:.1f} | p99 {stats['p99_latency']:.1f} | "
+                                   f"p99.9 (lifetime) {stats['latency_lifetime']['p999']:.1f} ms")
+                    
                     col1, col2 = st.columns(2)
                     with col1:
                         st.metric("Sent", stats['sent_count'])
@@ -892,7 +956,7 @@ elif st.session_state.mode == "client":
                         st.markdown("---")
                         st.markdown("#### 🔄 UDP Stats")
                         
-                        st.info(f"🎲 Loss: {stats['configured_loss_rate']:.0f}% | Timeout: {stats['ack_timeout']}s | Max: {stats['max_retries']}")
+                        st.info(f"🎲 Loss: {stats['configured_loss_rate']:.0f}% | RTO: {stats['rto'] * 1000:.0f} ms | Max: {stats['max_retries']}")
                         
                         col1, col2 = st.columns(2)
                         with col1:
@@ -0,0 +1,1582 @@
+"""
+Benchmarks for ChatHub.
+Run from the RC directory:  python bench.py <benchmark> [options]
+"""
+import argparse
+import collections
+import math
+import os
+import queue
+import resource
+import select
+import socket
+import ssl
+import subprocess
+import sys
+import time
+
+from framing import FrameReader, encode_frame, FRAME_NICK, FRAME_MSG
+import datagram
+from datagram import DGRAM_HELLO, DGRAM_MSG, DGRAM_ACK
+
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+
+def raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        pass
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def proc_status(pid):
+    """VmRSS (KB) and thread count of a process, read from /proc"""
+    rss_kb, threads = 0, 0
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+            elif line.startswith('Threads:'):
+                threads = int(line.split()[1])
+    return rss_kb, threads
+
+
+def drain(q):
+    while True:
+        try:
+            q.get_nowait()
+        except queue.Empty:
+            return
+
+
+def serve(args):
+    """Child process: run a ChatServer until stdin is closed"""
+    from chatserver import ChatServer
+
+    raise_fd_limit()
+    server = ChatServer('127.0.0.1', args.port, args.proto, use_ssl=args.ssl, tcp_mode=args.mode)
+    server.packet_loss_rate = 0.0
+    if not server.start():
+        sys.exit(1)
+    print('READY', flush=True)
+    while True:
+        drain(server.log_queue)
+        drain(server.clients_queue)
+        drain(server.conversations_queue)
+        readable, _, _ = select.select([sys.stdin], [], [], 0.5)
+        if readable and os.read(sys.stdin.fileno(), 1) == b'':
+            break
+    server.stop()
+
+
+def blast(args):
+    """
+    Child process: HELLO, then --count MSG datagrams with at most --window
+    unacknowledged (cumulative ACKs), so the server is saturated without overflowing its buffer
+    """
+    from udp_crypto import UDPCrypto
+
+    crypto = UDPCrypto() if args.ssl else None
+    text = ('x' * args.size).encode('utf-8')
+    datagrams = [datagram.pack(DGRAM_MSG, seq, time.time(), text, crypto) for seq in range(args.count)]
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(('127.0.0.1', args.port))
+    sock.send(datagram.pack(DGRAM_HELLO, payload=args.nickname.encode('utf-8'), crypto=crypto))
+    print('READY', flush=True)
+    sys.stdin.readline()
+    sock.settimeout(0.5)
+    if not args.window:
+        for data in datagrams:  # flood, no flow control
+            sock.send(data)
+        return
+    acked = sent = 0
+    while acked < args.count:
+        while sent < min(acked + args.window, args.count):
+            sock.send(datagrams[sent])
+            sent += 1
+        try:
+            data = sock.recv(2048)
+        except socket.timeout:
+            sent = acked  # lost: go back to the first unacknowledged datagram
+            continue
+        version, dgram_type, flags, msg_id, send_time = datagram.HEADER.unpack_from(data)
+        if dgram_type == DGRAM_ACK:
+            acked = max(acked, msg_id)
+    sock.close()
+
+
+def tcp_load(args):
+    """
+    Child process: --clients TCP connections, each in a closed loop of /rooms
+    requests (the server answers each one); prints the requests answered and RTT p50/p99 in ms
+    """
+    raise_fd_limit()
+    members = [TCPMember(args.port, f"{args.prefix}{i}", args.ssl) for i in range(args.clients)]
+    by_sock = {member.sock: member for member in members}
+    print('READY', flush=True)
+    sys.stdin.readline()
+    rtts = []
+    sent_at = {}
+    for member in members:
+        sent_at[member] = time.perf_counter()
+        member.send_text('/rooms')
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        readable, _, _ = select.select(list(by_sock), [], [], 0.5)
+        for sock in readable:
+            member = by_sock[sock]
+            if member.read():
+                now = time.perf_counter()
+                rtts.append(now - sent_at[member])
+                sent_at[member] = now
+                member.send_text('/rooms')
+    rtts.sort()
+    p50, p99 = (rtts[int(len(rtts) * q)] * 1000 for q in (0.5, 0.99)) if rtts else (float('nan'),) * 2
+    print(len(rtts), f"{p50:.3f}", f"{p99:.3f}", flush=True)
+
+
+def start_blasters(port, args, window):
+    """args.senders _blast processes, HELLO sent, waiting for release_blasters()"""
+    senders = []
+    for i in range(args.senders):
+        proc = subprocess.Popen(
+            [sys.executable, __file__, '_blast', '--port', str(port), '--nickname', f"blast{i}",
+             '--count', str(args.count), '--size', str(args.size), '--window', str(window)]
+            + (['--ssl'] if args.ssl else []),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        proc.stdout.readline()
+        senders.append(proc)
+    return senders
+
+
+def release_blasters(senders):
+    for proc in senders:
+        proc.stdin.write('go\n')
+        proc.stdin.flush()
+
+
+def start_server(proto, port, use_ssl=False, mode='threaded', python=sys.executable):
+    """Start a ChatServer child process (run by the python interpreter); close its stdin to stop it"""
+    proc = subprocess.Popen(
+        [python, __file__, '_serve', '--proto', proto, '--mode', mode, '--port', str(port)]
+        + (['--ssl'] if use_ssl else []),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    if proc.stdout.readline().strip() != 'READY':
+        stop_server(proc)
+        return None
+    return proc
+
+
+def stop_server(proc):
+    proc.stdin.close()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def open_tcp_client(port, nickname, use_ssl, rcvbuf=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(30)
+    if rcvbuf:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    sock.connect(('127.0.0.1', port))
+    if use_ssl:
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        sock = ctx.wrap_socket(sock, server_hostname='127.0.0.1')
+    reader = FrameReader()
+    frame = reader.read_frame(sock)
+    if frame is None or frame[0] != FRAME_NICK:
+        raise RuntimeError("NICK negotiation failed")
+    sock.sendall(encode_frame(FRAME_NICK, nickname.encode('utf-8')))
+    reader.read_frame(sock)  # welcome
+    return sock
+
+
+class UDPMember:
+    """Minimal UDP chat peer: HELLO, sends messages, ACKs what it receives (cumulative + SACK)"""
+
+    def __init__(self, port, nickname, crypto=None):
+        from udp_reliability import AckTracker, ReplayWindow
+
+        self.crypto = crypto
+        self.tracker = AckTracker()
+        self.replay = ReplayWindow()
+        self.next_seq = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.connect(('127.0.0.1', port))
+        self.sock.setblocking(False)
+        self.sock.send(datagram.pack(DGRAM_HELLO, payload=nickname.encode('utf-8'), crypto=crypto))
+
+    def send_text(self, text):
+        self.sock.send(datagram.pack(DGRAM_MSG, self.next_seq, time.time(), text.encode('utf-8'), self.crypto))
+        self.next_seq += 1
+
+    def read(self):
+        """Drain the socket, ACK once; returns the new (non-duplicate) message payloads"""
+        messages = []
+        while True:
+            try:
+                data = self.sock.recv(2048)
+            except (BlockingIOError, ConnectionRefusedError):
+                break
+            dgram_type, msg_id, send_time, payload = datagram.unpack(data, self.crypto)
+            if dgram_type == DGRAM_MSG:
+                self.tracker.record(msg_id)
+                if self.replay.accept(msg_id):
+                    messages.append(bytes(payload))
+        if messages or self.tracker.above:
+            ack = datagram.pack(DGRAM_ACK, self.tracker.next_expected,
+                                payload=datagram.pack_sack(self.tracker.sack_blocks()), crypto=self.crypto)
+            self.sock.send(ack)
+        return messages
+
+
+class TCPMember:
+    """Raw TCP chat peer reading frames without blocking"""
+
+    def __init__(self, port, nickname, use_ssl, rcvbuf=None):
+        self.sock = open_tcp_client(port, nickname, use_ssl, rcvbuf)
+        self.sock.setblocking(False)
+        self.reader = FrameReader()
+
+    def send_text(self, text):
+        self.sock.setblocking(True)
+        self.sock.sendall(encode_frame(FRAME_MSG, text.encode('utf-8'), time.time()))
+        self.sock.setblocking(False)
+
+    def read(self):
+        try:
+            while self.reader.recv_from(self.sock):
+                if not (isinstance(self.sock, ssl.SSLSocket) and self.sock.pending()):
+                    break
+        except (BlockingIOError, ssl.SSLWantReadError):
+            pass
+        return [bytes(payload) for frame_type, send_time, payload in self.reader.frames()]
+
+
+def bench_tcp_idle(args):
+    """Server RSS / threads while holding N idle connections, per TCP engine"""
+    raise_fd_limit()
+    print(f"{'mode':<10} {'ssl':<5} {'conns':>6} {'base RSS':>10} {'RSS':>10} {'KB/conn':>8} {'threads':>8} {'connect s':>10}")
+    for mode in args.modes:
+        proc = start_server('TCP', args.port, args.ssl, mode)
+        if proc is None:
+            print(f"{mode}: server failed to start")
+            continue
+        try:
+            time.sleep(0.5)
+            base_rss, _ = proc_status(proc.pid)
+
+            conns = []
+            start = time.perf_counter()
+            try:
+                for i in range(args.connections):
+                    conns.append(open_tcp_client(args.port, f"idle{i}", args.ssl))
+            except OSError as e:
+                print(f"{mode}: stopped after {len(conns)} connections ({e})")
+            elapsed = time.perf_counter() - start
+
+            time.sleep(1.0)
+            rss, threads = proc_status(proc.pid)
+            per_conn = (rss - base_rss) / max(len(conns), 1)
+            print(f"{mode:<10} {str(args.ssl):<5} {len(conns):>6} {base_rss:>8}KB {rss:>8}KB "
+                  f"{per_conn:>8.1f} {threads:>8} {elapsed:>10.2f}")
+
+            for c in conns:
+                c.close()
+        finally:
+            stop_server(proc)
+
+
+def bench_framing(args):
+    """Parse a coalesced TCP stream: legacy '|TS:' text split vs length-prefixed frames"""
+    texts = [f"bench{i % 50}: " + 'x' * (args.size - 10) for i in range(args.messages)]
+    now = time.time()
+
+    legacy = b''.join(f"{t}|TS:{now}|".encode('utf-8') for t in texts)
+    framed = b''.join(encode_frame(FRAME_MSG, t.encode('utf-8'), now) for t in texts)
+
+    # Legacy reader: every recv(2048) was taken as exactly one message
+    start = time.perf_counter()
+    parsed = 0
+    for i in range(0, len(legacy), args.chunk):
+        msg = legacy[i:i + args.chunk].decode('utf-8', 'replace').strip()
+        if '|TS:' in msg:
+            parts = msg.split('|TS:')
+            try:
+                float(parts[1].split('|')[0])
+                parsed += 1
+            except ValueError:
+                pass
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    reader = FrameReader()
+    framed_ok = 0
+    for i in range(0, len(framed), args.chunk):
+        reader.feed(framed[i:i + args.chunk])
+        for frame_type, send_time, payload in reader.frames():
+            str(payload, 'utf-8')
+            framed_ok += 1
+    framed_time = time.perf_counter() - start
+
+    print(f"{args.messages} messages of ~{args.size} B, read in {args.chunk} B chunks")
+    print(f"{'format':<8} {'bytes':>10} {'recovered':>10} {'MB/s':>8} {'recovered msg/s':>16}")
+    print(f"{'legacy':<8} {len(legacy):>10} {parsed:>10} {len(legacy) / legacy_time / 1e6:>8.1f} "
+          f"{parsed / legacy_time:>16,.0f}")
+    print(f"{'framed':<8} {len(framed):>10} {framed_ok:>10} {len(framed) / framed_time / 1e6:>8.1f} "
+          f"{framed_ok / framed_time:>16,.0f}")
+
+
+def bench_udp_format(args):
+    """Bytes per datagram and encode+decode rate: legacy 'MSG:id:ts:text' + base64 vs binary header"""
+    from udp_crypto import UDPCrypto
+
+    crypto = UDPCrypto()
+    text = 'bench: ' + 'x' * (args.size - 7)
+    payload = text.encode('utf-8')
+
+    def legacy(encrypt):
+        start = time.perf_counter()
+        size = 0
+        for i in range(args.messages):
+            msg = f"MSG:{i}:{time.time()}:{text}"
+            if encrypt:
+                msg = crypto.encrypt_message(msg)
+            data = msg.encode('utf-8')
+            size = len(data)
+            msg = data.decode('utf-8')
+            if encrypt:
+                msg = crypto.decrypt_message(msg)
+            parts = msg.split(':', 3)
+            int(parts[1]), float(parts[2]), parts[3]
+        return size, args.messages / (time.perf_counter() - start)
+
+    def binary(encrypt):
+        start = time.perf_counter()
+        size = 0
+        c = crypto if encrypt else None
+        for i in range(args.messages):
+            data = datagram.pack(DGRAM_MSG, i, time.time(), payload, c)
+            size = len(data)
+            dgram_type, msg_id, send_time, body = datagram.unpack(data, c)
+            str(body, 'utf-8')
+        return size, args.messages / (time.perf_counter() - start)
+
+    print(f"{args.messages} messages, {args.size} B of text")
+    print(f"{'format':<8} {'encrypted':<10} {'bytes/msg':>10} {'msg/s':>12}")
+    for encrypt in (False, True):
+        for name, func in (('legacy', legacy), ('binary', binary)):
+            size, rate = func(encrypt)
+            print(f"{name:<8} {str(encrypt):<10} {size:>10} {rate:>12,.0f}")
+
+
+def bench_udp_keys(args):
+    """UDPCrypto construction time: cold PBKDF2, warm process cache, key file in a fresh cache"""
+    import tempfile
+    import udp_crypto
+    from udp_crypto import UDPCrypto
+
+    def timed(n, **kwargs):
+        start = time.perf_counter()
+        for _ in range(n):
+            UDPCrypto(**kwargs)
+        return (time.perf_counter() - start) / n * 1000
+
+    udp_crypto.clear_key_cache()
+    cold = timed(1)
+    warm = timed(args.instances)
+
+    key_file = os.path.join(tempfile.mkdtemp(), 'udp.key')
+    udp_crypto.clear_key_cache()
+    timed(1, key_file=key_file)  # writes the file
+    udp_crypto.clear_key_cache()
+    from_file = timed(1, key_file=key_file)
+    os.unlink(key_file)
+
+    print(f"{'construction':<28} {'ms':>10}")
+    print(f"{'cold (PBKDF2 100k iter)':<28} {cold:>10.3f}")
+    print(f"{'warm (process cache)':<28} {warm:>10.3f}")
+    print(f"{'new process + key file':<28} {from_file:>10.3f}")
+    print(f"{args.instances} clients: {cold * args.instances / 1000:.2f} s uncached vs "
+          f"{(cold + warm * (args.instances - 1)) / 1000:.3f} s cached")
+
+
+def bench_udp_handshake(args):
+    """Per-session X25519 + HKDF handshake vs the PBKDF2 static key; seal+open rate with each key"""
+    import udp_crypto
+    from udp_crypto import UDPCrypto, KeyExchange
+
+    udp_crypto.clear_key_cache()
+    start = time.perf_counter()
+    static = UDPCrypto()
+    cold = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    for _ in range(args.sessions):
+        client, server = KeyExchange(), KeyExchange()
+        client.session(server.public, static.key, initiator=True)
+        server.session(client.public, static.key, initiator=False)
+    handshake = (time.perf_counter() - start) / args.sessions * 1000
+
+    client, server = KeyExchange(), KeyExchange()
+    sender = client.session(server.public, static.key, initiator=True, rekey_messages=args.rekey)
+    receiver = server.session(client.public, static.key, initiator=False, rekey_messages=args.rekey)
+    payload = b'x' * args.size
+
+    def rate(seal, open_):
+        start = time.perf_counter()
+        for i in range(args.messages):
+            data = datagram.pack(DGRAM_MSG, i, 0.0, payload, seal)
+            datagram.unpack(data, open_, open_)
+        return args.messages / (time.perf_counter() - start)
+
+    print(f"{'key setup':<34} {'ms':>10}")
+    print(f"{'static key (PBKDF2, cold)':<34} {cold:>10.3f}")
+    print(f"{'session handshake (both sides)':<34} {handshake:>10.3f}")
+    print(f"{args.messages} messages of {args.size} B, rekey every {args.rekey}")
+    print(f"{'static key seal+open msg/s':<34} {rate(static, static):>10,.0f}")
+    print(f"{'session keys seal+open msg/s':<34} {rate(sender, receiver):>10,.0f}  ({sender.rekeys} rekeys)")
+
+
+def bench_udp_seal(args):
+    """UDP encryption hot path: str/base64 API vs bytes seal (random vs counter nonce) vs sealing into a reused buffer"""
+    import tracemalloc
+    from udp_crypto import UDPCrypto, KeyExchange
+
+    crypto = UDPCrypto()
+    client, server = KeyExchange(), KeyExchange()
+    sender = client.session(server.public, crypto.key, initiator=True)
+    receiver = server.session(client.public, crypto.key, initiator=False)
+    text = 'bench: ' + 'x' * (args.size - 7)
+    payload = text.encode('utf-8')
+    out, into = bytearray(datagram.MAX_DATAGRAM), bytearray(datagram.MAX_DATAGRAM)
+
+    def legacy():
+        data = crypto.encrypt_message(text).encode('utf-8')
+        crypto.decrypt_message(data.decode('utf-8'))
+
+    def random_nonce():
+        # seal() before counter nonces: one os.urandom(12) syscall per message
+        header = datagram.HEADER.pack(datagram.VERSION, DGRAM_MSG, datagram.FLAG_ENCRYPTED, 1, 0.0)
+        nonce = os.urandom(12)
+        data = header + nonce + crypto.aesgcm.encrypt(nonce, payload, header)
+        datagram.unpack(data, crypto)
+
+    def seal(keys, peer):
+        return lambda: datagram.unpack(datagram.pack(DGRAM_MSG, 1, 0.0, payload, keys), peer, peer)
+
+    def seal_into(keys, peer):
+        return lambda: datagram.unpack(datagram.pack_into(out, DGRAM_MSG, 1, 0.0, payload, keys), peer, peer, into)
+
+    variants = (
+        ('str + base64 (encrypt_message)', legacy),
+        ('bytes, os.urandom nonce', random_nonce),
+        ('bytes, counter nonce (seal)', seal(crypto, crypto)),
+        ('buffer, counter nonce (seal_into)', seal_into(crypto, crypto)),
+        ('session keys, seal', seal(sender, receiver)),
+        ('session keys, seal_into', seal_into(sender, receiver)),
+    )
+
+    def allocated(func, samples=2000):
+        # Heap bytes allocated while one message is sealed + opened (freed temporaries included)
+        tracemalloc.start()
+        total = 0
+        for _ in range(samples):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            func()
+            total += tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+        return total / samples
+
+    print(f"{args.messages:,} messages of {args.size} B, seal + open")
+    print(f"{'path':<36} {'msg/s':>10} {'B alloc/msg':>12}")
+    for name, func in variants:
+        start = time.perf_counter()
+        for _ in range(args.messages):
+            func()
+        rate = args.messages / (time.perf_counter() - start)
+        print(f"{name:<36} {rate:>10,.0f} {allocated(func):>12.0f}")
+
+
+def bench_udp_window(args):
+    """
+    Client -> server UDP throughput until every message is ACKed, per window size and loss rate.
+    Loss is simulated by the client only; it drops both outgoing datagrams and incoming ACKs,
+    so the rate applies once in each direction.
+    """
+    from chatserver import ChatServer
+    from chatclient import ChatClient
+
+    print(f"{args.messages} messages of {args.size} B, max_retries={args.max_retries}")
+    print(f"{'window':>6} {'loss':>5} {'seconds':>8} {'msg/s':>9} {'acked':>6} {'retrans':>8} {'ACK dgrams/msg':>15}")
+    text = 'x' * args.size
+    port = args.port
+    for window in args.windows:
+        for loss in args.loss:
+            port += 1
+            server = ChatServer('127.0.0.1', port, 'UDP', use_ssl=False)
+            server.packet_loss_rate = 0.0
+            server.max_retries = args.max_retries
+            if not server.start():
+                print(f"window {window}: server failed to start")
+                continue
+            client = ChatClient('127.0.0.1', port, 'bench', 'UDP', use_ssl=False)
+            client.packet_loss_rate = 0.0
+            client.max_retries = args.max_retries
+            client.window_size = client.send_window.size = window
+            try:
+                if not client.connect():
+                    print(f"window {window}: client failed to connect")
+                    continue
+                time.sleep(0.2)
+                client.packet_loss_rate = loss
+
+                start = time.perf_counter()
+                for _ in range(args.messages):
+                    client.send_message(text)
+                while time.perf_counter() - start < args.timeout:
+                    with client.lock:
+                        if not client.pending_messages and not client.send_window.backlog:
+                            break
+                    time.sleep(0.005)
+                elapsed = time.perf_counter() - start
+
+                stats = client.get_stats()
+                server_stats = server.get_client_stats('bench') or {}
+                acked = stats['ack_count']
+                print(f"{window:>6} {loss * 100:>4.0f}% {elapsed:>8.2f} {acked / elapsed:>9,.0f} {acked:>6} "
+                      f"{stats['retransmissions']:>8} {server_stats.get('acks_sent', 0) / max(acked, 1):>15.2f}")
+            finally:
+                client.disconnect()
+                server.stop()
+                drain(server.log_queue)
+
+
+def bench_udp_rx(args):
+    """
+    UDP receive path capacity: --senders processes blast MSG datagrams at one
+    server (window-limited by its ACKs); reports the datagrams/s it processes while saturated
+    """
+    from chatserver import ChatServer
+    from udp_io import DatagramBatch
+
+    # Raw receive loop only (no processing), flooded: the server loop before batching vs DatagramBatch
+    print(f"raw receive, {args.senders} senders flooding {args.count:,} datagrams of {args.size} B each")
+    print(f"{'loop':<28} {'received':>10} {'lost':>8} {'seconds':>8} {'packets/s':>10}")
+    for name in ('settimeout + recvfrom', 'DatagramBatch'):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind(('127.0.0.1', 0))
+        senders = start_blasters(sock.getsockname()[1], args, 0)
+        received, wakeups, owed, first, last = 0, 0, False, None, None
+        batch = DatagramBatch(sock, max(args.batches)) if name == 'DatagramBatch' else None
+        release_blasters(senders)
+        while True:
+            if batch is None:
+                # Same as the loop before batching: poll while an ACK is owed, block once it is flushed
+                sock.settimeout(0.0 if owed else 1.0)
+                try:
+                    sock.recvfrom(datagram.MAX_DATAGRAM)
+                    count, owed = 1, True
+                except (BlockingIOError, socket.timeout):
+                    count, owed = 0, False
+                    wakeups += 1
+            else:
+                count = len(batch.receive(timeout=1.0))
+                wakeups = batch.wakeups
+            now = time.perf_counter()
+            if count:
+                received += count
+                first, last = first or now, now
+            elif last is not None and now - last > 0.5:
+                break
+            elif first is None and wakeups > 5:
+                break
+        for proc in senders:
+            proc.wait()
+        sock.close()
+        print(f"{name:<28} {received:>10,} {args.senders * args.count - received:>8,} {last - first:>8.2f} "
+              f"{received / (last - first):>10,.0f}")
+
+    print()
+    print(f"server, {args.senders} senders x {args.count:,} datagrams of {args.size} B, window {args.window}, encrypted={args.ssl}")
+    print(f"{'batch':>6} {'processed':>10} {'seconds':>8} {'packets/s':>10} {'dropped':>8}")
+    port = args.port
+    for batch in args.batches:
+        port += 1
+        server = ChatServer('127.0.0.1', port, 'UDP', use_ssl=args.ssl)
+        server.packet_loss_rate = 0.0
+        server.udp_batch = batch
+        count, elapsed = saturate_server(server, port, args)
+        if count is None:
+            print(f"batch {batch}: server failed to start")
+            continue
+        total = args.senders * args.count
+        print(f"{batch:>6} {count:>10,} {elapsed:>8.2f} {count / elapsed:>10,.0f} {total - count:>8,}")
+
+
+def saturate_server(server, port, args):
+    """
+    Start server, release args.senders window-limited _blast senders at it and
+    wait until it stops making progress; (datagrams processed, seconds) or (None, None)
+    """
+    import threading
+
+    if not server.start():
+        return None, None
+    stop = threading.Event()
+
+    def drain_queues():
+        while not stop.wait(0.2):
+            drain(server.log_queue)
+            drain(server.clients_queue)
+            drain(server.conversations_queue)
+
+    threading.Thread(target=drain_queues, daemon=True).start()
+    senders = []
+    try:
+        senders = start_blasters(port, args, args.window)
+        time.sleep(0.5)
+        nicknames = [f"blast{i}" for i in range(args.senders)]
+
+        def processed():
+            return sum((server.get_client_stats(n) or {}).get('received_count', 0) for n in nicknames)
+
+        release_blasters(senders)
+        started = time.perf_counter()
+        first = last = None
+        count = 0
+        while True:
+            time.sleep(0.05)
+            now, current = time.perf_counter(), processed()
+            if current != count:
+                first = first or now
+                last, count = now, current
+            elif last is not None and now - last > 1.0:
+                break
+            elif first is None and now - started > 10:
+                break
+        elapsed = (last - first) if first and last and last > first else float('nan')
+        return count, elapsed
+    finally:
+        for proc in senders:
+            proc.wait()
+        stop.set()
+        server.stop()
+        drain(server.log_queue)
+
+
+def bench_udp_workers(args):
+    """UDP server scaling with SO_REUSEPORT worker processes: datagrams/s processed for N workers"""
+    import threading
+    from udp_workers import UDPWorkerPool, STATS_INTERVAL
+
+    print(f"{args.senders} senders x {args.count:,} datagrams of {args.size} B, window {args.window}, "
+          f"encrypted={args.ssl}, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'processed':>10} {'seconds':>8} {'packets/s':>10}  peers per worker")
+    port = args.port
+    for workers in args.workers:
+        port += 1
+        pool = UDPWorkerPool('127.0.0.1', port, workers, use_ssl=args.ssl)
+        pool.packet_loss_rate = 0.0
+        if not pool.start():
+            print(f"{workers} workers: failed to start")
+            drain(pool.log_queue)
+            continue
+        stop = threading.Event()
+
+        def drain_queues():
+            while not stop.wait(0.2):
+                drain(pool.log_queue)
+                drain(pool.clients_queue)
+                drain(pool.conversations_queue)
+
+        threading.Thread(target=drain_queues, daemon=True).start()
+        senders = []
+        try:
+            senders = start_blasters(port, args, args.window)
+            time.sleep(1.0)
+            total = args.senders * args.count
+            release_blasters(senders)
+            start = time.perf_counter()
+            for proc in senders:
+                proc.wait()
+            elapsed = time.perf_counter() - start
+            time.sleep(STATS_INTERVAL * 2)  # last stats snapshots
+            processed = pool.get_server_stats()['received_count']
+            spread = [stats['clients'] for stats in pool.get_worker_stats().values()]
+            print(f"{workers:>7} {processed:>10,} {elapsed:>8.2f} {total / elapsed:>10,.0f}  {spread}")
+        finally:
+            for proc in senders:
+                proc.wait()
+            stop.set()
+            pool.stop()
+            drain(pool.log_queue)
+
+
+def bench_crypto_pipeline(args):
+    """
+    AES-GCM pipeline: --size datagrams opened and sealed per batch inline
+    (0 threads) vs by N crypto threads, then a saturated encrypted server for each N
+    """
+    from chatserver import ChatServer
+    from crypto_pipeline import CryptoPipeline
+    from udp_crypto import UDPCrypto
+
+    crypto = UDPCrypto()
+    text = os.urandom(args.size)
+    sealed = [datagram.pack(DGRAM_MSG, seq, 0.0, text, crypto) for seq in range(args.messages)]
+    opens = [[(data,) for data in sealed[i:i + args.batch]] for i in range(0, args.messages, args.batch)]
+    seals = [[(seq,) for seq in range(i, min(i + args.batch, args.messages))]
+             for i in range(0, args.messages, args.batch)]
+
+    def open_(data):
+        return datagram.unpack(data, crypto)
+
+    def seal(seq):
+        return datagram.pack(DGRAM_MSG, seq, 0.0, text, crypto)
+
+    print(f"{args.messages:,} datagrams of {args.size} B in batches of {args.batch}, {os.cpu_count()} CPUs")
+    print(f"{'threads':>7} {'open/s':>10} {'seal/s':>10} {'open MB/s':>10}")
+    for workers in args.workers:
+        pipeline = CryptoPipeline(workers)
+        rates = []
+        for func, batches in ((open_, opens), (seal, seals)):
+            start = time.perf_counter()
+            for batch in batches:
+                pipeline.map(func, batch)
+            rates.append(args.messages / (time.perf_counter() - start))
+        pipeline.close()
+        print(f"{workers:>7} {rates[0]:>10,.0f} {rates[1]:>10,.0f} {rates[0] * args.size / 1e6:>10.1f}")
+
+    print()
+    args.ssl = True
+    print(f"server, {args.senders} senders x {args.count:,} datagrams of {args.size} B, window {args.window}, encrypted")
+    print(f"{'threads':>7} {'processed':>10} {'seconds':>8} {'packets/s':>10}")
+    port = args.port
+    for workers in args.workers:
+        port += 1
+        server = ChatServer('127.0.0.1', port, 'UDP', use_ssl=True)
+        server.packet_loss_rate = 0.0
+        server.crypto_workers = workers
+        count, elapsed = saturate_server(server, port, args)
+        if count is None:
+            print(f"{workers} threads: server failed to start")
+            continue
+        print(f"{workers:>7} {count:>10,} {elapsed:>8.2f} {count / elapsed:>10,.0f}")
+
+
+def bench_free_threading(args):
+    """
+    Thread-per-client TCP server run by each interpreter of --pythons (e.g. a
+    free-threaded python3.13t next to the default build): /rooms requests/s
+    answered for N concurrent clients, driven by separate load processes
+    """
+    probe = "import sys; print(sys.version.split()[0], getattr(sys, '_is_gil_enabled', lambda: True)())"
+    print(f"{os.cpu_count()} CPUs, {args.seconds}s per run, TLS={args.ssl}, up to {args.load_procs} load processes")
+    print(f"{'python':<24} {'GIL':>4} {'clients':>7} {'requests/s':>11} {'p50 ms':>7} {'p99 ms':>7}")
+    port = args.port
+    for python in args.pythons:
+        try:
+            version, gil = subprocess.run([python, '-c', probe], capture_output=True, text=True,
+                                          check=True).stdout.split()
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"{python}: cannot run it ({e})")
+            continue
+        label = f"{os.path.basename(python)} {version}"
+        for clients in args.clients:
+            port += 1
+            server = start_server('TCP', port, args.ssl, 'threaded', python=python)
+            if server is None:
+                print(f"{label}: server failed to start (are the RC dependencies installed for it?)")
+                break
+            loads = []
+            try:
+                procs = min(args.load_procs, clients)
+                for i in range(procs):
+                    share = clients // procs + (i < clients % procs)
+                    proc = subprocess.Popen(
+                        [sys.executable, __file__, '_tcp_load', '--port', str(port), '--clients', str(share),
+                         '--prefix', f"load{i}c", '--seconds', str(args.seconds)] + (['--ssl'] if args.ssl else []),
+                        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+                    loads.append(proc)
+                    proc.stdout.readline()
+                for proc in loads:
+                    proc.stdin.write('go\n')
+                    proc.stdin.flush()
+                results = [proc.stdout.readline().split() for proc in loads]
+            finally:
+                for proc in loads:
+                    proc.wait()
+                stop_server(server)
+            if not all(len(result) == 3 for result in results):
+                print(f"{label}: {clients} clients: a load process failed")
+                continue
+            answered = sum(int(result[0]) for result in results)
+            # Worst load process: percentiles are not merged across processes
+            p50 = max(float(result[1]) for result in results)
+            p99 = max(float(result[2]) for result in results)
+            print(f"{label:<24} {'on' if gil == 'True' else 'off':>4} {clients:>7} {answered / args.seconds:>11,.0f} "
+                  f"{p50:>7.2f} {p99:>7.2f}")
+
+
+def bench_udp_replay(args):
+    """
+    Receive-side duplicate detection soak: ever-growing set vs ReplayWindow bitmap.
+    Feeds millions of seqs with reordering and retransmitted duplicates (as a
+    64-message send window would produce) and samples this process' RSS.
+    """
+    import random
+    from udp_reliability import ReplayWindow
+
+    def seqs(seed):
+        rng = random.Random(seed)
+        recent = collections.deque(maxlen=64)
+        held = None
+        for seq in range(args.messages):
+            if held is None and rng.random() < args.reorder:
+                held = seq  # delivered after the next one
+                continue
+            yield seq
+            recent.append(seq)
+            if held is not None:
+                yield held
+                recent.append(held)
+                held = None
+            if rng.random() < args.duplicates:
+                yield rng.choice(recent)
+
+    def run_set():
+        seen = set()
+        def accept(seq):
+            if seq in seen:
+                return False
+            seen.add(seq)
+            return True
+        return accept, seen
+
+    def run_window():
+        window = ReplayWindow(args.window)
+        return window.accept, window
+
+    print(f"{args.messages:,} messages, {args.reorder * 100:.0f}% reordered, {args.duplicates * 100:.0f}% duplicated")
+    print(f"{'structure':<14} {'checks':>10} {'+RSS MB':>8} {'dups':>8} {'checks/s':>12}")
+    checkpoint = max(args.messages // 5, 1)
+    for name, make in (('ReplayWindow', run_window), ('set', run_set)):
+        base_rss = proc_status(os.getpid())[0]
+        accept, state = make()
+        dups = 0
+        checks = 0
+        start = time.perf_counter()
+        for seq in seqs(1):
+            checks += 1
+            if not accept(seq):
+                dups += 1
+            if checks % checkpoint == 0:
+                rss = proc_status(os.getpid())[0]
+                print(f"{name:<14} {checks:>10,} {(rss - base_rss) / 1024:>8.1f} {dups:>8,} "
+                      f"{checks / (time.perf_counter() - start):>12,.0f}")
+        del accept, state
+
+
+def bench_fanout(args):
+    """Room fan-out: messages/s delivered to N members, TCP and UDP (server in a child process)"""
+    import selectors
+    from udp_crypto import UDPCrypto
+
+    raise_fd_limit()
+    print(f"{args.members} members, {args.messages} messages of {args.size} B to one room")
+    print(f"{'proto':<6} {'encrypted':<10} {'deliveries':>10} {'seconds':>8} {'deliveries/s':>13}")
+    text = 'x' * args.size
+    port = args.port
+    for proto in args.protos:
+        port += 1
+        proc = start_server(proto, port, args.ssl, args.mode)
+        if proc is None:
+            print(f"{proto}: server failed to start")
+            continue
+        selector = selectors.DefaultSelector()
+        members = []
+        try:
+            crypto = UDPCrypto() if args.ssl and proto == 'UDP' else None
+            for i in range(args.members + 1):
+                if proto == 'UDP':
+                    member = UDPMember(port, f"m{i}", crypto)
+                else:
+                    member = TCPMember(port, f"m{i}", args.ssl)
+                members.append(member)
+                selector.register(member.sock, selectors.EVENT_READ, member)
+                member.send_text('/join bench')
+
+            def pump(timeout):
+                count = 0
+                for key, mask in selector.select(timeout):
+                    for payload in key.data.read():
+                        if payload.startswith(b'[#bench] m0: '):
+                            count += 1
+                return count
+
+            # Setup: let the join notices drain (quiet for one second)
+            quiet_since = time.perf_counter()
+            while time.perf_counter() - quiet_since < 1.0:
+                if selector.select(0.1):
+                    pump(0)
+                    quiet_since = time.perf_counter()
+
+            expected = args.messages * args.members
+            delivered = 0
+            start = time.perf_counter()
+            for _ in range(args.messages):
+                members[0].send_text(f"#bench {text}")
+                delivered += pump(0)
+            while delivered < expected and time.perf_counter() - start < args.timeout:
+                delivered += pump(0.5)
+            elapsed = time.perf_counter() - start
+            print(f"{proto:<6} {str(args.ssl):<10} {delivered:>10} {elapsed:>8.2f} {delivered / elapsed:>13,.0f}")
+        finally:
+            for member in members:
+                member.sock.close()
+            selector.close()
+            stop_server(proc)
+
+
+def bench_tcp_slow(args):
+    """
+    One stalled member (never reads, tiny receive buffer) in a room with a fast one:
+    does the fast member still get every message, and what happens to the slow one?
+    """
+    from chatserver import ChatServer
+
+    text = 'x' * args.size
+    print(f"{args.messages} messages of {args.size} B to a room with one fast and one stalled member")
+    print(f"{'mode':<10} {'policy':<12} {'fast got':>9} {'seconds':>8} {'msg/s':>9} {'slow member':<13} {'queued':>7} {'dropped':>8}")
+    port = args.port
+    for mode in args.modes:
+        for policy in args.policies:
+            port += 1
+            server = ChatServer('127.0.0.1', port, 'TCP', use_ssl=args.ssl, tcp_mode=mode, outbound_policy=policy)
+            server.outbound_block_timeout = args.block_timeout
+            if not server.start():
+                print(f"{mode}: server failed to start")
+                continue
+            members = []
+            try:
+                sender = TCPMember(port, 'sender', args.ssl)
+                fast = TCPMember(port, 'fast', args.ssl)
+                slow = TCPMember(port, 'slow', args.ssl, rcvbuf=4096)
+                members = [sender, fast, slow]
+                for member in members:
+                    member.send_text('/join slow')
+                time.sleep(0.5)
+                fast.read()
+
+                received = 0
+                start = time.perf_counter()
+                for _ in range(args.messages):
+                    sender.send_text(f"#slow {text}")
+                    received += sum(1 for p in fast.read() if p.startswith(b'[#slow] sender: '))
+                while received < args.messages and time.perf_counter() - start < args.timeout:
+                    select.select([fast.sock], [], [], 0.5)
+                    received += sum(1 for p in fast.read() if p.startswith(b'[#slow] sender: '))
+                elapsed = time.perf_counter() - start
+
+                stats = server.get_client_stats('slow')
+                state = 'connected' if stats else 'disconnected'
+                queued = stats['queued_messages'] if stats else '-'
+                dropped = stats['outbound_dropped'] if stats else '-'
+                print(f"{mode:<10} {policy:<12} {received:>9} {elapsed:>8.2f} {received / elapsed:>9,.0f} "
+                      f"{state:<13} {queued:>7} {dropped:>8}")
+            finally:
+                for member in members:
+                    member.sock.close()
+                server.stop()
+                drain(server.log_queue)
+
+
+def bench_latency(args):
+    """Recording cost: old list + samples[-100:] trim vs LatencyStats (ring + log histogram)"""
+    import random
+    import tracemalloc
+    from latency import LatencyStats
+
+    rng = random.Random(1)
+    samples = [rng.lognormvariate(1, 1) for _ in range(args.samples)]
+
+    class TrimmedList:
+        """The old per-site pattern: append, then keep the last `keep` samples"""
+
+        def __init__(self, keep):
+            self.keep = keep
+            self.stats = {'latency_samples': []}
+
+        def record(self, latency):
+            self.stats['latency_samples'].append(latency)
+            if len(self.stats['latency_samples']) > self.keep:
+                self.stats['latency_samples'] = self.stats['latency_samples'][-self.keep:]
+
+        def report(self):
+            values = self.stats['latency_samples']
+            return sum(values) / len(values), min(values), max(values)
+
+    class Histogram(LatencyStats):
+        def report(self):
+            return self.window_summary(), self.lifetime_summary()
+
+    print(f"{args.samples:,} samples")
+    print(f"{'implementation':<20} {'ns/record':>10} {'alloc KB':>9} {'us/report':>10}  report")
+    for name, stats, what in (('list + [-100:]', TrimmedList(100), 'avg/min/max of last 100'),
+                              ('list + [-1024:]', TrimmedList(1024), 'avg/min/max of last 1024'),
+                              ('LatencyStats', Histogram(1024), 'p50..p999 of last 1024 + lifetime')):
+        start = time.perf_counter()
+        for latency in samples:
+            stats.record(latency)
+        per_record = (time.perf_counter() - start) / args.samples * 1e9
+
+        # Peak allocation while recording 10k more samples into the warm structure
+        warm = samples[:10000]
+        tracemalloc.start()
+        for latency in warm:
+            stats.record(latency)
+        allocated = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        for _ in range(100):
+            stats.report()
+        per_report = (time.perf_counter() - start) / 100 * 1e6
+        print(f"{name:<20} {per_record:>10.0f} {allocated:>9.1f} {per_report:>10.1f}  {what}")
+
+    lifetime = stats.lifetime_summary()
+    exact = sorted(samples + warm)
+    print(f"{'percentile':<10} {'exact':>9} {'histogram':>10}")
+    for key, p in (('p50', 50), ('p95', 95), ('p99', 99), ('p999', 99.9)):
+        print(f"{key:<10} {exact[max(1, math.ceil(p / 100 * len(exact))) - 1]:>9.3f} {lifetime[key]:>10.3f}")
+
+
+def bench_stats_contention(args):
+    """Stats updates from N threads: every update under the server lock (old) vs per-client stats"""
+    import threading
+    from chatserver import ChatServer
+    from latency import LatencyStats
+
+    class GlobalLockStats:
+        """The old layout: dict of counters per client, every update under ChatServer.lock"""
+
+        def __init__(self, server):
+            self.server = server
+            self.stats = {}
+
+        def add_client(self, nickname):
+            with self.server.lock:
+                self.stats[nickname] = {'received_count': 0, 'encrypted_messages': 0, 'latency': LatencyStats()}
+
+        def update(self, nickname, latency):
+            with self.server.lock:
+                if nickname in self.stats:
+                    self.stats[nickname]['received_count'] += 1
+                    self.stats[nickname]['encrypted_messages'] += 1
+                    self.stats[nickname]['latency'].record(latency)
+
+        def totals(self):
+            with self.server.lock:
+                return sum(stats['received_count'] for stats in self.stats.values())
+
+    class PerClientStats:
+        """ChatServer.count(): only the client's own stats lock"""
+
+        def __init__(self, server):
+            self.server = server
+
+        def add_client(self, nickname):
+            with self.server.lock:
+                self.server.init_client_stats(nickname)
+
+        def update(self, nickname, latency):
+            self.server.count(nickname, 'received_count', 'encrypted_messages', latency=latency)
+
+        def totals(self):
+            return self.server.get_server_stats()['received_count']
+
+    print(f"{args.clients} clients per thread, {args.seconds}s per run; a membership thread joins/leaves rooms"
+          f" under ChatServer.lock and a reader sums the counters every 10 ms")
+    print(f"{'threads':>7} {'stats':<12} {'updates/s':>11} {'lock wait p50 us':>17} {'p99 us':>8} {'reads':>6}")
+    for threads in [int(n) for n in args.threads.split(',')]:
+        for name, impl in (('global lock', GlobalLockStats), ('per-client', PerClientStats)):
+            server = ChatServer(protocol='TCP', use_ssl=False)
+            stats = impl(server)
+            nicknames = [[f"t{t}c{c}" for c in range(args.clients)] for t in range(threads)]
+            for group in nicknames:
+                for nickname in group:
+                    stats.add_client(nickname)
+
+            stop = threading.Event()
+            counts = [0] * threads
+            waits = []
+            reads = [0]
+
+            def worker(t):
+                group = nicknames[t]
+                n = 0
+                while not stop.is_set():
+                    for nickname in group:
+                        stats.update(nickname, 0.5)
+                    n += len(group)
+                counts[t] = n
+
+            def membership():
+                i = 0
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    with server.lock:
+                        waits.append(time.perf_counter() - start)
+                        members = server.rooms.setdefault('bench', set())
+                        members.symmetric_difference_update((f"m{i % 64}",))
+                    i += 1
+                    time.sleep(0.0005)
+
+            def reader():
+                while not stop.is_set():
+                    stats.totals()
+                    reads[0] += 1
+                    time.sleep(0.01)
+
+            pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+            pool += [threading.Thread(target=membership), threading.Thread(target=reader)]
+            for thread in pool:
+                thread.start()
+            time.sleep(args.seconds)
+            stop.set()
+            for thread in pool:
+                thread.join()
+
+            waits.sort()
+            p50 = waits[len(waits) // 2] * 1e6 if waits else 0.0
+            p99 = waits[int(len(waits) * 0.99)] * 1e6 if waits else 0.0
+            print(f"{threads:>7} {name:<12} {sum(counts) / args.seconds:>11,.0f} {p50:>17.1f} {p99:>8.1f} {reads[0]:>6}")
+
+
+def bench_startup(args):
+    """Process startup: server/client modules with Streamlit imported (before) vs headless (chathub)"""
+    import statistics
+
+    probe = ("import resource, sys, time; t = time.perf_counter(); {}; "
+             "print(time.perf_counter() - t, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, 'streamlit' in sys.modules)")
+    print(f"median of {args.runs} fresh interpreters")
+    print(f"{'import':<28} {'ms':>8} {'max RSS MB':>11} {'streamlit':>10}")
+    for name, imports in (('streamlit + chatserver', 'import streamlit, chatserver'),
+                          ('chatserver (headless)', 'import chatserver'),
+                          ('streamlit + chatclient', 'import streamlit, chatclient'),
+                          ('chatclient (headless)', 'import chatclient')):
+        times, rss, loaded = [], [], None
+        for _ in range(args.runs + 1):  # First run only warms the page cache
+            out = subprocess.run([sys.executable, '-c', probe.format(imports)],
+                                 capture_output=True, text=True, check=True).stdout.split()
+            times.append(float(out[0]) * 1000)
+            rss.append(int(out[1]) / 1024)
+            loaded = out[2]
+        print(f"{name:<28} {statistics.median(times[1:]):>8.1f} {statistics.median(rss[1:]):>11.1f} {loaded:>10}")
+
+    # Time until a `chathub serve` process is listening, and its RSS once ready
+    print(f"{'serve --proto udp':<28} {'ready ms':>8} {'RSS MB':>11}")
+    launcher = "import sys{}; import chathub; sys.exit(chathub.main(sys.argv[1:]))"
+    for name, extra in (('with streamlit imported', ', streamlit'), ('headless', '')):
+        ready, rss = [], []
+        for i in range(args.runs + 1):
+            start = time.perf_counter()
+            proc = subprocess.Popen([sys.executable, '-c', launcher.format(extra), 'serve', '--proto', 'udp',
+                                     '--host', '127.0.0.1', '--port', str(args.port + i)],
+                                    stdout=subprocess.PIPE, text=True)
+            for line in proc.stdout:
+                if 'Server started' in line:
+                    break
+            ready.append((time.perf_counter() - start) * 1000)
+            rss.append(proc_status(proc.pid)[0] / 1024)
+            proc.terminate()
+            proc.wait(timeout=10)
+        print(f"{name:<28} {statistics.median(ready[1:]):>8.1f} {statistics.median(rss[1:]):>11.1f}")
+
+
+def bench_conversations(args):
+    """Conversation history memory: unbounded lists (old) vs ConversationStore tail + spill segment"""
+    import tracemalloc
+    from datetime import datetime
+    from conversations import ConversationStore
+
+    class ListStore:
+        """The old layout: one ever-growing list per client"""
+
+        def __init__(self):
+            self.conversations = {}
+
+        def append(self, nickname, message):
+            self.conversations.setdefault(nickname, []).append(message)
+
+        def close(self):
+            pass
+
+    def fill(store):
+        for i in range(args.messages):
+            for c in range(args.clients):
+                store.append(f"c{c}", {'time': datetime.now().strftime("%H:%M"),
+                                       'text': f"message number {i} " + 'x' * 40, 'is_server': i % 2 == 0})
+
+    total = args.clients * args.messages
+    print(f"{args.clients} clients x {args.messages:,} messages ({total:,} total)")
+    print(f"{'store':<24} {'appends/s':>10} {'memory MB':>10} {'page read ms':>13}")
+    for name, make in (('dict of lists', ListStore),
+                       ('ConversationStore(200)', lambda: ConversationStore(tail=200)),
+                       ('ConversationStore(1000)', lambda: ConversationStore(tail=1000))):
+        store = make()
+        start = time.perf_counter()
+        fill(store)
+        elapsed = time.perf_counter() - start
+
+        per_page = '-'
+        if isinstance(store, ConversationStore):
+            pages = store.spilled('c0') // 50
+            step = max(1, pages // 20)
+            start = time.perf_counter()
+            for page in range(0, pages, step):
+                assert len(store.page('c0', page, 50)) == 50
+            per_page = f"{(time.perf_counter() - start) / len(range(0, pages, step)) * 1000:.2f}"
+        store.close()
+
+        # Second fill only to measure retained memory (tracemalloc slows appends down)
+        tracemalloc.start()
+        store = make()
+        fill(store)
+        memory = tracemalloc.get_traced_memory()[0] / 1e6
+        tracemalloc.stop()
+        store.close()
+        print(f"{name:<24} {total / elapsed:>10,.0f} {memory:>10.1f} {per_page:>13}")
+
+
+def bench_message_log(args):
+    """Durable message log: append rate, indexed last-N / since-T replay vs full scan, reopen time"""
+    import random
+    import shutil
+    import tempfile
+    from message_log import RECORD, MessageLog
+
+    directory = tempfile.mkdtemp(prefix='chathub-bench-log-')
+    try:
+        rng = random.Random(1)
+        keys = [f"user{i}" for i in range(args.keys)]
+        log = MessageLog(directory, segment_bytes=args.segment_mb * 1024 * 1024)
+        start = time.perf_counter()
+        t0 = time.time()
+        for i in range(args.messages):
+            log.append(rng.choice(keys), f"message {i} " + 'x' * 60, i % 4 == 0, timestamp=t0 + i / 1000)
+        elapsed = time.perf_counter() - start
+        print(f"{args.messages:,} messages, {args.keys} keys, {len(log.segments)} segments "
+              f"({sum(seg.size for seg in log.segments) / 1e6:.1f} MB)")
+        print(f"append: {args.messages / elapsed:,.0f} msg/s")
+
+        probes = [rng.choice(keys) for _ in range(args.queries)]
+        middle = t0 + args.messages / 2000
+
+        def timed(func):
+            start = time.perf_counter()
+            for key in probes:
+                func(key)
+            return (time.perf_counter() - start) / len(probes) * 1000
+
+        def full_scan_last(key):
+            # Without the index: read every segment and filter
+            records = []
+            for seg in log.segments:
+                with open(seg.path, 'rb') as f:
+                    data = f.read()
+                pos = 0
+                while pos < len(data):
+                    length, seq, timestamp, is_server, key_length, prev = RECORD.unpack_from(data, pos)
+                    text = pos + RECORD.size + key_length
+                    if data[pos + RECORD.size:text].decode('utf-8') == key:
+                        records.append(data[text:pos + RECORD.size + length].decode('utf-8'))
+                    pos += RECORD.size + length
+            return records[-50:]
+
+        print(f"{'query':<32} {'ms/query':>9}")
+        print(f"{'last 50 (indexed, mmap)':<32} {timed(lambda key: log.last(key, 50)):>9.2f}")
+        print(f"{'since T, 50 (indexed, mmap)':<32} {timed(lambda key: log.since(middle, key, limit=50)):>9.2f}")
+        print(f"{'last 50 (full scan)':<32} {timed(full_scan_last) if args.queries <= 20 else float('nan'):>9.2f}")
+        log.close()
+
+        start = time.perf_counter()
+        reopened = MessageLog(directory, segment_bytes=args.segment_mb * 1024 * 1024)
+        print(f"reopen (rebuild indexes): {(time.perf_counter() - start) * 1000:.0f} ms for {len(reopened):,} messages")
+        reopened.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def bench_mailbox(args):
+    """Store-and-forward: mailbox memory per queued message, flush throughput when the nickname reconnects"""
+    import threading
+    import tracemalloc
+    from chatserver import ChatServer
+    from mailboxes import Mailboxes
+    from udp_crypto import UDPCrypto
+
+    payload = b'[SERVER]: ' + b'x' * args.size
+    tracemalloc.start()
+    boxes = Mailboxes(max_messages=args.messages, max_bytes=args.messages * len(payload))
+    for i in range(args.messages):
+        for c in range(args.clients):
+            boxes.put(f"c{c}", bytes(bytearray(payload)))  # one object per message, like real traffic
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    queued = args.clients * args.messages
+    print(f"{args.clients} mailboxes x {args.messages:,} messages of {len(payload)} B: "
+          f"{memory / 1e6:.1f} MB ({memory / queued:.0f} B/message, {memory / queued - len(payload):.0f} B overhead)")
+    boxes.clear()
+
+    print(f"{'proto':<6} {'encrypted':<10} {'messages':>9} {'seconds':>8} {'messages/s':>11} {'MB/s':>7}")
+    port = args.port
+    for proto in args.protos:
+        port += 1
+        server = ChatServer('127.0.0.1', port, proto, use_ssl=args.ssl)
+        server.packet_loss_rate = 0.0
+        server.mailboxes = Mailboxes(max_messages=args.flush, max_bytes=args.flush * len(payload))
+        if not server.start():
+            print(f"{proto}: server failed to start")
+            continue
+        stop = threading.Event()
+
+        def drain_queues():
+            while not stop.wait(0.2):
+                drain(server.log_queue)
+                drain(server.clients_queue)
+                drain(server.conversations_queue)
+
+        threading.Thread(target=drain_queues, daemon=True).start()
+        sock = None
+        try:
+            for _ in range(args.flush):
+                server.mailboxes.put('late', payload)
+            received = 0
+            if proto == 'UDP':
+                start = time.perf_counter()
+                member = UDPMember(port, 'late', UDPCrypto() if args.ssl else None)
+                sock = member.sock
+                while received < args.flush and time.perf_counter() - start < args.timeout:
+                    select.select([sock], [], [], 0.5)
+                    received += sum(1 for text in member.read() if text.startswith(b'[offline'))
+            else:
+                sock = socket.create_connection(('127.0.0.1', port), timeout=args.timeout)
+                if args.ssl:
+                    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+                    ctx.check_hostname = False
+                    ctx.verify_mode = ssl.CERT_NONE
+                    sock = ctx.wrap_socket(sock, server_hostname='127.0.0.1')
+                reader = FrameReader()
+                reader.read_frame(sock)  # NICK request
+                start = time.perf_counter()
+                sock.sendall(encode_frame(FRAME_NICK, b'late'))
+                while received < args.flush and time.perf_counter() - start < args.timeout:
+                    if not reader.recv_from(sock, 65536):
+                        break
+                    received += sum(1 for _, _, text in reader.frames() if bytes(text[:8]) == b'[offline')
+            elapsed = time.perf_counter() - start
+            print(f"{proto:<6} {str(args.ssl):<10} {received:>9,} {elapsed:>8.2f} {received / elapsed:>11,.0f} "
+                  f"{received * len(payload) / elapsed / 1e6:>7.1f}")
+        finally:
+            if sock is not None:
+                sock.close()
+            stop.set()
+            server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChatHub benchmarks")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    p = sub.add_parser('tcp-idle', help="memory held by idle TCP connections, threaded vs event loop")
+    p.add_argument('--connections', type=int, default=10000)
+    p.add_argument('--modes', nargs='+', default=['threaded', 'eventloop'])
+    p.add_argument('--port', type=int, default=5600)
+    p.add_argument('--ssl', action='store_true')
+    p.set_defaults(func=bench_tcp_idle)
+
+    p = sub.add_parser('framing', help="TCP stream parsing: legacy text vs length-prefixed frames")
+    p.add_argument('--messages', type=int, default=200000)
+    p.add_argument('--size', type=int, default=64)
+    p.add_argument('--chunk', type=int, default=2048)
+    p.set_defaults(func=bench_framing)
+
+    p = sub.add_parser('udp-format', help="UDP datagram size and codec rate: legacy text+base64 vs binary")
+    p.add_argument('--messages', type=int, default=100000)
+    p.add_argument('--size', type=int, default=64)
+    p.set_defaults(func=bench_udp_format)
+
+    p = sub.add_parser('udp-keys', help="UDPCrypto construction: cold vs cached key derivation")
+    p.add_argument('--instances', type=int, default=500)
+    p.set_defaults(func=bench_udp_keys)
+
+    p = sub.add_parser('udp-handshake', help="UDP session keys: X25519 handshake cost and seal/open rate vs the static key")
+    p.add_argument('--sessions', type=int, default=1000)
+    p.add_argument('--messages', type=int, default=100000)
+    p.add_argument('--size', type=int, default=64)
+    p.add_argument('--rekey', type=int, default=10000)
+    p.set_defaults(func=bench_udp_handshake)
+
+    p = sub.add_parser('udp-seal', help="UDP encryption hot path: msg/s and bytes allocated per message for each API")
+    p.add_argument('--messages', type=int, default=100000)
+    p.add_argument('--size', type=int, default=256)
+    p.set_defaults(func=bench_udp_seal)
+
+    p = sub.add_parser('udp-window', help="UDP throughput with sliding window and cumulative/SACK ACKs under loss")
+    p.add_argument('--messages', type=int, default=1000)
+    p.add_argument('--size', type=int, default=64)
+    p.add_argument('--windows', type=int, nargs='+', default=[1, 64])
+    p.add_argument('--loss', type=float, nargs='+', default=[0.0, 0.1, 0.3])
+    p.add_argument('--max-retries', type=int, default=30)
+    p.add_argument('--timeout', type=float, default=60.0)
+    p.add_argument('--port', type=int, default=5700)
+    p.set_defaults(func=bench_udp_window)
+
+    p = sub.add_parser('udp-replay', help="duplicate detection soak: growing set vs bounded replay window")
+    p.add_argument('--messages', type=int, default=5000000)
+    p.add_argument('--window', type=int, default=1024)
+    p.add_argument('--reorder', type=float, default=0.05)
+    p.add_argument('--duplicates', type=float, default=0.02)
+    p.set_defaults(func=bench_udp_replay)
+
+    p = sub.add_parser('fanout', help="room broadcast: deliveries/s to N members over TCP and UDP")
+    p.add_argument('--members', type=int, default=1000)
+    p.add_argument('--messages', type=int, default=50)
+    p.add_argument('--size', type=int, default=64)
+    p.add_argument('--protos', nargs='+', default=['TCP', 'UDP'])
+    p.add_argument('--mode', default='eventloop', help="TCP engine of the server")
+    p.add_argument('--ssl', action='store_true', help="TLS for TCP, AES-GCM for UDP")
+    p.add_argument('--timeout', type=float, default=60.0)
+    p.add_argument('--port', type=int, default=5800)
+    p.set_defaults(func=bench_fanout)
+
+    p = sub.add_parser('tcp-slow', help="outbound queue policies with a stalled TCP client")
+    p.add_argument('--messages', type=int, default=20000)
+    p.add_argument('--size', type=int, default=512)
+    p.add_argument('--modes', nargs='+', default=['threaded', 'eventloop'])
+    p.add_argument('--policies', nargs='+', default=['drop_oldest', 'disconnect', 'block'])
+    p.add_argument('--block-timeout', type=float, default=2.0)
+    p.add_argument('--ssl', action='store_true')
+    p.add_argument('--timeout', type=float, default=60.0)
+    p.add_argument('--port', type=int, default=5900)
+    p.set_defaults(func=bench_tcp_slow)
+
+    p = sub.add_parser('latency', help="latency recording: trimmed lists vs ring + log-bucketed histogram")
+    p.add_argument('--samples', type=int, default=1000000)
+    p.set_defaults(func=bench_latency)
+
+    p = sub.add_parser('stats-contention', help="per-client stats updates from N threads: global lock vs per-client shards")
+    p.add_argument('--threads', default='1,2,4,8', help="comma-separated thread counts")
+    p.add_argument('--clients', type=int, default=64, help="clients updated by each thread")
+    p.add_argument('--seconds', type=float, default=2.0)
+    p.set_defaults(func=bench_stats_contention)
+
+    p = sub.add_parser('startup', help="process startup time and memory: with Streamlit vs headless")
+    p.add_argument('--runs', type=int, default=5)
+    p.add_argument('--port', type=int, default=5900)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser('conversations', help="conversation history memory: unbounded lists vs bounded tail + spill segment")
+    p.add_argument('--clients', type=int, default=100)
+    p.add_argument('--messages', type=int, default=5000, help="messages per client")
+    p.set_defaults(func=bench_conversations)
+
+    p = sub.add_parser('message-log', help="durable message log: append rate, indexed history replay, reopen time")
+    p.add_argument('--messages', type=int, default=500000)
+    p.add_argument('--keys', type=int, default=1000)
+    p.add_argument('--segment-mb', type=int, default=16)
+    p.add_argument('--queries', type=int, default=20)
+    p.set_defaults(func=bench_message_log)
+
+    p = sub.add_parser('mailbox', help="offline mailboxes: memory per queued message and flush throughput on reconnect")
+    p.add_argument('--clients', type=int, default=1000, help="mailboxes for the memory measurement")
+    p.add_argument('--messages', type=int, default=100, help="messages per mailbox for the memory measurement")
+    p.add_argument('--size', type=int, default=100)
+    p.add_argument('--flush', type=int, default=20000, help="messages waiting for the reconnecting client")
+    p.add_argument('--protos', nargs='+', default=['TCP', 'UDP'])
+    p.add_argument('--ssl', action='store_true')
+    p.add_argument('--port', type=int, default=6000)
+    p.add_argument('--timeout', type=float, default=60.0)
+    p.set_defaults(func=bench_mailbox)
+
+    p = sub.add_parser('udp-rx', help="UDP receive path: datagrams/s processed by the server under a flood, per batch size")
+    p.add_argument('--senders', type=int, default=2)
+    p.add_argument('--count', type=int, default=100000)
+    p.add_argument('--size', type=int, default=64)
+    p.add_argument('--window', type=int, default=256)
+    p.add_argument('--batches', type=int, nargs='+', default=[1, 64])
+    p.add_argument('--ssl', action='store_true')
+    p.add_argument('--port', type=int, default=5900)
+    p.set_defaults(func=bench_udp_rx)
+
+    p = sub.add_parser('udp-workers', help="UDP server scaling across SO_REUSEPORT worker processes")
+    p.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    p.add_argument('--senders', type=int, default=8)
+    p.add_argument('--count', type=int, default=25000)
+    p.add_argument('--size', type=int, default=64)
+    p.add_argument('--window', type=int, default=256)
+    p.add_argument('--ssl', action='store_true')
+    p.add_argument('--port', type=int, default=6000)
+    p.set_defaults(func=bench_udp_workers)
+
+    p = sub.add_parser('crypto-pipeline', help="AES-GCM on N crypto threads vs inline: open/seal rate and server throughput")
+    p.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    p.add_argument('--messages', type=int, default=200000)
+    p.add_argument('--batch', type=int, default=64)
+    p.add_argument('--size', type=int, default=1024)
+    p.add_argument('--senders', type=int, default=4)
+    p.add_argument('--count', type=int, default=25000)
+    p.add_argument('--window', type=int, default=256)
+    p.add_argument('--port', type=int, default=6100)
+    p.set_defaults(func=bench_crypto_pipeline)
+
+    p = sub.add_parser('free-threading', help="thread-per-client TCP server throughput for 1..64 clients, per interpreter (GIL vs no-GIL)")
+    p.add_argument('--pythons', nargs='+', default=[sys.executable],
+                   help="interpreters running the server, e.g. python3.13 python3.13t")
+    p.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64])
+    p.add_argument('--seconds', type=float, default=3.0)
+    p.add_argument('--load-procs', type=int, default=4, help="client processes sharing the connections")
+    p.add_argument('--ssl', action='store_true')
+    p.add_argument('--port', type=int, default=6200)
+    p.set_defaults(func=bench_free_threading)
+
+    p = sub.add_parser('_serve')
+    p.add_argument('--proto', default='TCP')
+    p.add_argument('--mode', default='threaded')
+    p.add_argument('--port', type=int, default=5600)
+    p.add_argument('--ssl', action='store_true')
+    p.set_defaults(func=serve)
+
+    p = sub.add_parser('_tcp_load')
+    p.add_argument('--port', type=int)
+    p.add_argument('--clients', type=int)
+    p.add_argument('--prefix')
+    p.add_argument('--seconds', type=float)
+    p.add_argument('--ssl', action='store_true')
+    p.set_defaults(func=tcp_load)
+
+    p = sub.add_parser('_blast')
+    p.add_argument('--port', type=int)
+    p.add_argument('--nickname')
+    p.add_argument('--count', type=int)
+    p.add_argument('--size', type=int)
+    p.add_argument('--window', type=int)
+    p.add_argument('--ssl', action='store_true')
+    p.set_defaults(func=blast)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,17 @@ import queue
 import time
 import random
 from datetime import datetime
-import streamlit as st
 import ssl
-from udp_crypto import UDPCrypto
+from udp_crypto import UDPCrypto, KeyExchange, PUBLIC_KEY_BYTES, REKEY_MESSAGES, REKEY_BYTES
+from framing import FrameReader, encode_frame, FRAME_NICK, FRAME_MSG
+import datagram
+from datagram import DGRAM_HELLO, DGRAM_MSG, DGRAM_ACK, DGRAM_DISCONNECT, DGRAM_SESSION, DGRAM_RESUME
+from datagram import SESSION_NEW, SESSION_RESUMED, SESSION_UNKNOWN, SESSION_EXPIRED, SESSION_TOKEN_BYTES
+from latency import LatencyStats
+from udp_reliability import RetransmitScheduler, RTTEstimator, SendWindow, AckTracker, ReplayWindow
+
+# Retransmit timer key of the HELLO while the handshake is pending (data timers use msg_ids)
+HELLO_TIMER = 'hello'
 
 class ChatClient:
     def __init__(self, host='127.0.0.1', port=5555, nickname='Guest', PROTO='TCP', use_ssl=True):
@@ -17,7 +25,9 @@ class ChatClient:
         self.use_ssl = use_ssl and (self.PROTO == 'TCP' or self.PROTO == 'UDP')
         self.client = None
         self.connected = False
+        self.last_error = None
         self.message_queue = queue.Queue()
+        self.reader = FrameReader()
 
         # UDP Encryption
         self.udp_crypto = None
@@ -28,10 +38,10 @@ class ChatClient:
                 self.use_ssl = False
 
         # UDP reliability tracking
-        self.message_id_counter = 0
         self.pending_messages = {}
-        self.received_messages = set()
+        self.replay_window = ReplayWindow()
         self.lock = threading.Lock()
+        self.retransmit_scheduler = RetransmitScheduler()
         self.stats = {
             'sent_count': 0,
             'received_count': 0,
@@ -39,16 +49,38 @@ class ChatClient:
             'retransmissions': 0,
             'packet_loss': 0,
             'out_of_order': 0,
-            'total_latency': 0.0,
-            'latency_samples': [],
+            'latency': LatencyStats(),
             'simulated_drops': 0,
+            'acks_sent': 0,
             'encrypted_messages': 0
         }
 
-        # UDP Configuration
-        self.ack_timeout = 2.0
+        # UDP Configuration (ack_timeout is the initial RTO, before the first RTT sample)
+        self.ack_timeout = 1.0
         self.max_retries = 5
         self.packet_loss_rate = 0.50
+        self.rtt_estimator = RTTEstimator(initial_rto=self.ack_timeout)
+        
+        # Sliding window: per-connection seq + backlog, cumulative/SACK ACKs for received messages
+        self.window_size = 64
+        self.ack_every = 16
+        self.send_window = SendWindow(self.window_size)
+        self.ack_tracker = AckTracker()
+        self.acks_owed = 0
+
+        # Session token sent by the server after HELLO: lets this client move to a new
+        # address (rebind(), NAT rebinding) without a new HELLO (RESUME)
+        self.session_token = None
+        self.resuming = False
+        self.resume_count = 0  # sent as the msg_id of each RESUME: the server refuses old (replayed) ones
+        # Encrypted mode: X25519 handshake in HELLO / SESSION_NEW -> per-session keys
+        # (messages wait in the backlog until the keys exist)
+        self.key_exchange = None
+        self.session_crypto = None
+        self.hello_sent_at = 0.0
+        self.hello_retries = 0
+        self.rekey_messages = REKEY_MESSAGES
+        self.rekey_bytes = REKEY_BYTES
 
         # Create socket
         if self.PROTO == 'TCP':
@@ -97,22 +129,13 @@ class ChatClient:
                 
                 self.connected = True
                 
-                nick_req = self.client.recv(1024).decode('utf-8')
-                if nick_req == 'NICK':
-                    self.client.send(self.nickname.encode('utf-8'))
+                frame = self.reader.read_frame(self.client)
+                if frame and frame[0] == FRAME_NICK:
+                    self.client.sendall(encode_frame(FRAME_NICK, self.nickname.encode('utf-8')))
                 
             else:
-                # UDP connection with encryption
-                nickname_msg = self.nickname
-                
-                # Encrypt nickname if UDP encryption is enabled
-                if self.use_ssl and self.udp_crypto:
-                    try:
-                        nickname_msg = self.udp_crypto.encrypt_message(nickname_msg)
-                    except:
-                        pass
-                
-                self.client.sendto(nickname_msg.encode('utf-8'), (self.host, self.port))
+                # UDP connection with encryption (nickname encrypted if UDP encryption is enabled)
+                self.send_hello()
                 self.connected = True
                 
                 # Add encryption status message
@@ -140,7 +163,7 @@ class ChatClient:
 
             return True
         except Exception as e:
-            st.error(f"❌ Connection failed: {e}")
+            self.last_error = e
             return False
 
     def receive_messages(self):
@@ -148,81 +171,53 @@ class ChatClient:
             try:
                 if self.PROTO == 'TCP':
                     self.client.settimeout(1.0)
-                    data = self.client.recv(2048)
-                    if not data:
-                        continue
-                    msg = data.decode('utf-8').strip()
+                    if self.reader.recv_from(self.client) == 0:
+                        raise ConnectionError("Server closed the connection")
                     
-                    # Log decryption for encrypted messages
-                    if self.use_ssl and msg and not msg.startswith('ACK:'):
-                        pass  # Decryption happens automatically
-                else:
-                    self.client.settimeout(1.0)
-                    data, addr = self.client.recvfrom(2048)
-                    msg = data.decode('utf-8')
-                    
-                    # Try to decrypt if encryption is enabled
-                    if self.use_ssl and self.udp_crypto and msg.startswith('ENC:'):
-                        try:
-                            msg = self.udp_crypto.decrypt_message(msg)
-                        except Exception as e:
-                            continue
-
-                if not msg:
+                    # Decryption happens automatically (SSL); a read may hold several frames
+                    for frame_type, send_time, payload in self.reader.frames():
+                        if frame_type == FRAME_MSG:
+                            self.handle_tcp_message(str(payload, 'utf-8').strip(), send_time)
                     continue
-
-                if msg == 'NICK':
+                
+                # Block only when no ACK is owed; otherwise poll, and flush the
+                # coalesced ACK once the burst of datagrams has been drained
+                sock = self.client
+                try:
+                    sock.settimeout(0.0 if self.acks_owed else 1.0)
+                    data, addr = sock.recvfrom(2048)
+                except (BlockingIOError, socket.timeout):
+                    self.flush_ack()
+                    continue
+                except OSError:
+                    if sock is not self.client:
+                        continue  # rebind() replaced the socket
+                    raise
+                
+                # Parse the binary header; decrypt (and authenticate) the payload if encrypted
+                try:
+                    dgram_type, msg_id, send_time, payload = datagram.unpack(data, self.udp_crypto, self.session_crypto)
+                except Exception as e:
+                    if self.handshake_pending() and datagram.is_session(data) and time.time() - self.hello_sent_at > 1.0:
+                        self.send_hello()  # SESSION_NEW was lost: ask for it again
                     continue
                     
-                elif msg.startswith('ACK:'):
+                if dgram_type == DGRAM_ACK:
                     if self.simulate_packet_loss():
                         with self.lock:
                             self.stats['simulated_drops'] += 1
                         continue
-                    self.handle_ack(msg)
+                    self.handle_ack(msg_id, datagram.unpack_sack(payload))
                     
-                elif msg.startswith('MSG:'):
+                elif dgram_type == DGRAM_MSG:
                     if self.simulate_packet_loss():
                         with self.lock:
                             self.stats['simulated_drops'] += 1
                         continue
-                    self.handle_udp_message(msg, addr if self.PROTO == 'UDP' else None)
-                    
-                else:
-                    receive_time = time.time()
-                    timestamp = datetime.now().strftime("%H:%M")
-                    latency = None
-                    
-                    if '|TS:' in msg:
-                        parts = msg.split('|TS:')
-                        if len(parts) >= 2:
-                            try:
-                                send_time = float(parts[1].split('|')[0])
-                                latency = (receive_time - send_time) * 1000
-                                msg = parts[0]
-                            except:
-                                pass
-                    
-                    with self.lock:
-                        self.stats['received_count'] += 1
-                        if self.use_ssl:
-                            self.stats['encrypted_messages'] += 1
-                        if latency:
-                            self.stats['total_latency'] += latency
-                            self.stats['latency_samples'].append(latency)
-                            if len(self.stats['latency_samples']) > 100:
-                                self.stats['latency_samples'] = self.stats['latency_samples'][-100:]
-                    
-                    is_system = "Connected to" in msg or "disconnected" in msg.lower() or "🔒" in msg or "SSL" in msg or "encryption" in msg.lower()
-                    is_own = msg.startswith(self.nickname + ":")
-                    
-                    self.message_queue.put({
-                        'time': timestamp,
-                        'text': msg,
-                        'own': is_own,
-                        'system': is_system,
-                        'latency': latency
-                    })
+                    self.handle_udp_message(msg_id, send_time, str(payload, 'utf-8'), addr)
+
+                elif dgram_type == DGRAM_SESSION:
+                    self.handle_session(msg_id, bytes(payload))
                     
             except socket.timeout:
                 continue
@@ -238,18 +233,50 @@ class ChatClient:
                     self.disconnect()
                 break
 
-    def handle_ack(self, ack_message):
+    def handle_tcp_message(self, msg, send_time):
+        if not msg:
+            return
+        
+        timestamp = datetime.now().strftime("%H:%M")
+        latency = None
+        if send_time:
+            latency = (time.time() - send_time) * 1000
+        
+        with self.lock:
+            self.stats['received_count'] += 1
+            if self.use_ssl:
+                self.stats['encrypted_messages'] += 1
+            if latency:
+                self.stats['latency'].record(latency)
+        
+        is_system = "Connected to" in msg or "disconnected" in msg.lower() or "🔒" in msg or "SSL" in msg or "encryption" in msg.lower()
+        is_own = msg.startswith(self.nickname + ":")
+        
+        self.message_queue.put({
+            'time': timestamp,
+            'text': msg,
+            'own': is_own,
+            'system': is_system,
+            'latency': latency
+        })
+
+    def handle_ack(self, cumulative, sack_blocks):
         try:
-            msg_id = int(ack_message.split(':')[1])
+            now = time.time()
+            rtt_sample = None
             with self.lock:
-                if msg_id in self.pending_messages:
+                acked = sorted(self.send_window.acknowledge(cumulative, sack_blocks))
+                for msg_id in acked:
+                    self.retransmit_scheduler.cancel(msg_id)
+                    if msg_id not in self.pending_messages:
+                        continue
                     send_time = self.pending_messages[msg_id]['timestamp']
-                    latency = (time.time() - send_time) * 1000
+                    latency = (now - send_time) * 1000
+                    # Karn's rule: an ACK of a retransmitted message is ambiguous
+                    if self.pending_messages[msg_id]['retries'] == 0:
+                        rtt_sample = latency
                     self.stats['ack_count'] += 1
-                    self.stats['total_latency'] += latency
-                    self.stats['latency_samples'].append(latency)
-                    if len(self.stats['latency_samples']) > 100:
-                        self.stats['latency_samples'] = self.stats['latency_samples'][-100:]
+                    self.stats['latency'].record(latency)
                     
                     # Add the message to UI only after ACK is received (for UDP)
                     if self.PROTO == 'UDP' and 'message_text' in self.pending_messages[msg_id]:
@@ -263,47 +290,178 @@ class ChatClient:
                         })
                     
                     del self.pending_messages[msg_id]
+                
+                # One RTT sample per ACK: the newest message it acknowledges
+                if rtt_sample is not None:
+                    self.rtt_estimator.sample(rtt_sample / 1000)
+                
+                # Fast retransmit: seqs below a SACK block are holes; resend them once
+                # (after one RTT) instead of waiting for their RTO, later losses use the RTO
+                fast = []
+                for msg_id in self.send_window.holes(sack_blocks):
+                    entry = self.pending_messages.get(msg_id)
+                    if entry is None or entry['retries'] or now - entry['timestamp'] < self.rtt_estimator.fast_timeout():
+                        continue
+                    entry['timestamp'] = now
+                    entry['retries'] += 1
+                    self.retransmit_scheduler.schedule(msg_id, now + self.rtt_estimator.timeout(entry['retries']))
+                    self.stats['retransmissions'] += 1
+                    fast.append(self.resealed(msg_id, entry))
+            
+            for data in fast:
+                if not self.simulate_packet_loss():
+                    self.client.sendto(data, (self.host, self.port))
+                else:
+                    with self.lock:
+                        self.stats['simulated_drops'] += 1
+            
+            # ACKs opened the window: send what was queued behind it
+            self.drain_send_backlog()
         except:
             pass
 
-    def handle_udp_message(self, message, addr):
+    def send_hello(self, retry=False):
+        """
+        HELLO: nickname, followed by our X25519 public key when encrypted (NUL separated).
+        Encrypted mode: messages wait for SESSION_NEW, so the HELLO is resent with the
+        data RTO backoff (retransmit_pending) until it comes, max_retries times at most.
+        """
+        payload = self.nickname.encode('utf-8')
+        if self.udp_crypto:
+            if self.key_exchange is None:
+                self.key_exchange = KeyExchange()
+            payload += b'\0' + self.key_exchange.public
+        self.hello_sent_at = time.time()
+        if self.udp_crypto:
+            with self.lock:
+                if not retry:
+                    self.hello_retries = 0
+                self.retransmit_scheduler.schedule(
+                    HELLO_TIMER, self.hello_sent_at + self.rtt_estimator.timeout(self.hello_retries))
+        self.client.sendto(datagram.pack(DGRAM_HELLO, payload=payload, crypto=self.udp_crypto), (self.host, self.port))
+
+    def handshake_pending(self):
+        return self.key_exchange is not None and self.session_crypto is None
+
+    def handle_session(self, status, payload):
+        """Session control from the server (see datagram.SESSION_*)"""
+        token = payload[:SESSION_TOKEN_BYTES]
+        server_public = payload[SESSION_TOKEN_BYTES:SESSION_TOKEN_BYTES + PUBLIC_KEY_BYTES]
+        if status == SESSION_NEW and self.handshake_pending() and len(server_public) == PUBLIC_KEY_BYTES:
+            # Derived once per handshake: a repeated SESSION_NEW must not restart the nonce counters
+            self.session_crypto = self.key_exchange.session(server_public, self.udp_crypto.key, initiator=True,
+                                                            rekey_messages=self.rekey_messages,
+                                                            rekey_bytes=self.rekey_bytes)
+            self.session_token = token
+            self.retransmit_scheduler.cancel(HELLO_TIMER)
+            self.drain_send_backlog()
+        elif status in (SESSION_NEW, SESSION_RESUMED):
+            self.session_token = token
+            # Several datagrams may have triggered a RESUME: only the first confirmation counts
+            if status == SESSION_RESUMED and self.resuming:
+                self.resuming = False
+                # The server now knows our new address: resend what is still unacknowledged
+                with self.lock:
+                    now = time.time()
+                    for msg_id in self.pending_messages:
+                        self.retransmit_scheduler.schedule(msg_id, now)
+                self.message_queue.put({
+                    'time': datetime.now().strftime("%H:%M"),
+                    'text': "🔁 Session resumed",
+                    'system': True,
+                    'own': False,
+                    'latency': None
+                })
+        elif status == SESSION_UNKNOWN:
+            # Our address changed under us (NAT rebinding): ask to move the session
+            if self.session_token:
+                self.send_resume()
+        elif status == SESSION_EXPIRED and self.session_token:
+            # The server dropped the session: start a new one, resending what was not acknowledged
+            self.session_token = None
+            self.reset_session()
+            self.send_hello()
+            self.drain_send_backlog()
+
+    def send_resume(self):
+        self.resuming = True
+        self.resume_count += 1
+        resume = datagram.pack(DGRAM_RESUME, self.resume_count, payload=self.session_token, crypto=self.udp_crypto)
+        self.client.sendto(resume, (self.host, self.port))
+
+    def rebind(self):
+        """
+        Continue the session from a new UDP socket (new local port), e.g. after
+        a network change. The server moves the session on RESUME; nothing is lost.
+        """
+        old, self.client = self.client, socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            parts = message.split(':', 3)
-            if len(parts) < 4:
+            old.close()
+        except OSError:
+            pass
+        if self.session_token:
+            self.send_resume()
+
+    def reset_session(self):
+        """Fresh seq spaces for a new session; unacknowledged messages go back to the backlog"""
+        with self.lock:
+            unacked = [self.pending_messages[msg_id]['message_text'] for msg_id in sorted(self.pending_messages)]
+            backlog = list(self.send_window.backlog)
+            self.pending_messages = {}
+            self.retransmit_scheduler.clear()
+            self.send_window = SendWindow(self.window_size)
+            self.send_window.backlog.extend(unacked + backlog)
+            self.ack_tracker = AckTracker()
+            self.replay_window = ReplayWindow()
+            self.acks_owed = 0
+            # New handshake, new keys
+            self.key_exchange = None
+            self.session_crypto = None
+
+    def flush_ack(self):
+        """Send one cumulative ACK (+ SACK blocks) covering everything received so far"""
+        with self.lock:
+            if not self.acks_owed:
                 return
-            msg_id = int(parts[1])
-            send_time = float(parts[2])
-            actual_message = parts[3]
+            self.acks_owed = 0
+            cumulative = self.ack_tracker.next_expected
+            blocks = self.ack_tracker.sack_blocks()
+        
+        ack_data = datagram.pack(DGRAM_ACK, cumulative, payload=datagram.pack_sack(blocks),
+                                 crypto=self.session_crypto or self.udp_crypto)
+        if not self.simulate_packet_loss():
+            self.client.sendto(ack_data, (self.host, self.port))
+            with self.lock:
+                self.stats['acks_sent'] += 1
+        else:
+            with self.lock:
+                self.stats['simulated_drops'] += 1
+
+    def handle_udp_message(self, msg_id, send_time, actual_message, addr):
+        try:
             recv_time = time.time()
             latency = (recv_time - send_time) * 1000
 
-            if self.PROTO == 'UDP' and addr:
-                ack_data = f"ACK:{msg_id}"
-                
-                # Encrypt ACK if encryption enabled
-                if self.use_ssl and self.udp_crypto:
-                    try:
-                        ack_data = self.udp_crypto.encrypt_message(ack_data)
-                    except:
-                        pass
-                
-                if not self.simulate_packet_loss():
-                    self.client.sendto(ack_data.encode('utf-8'), addr)
-                else:
-                    with self.lock:
-                        self.stats['simulated_drops'] += 1
+            with self.lock:
+                is_duplicate = not self.replay_window.accept(msg_id)
+                out_of_order = self.ack_tracker.record(msg_id)
+                self.acks_owed += 1
+                ack_now = is_duplicate or out_of_order or self.acks_owed >= self.ack_every
+            
+            # ACKs are coalesced: sent when the burst is drained, every ack_every
+            # messages, or right away for gaps/duplicates (the sender needs the SACK info)
+            if ack_now:
+                self.flush_ack()
 
             with self.lock:
-                if msg_id in self.received_messages:
+                if is_duplicate:
                     return
-                self.received_messages.add(msg_id)
+                if out_of_order:
+                    self.stats['out_of_order'] += 1
                 self.stats['received_count'] += 1
                 if self.use_ssl and self.udp_crypto:
                     self.stats['encrypted_messages'] += 1
-                self.stats['total_latency'] += latency
-                self.stats['latency_samples'].append(latency)
-                if len(self.stats['latency_samples']) > 100:
-                    self.stats['latency_samples'] = self.stats['latency_samples'][-100:]
+                self.stats['latency'].record(latency)
 
             is_system = "Connected to" in actual_message or "disconnected" in actual_message.lower() or "encryption" in actual_message.lower()
             is_own = actual_message.startswith(self.nickname + ":")
@@ -322,60 +480,47 @@ class ChatClient:
         """Thread de retransmission"""
         while self.connected:
             try:
-                time.sleep(0.1)
-                current_time = time.time()
+                # Sleeps until the next ACK deadline; only expired messages are returned
+                due = self.retransmit_scheduler.wait_due(timeout=1.0)
+                if not due:
+                    continue
                 to_retransmit = []
                 failed_messages = []
 
+                if HELLO_TIMER in due and self.handshake_pending():
+                    if self.hello_retries >= self.max_retries:
+                        with self.lock:
+                            self.stats['packet_loss'] += 1
+                        self.connection_lost(f"⚠️ Connection lost: no answer to HELLO after {self.max_retries} retries!")
+                        break
+                    with self.lock:
+                        self.hello_retries += 1
+                        self.stats['retransmissions'] += 1
+                    self.send_hello(retry=True)
+
                 with self.lock:
-                    for msg_id, data in list(self.pending_messages.items()):
-                        elapsed = current_time - data['timestamp']
-                        if elapsed > self.ack_timeout:
-                            if data['retries'] < self.max_retries:
-                                to_retransmit.append((msg_id, {
-                                    'data': data['data'],
-                                    'timestamp': data['timestamp'],
-                                    'retries': data['retries']
-                                }))
-                            else:
-                                self.stats['packet_loss'] += 1
-                                failed_messages.append(msg_id)
+                    for msg_id in due:
+                        data = self.pending_messages.get(msg_id)
+                        if data is None:
+                            continue
+                        if data['retries'] < self.max_retries:
+                            to_retransmit.append((msg_id, {
+                                'data': self.resealed(msg_id, data),
+                                'timestamp': data['timestamp'],
+                                'retries': data['retries']
+                            }))
+                        else:
+                            self.stats['packet_loss'] += 1
+                            failed_messages.append(msg_id)
 
                 if failed_messages:
                     with self.lock:
                         for msg_id in failed_messages:
                             if msg_id in self.pending_messages:
                                 del self.pending_messages[msg_id]
+                            self.send_window.release(msg_id)
                     
-                    self.message_queue.put({
-                        'time': datetime.now().strftime("%H:%M"),
-                        'text': f"⚠️ Connection lost: {len(failed_messages)} message(s) failed after {self.max_retries} retries!",
-                        'system': True,
-                        'own': False,
-                        'latency': None
-                    })
-                    
-                    self.connected = False
-                    
-                    try:
-                        disconnect_msg = f"DISCONNECT:{self.nickname}"
-                        
-                        # Encrypt disconnect message if encryption enabled
-                        if self.use_ssl and self.udp_crypto:
-                            try:
-                                disconnect_msg = self.udp_crypto.encrypt_message(disconnect_msg)
-                            except:
-                                pass
-                        
-                        self.client.sendto(disconnect_msg.encode('utf-8'), (self.host, self.port))
-                    except:
-                        pass
-                    
-                    try:
-                        self.client.close()
-                    except:
-                        pass
-                    
+                    self.connection_lost(f"⚠️ Connection lost: {len(failed_messages)} message(s) failed after {self.max_retries} retries!")
                     break
 
                 for msg_id, data in to_retransmit:
@@ -391,8 +536,11 @@ class ChatClient:
                         
                         with self.lock:
                             if msg_id in self.pending_messages:
-                                self.pending_messages[msg_id]['timestamp'] = time.time()
+                                now = time.time()
+                                self.pending_messages[msg_id]['timestamp'] = now
                                 self.pending_messages[msg_id]['retries'] += 1
+                                rto = self.rtt_estimator.timeout(self.pending_messages[msg_id]['retries'])
+                                self.retransmit_scheduler.schedule(msg_id, now + rto)
                                 self.stats['retransmissions'] += 1
                     except Exception as e:
                         self.connected = False
@@ -401,6 +549,30 @@ class ChatClient:
             except Exception as e:
                 break
 
+    def connection_lost(self, text):
+        """Give up on the server (max_retries exhausted): tell the UI, send DISCONNECT, close"""
+        self.message_queue.put({
+            'time': datetime.now().strftime("%H:%M"),
+            'text': text,
+            'system': True,
+            'own': False,
+            'latency': None
+        })
+        
+        self.connected = False
+        
+        try:
+            disconnect_msg = datagram.pack(DGRAM_DISCONNECT, payload=self.nickname.encode('utf-8'),
+                                           crypto=self.udp_crypto)
+            self.client.sendto(disconnect_msg, (self.host, self.port))
+        except:
+            pass
+        
+        try:
+            self.client.close()
+        except:
+            pass
+
     def send_message(self, message):
         if not self.connected:
             return False
@@ -411,41 +583,20 @@ class ChatClient:
 
             if self.PROTO == 'UDP':
                 with self.lock:
-                    msg_id = self.message_id_counter
-                    self.message_id_counter += 1
                     self.stats['sent_count'] += 1
                     if self.use_ssl and self.udp_crypto:
                         self.stats['encrypted_messages'] += 1
+                    
+                    # Window full (or session keys not there yet): the message waits (drain_send_backlog)
+                    if self.send_window.backlog or not self.send_window.can_send() or self.handshake_pending():
+                        self.send_window.backlog.append(full_message)
+                        return True
+                    msg_id = self.send_window.allocate()
 
-                udp_msg = f"MSG:{msg_id}:{send_time}:{full_message}"
-                
-                # Encrypt message if UDP encryption is enabled
-                if self.use_ssl and self.udp_crypto:
-                    try:
-                        udp_msg = self.udp_crypto.encrypt_message(udp_msg)
-                    except:
-                        pass
-                
-                data = udp_msg.encode('utf-8')
-                
-                if not self.simulate_packet_loss():
-                    self.client.sendto(data, (self.host, self.port))
-                else:
-                    with self.lock:
-                        self.stats['simulated_drops'] += 1
-                
-                # Store message text in pending_messages to display after ACK
-                with self.lock:
-                    self.pending_messages[msg_id] = {
-                        'data': data, 
-                        'timestamp': send_time, 
-                        'retries': 0,
-                        'message_text': full_message  # Store the message text
-                    }
+                self._transmit_udp(msg_id, full_message)
             else:
                 # TCP: send immediately and add to UI
-                tcp_msg = f"{full_message}|TS:{send_time}|"
-                self.client.send(tcp_msg.encode('utf-8'))
+                self.client.sendall(encode_frame(FRAME_MSG, full_message.encode('utf-8'), send_time))
                 with self.lock:
                     self.stats['sent_count'] += 1
                     if self.use_ssl:
@@ -456,8 +607,49 @@ class ChatClient:
             self.disconnect()
             return False
 
+    def resealed(self, msg_id, entry):
+        """Datagram for a retransmission: sealed again with the current session key epoch"""
+        if self.session_crypto is not None:
+            entry['data'] = datagram.pack(DGRAM_MSG, msg_id, entry['send_time'], entry['message_text'].encode('utf-8'),
+                                          self.session_crypto)
+        return entry['data']
+
+    def _transmit_udp(self, msg_id, full_message):
+        send_time = time.time()
+        # Encrypt message if UDP encryption is enabled (header authenticated as associated data)
+        data = datagram.pack(DGRAM_MSG, msg_id, send_time, full_message.encode('utf-8'),
+                             self.session_crypto or self.udp_crypto)
+        
+        # Store message text in pending_messages to display after ACK
+        with self.lock:
+            self.pending_messages[msg_id] = {
+                'data': data, 
+                'send_time': send_time,
+                'timestamp': send_time, 
+                'retries': 0,
+                'message_text': full_message  # Store the message text
+            }
+            self.retransmit_scheduler.schedule(msg_id, send_time + self.rtt_estimator.rto)
+        
+        if not self.simulate_packet_loss():
+            self.client.sendto(data, (self.host, self.port))
+        else:
+            with self.lock:
+                self.stats['simulated_drops'] += 1
+
+    def drain_send_backlog(self):
+        """Send queued messages while the window has room"""
+        while self.connected:
+            with self.lock:
+                if not self.send_window.backlog or not self.send_window.can_send() or self.handshake_pending():
+                    return
+                full_message = self.send_window.backlog.popleft()
+                msg_id = self.send_window.allocate()
+            self._transmit_udp(msg_id, full_message)
+
     def disconnect(self):
         self.connected = False
+        self.retransmit_scheduler.wake()
         if self.client:
             try:
                 self.client.close()
@@ -465,20 +657,15 @@ class ChatClient:
                 pass
 
     def process_queue(self):
-        while not self.message_queue.empty():
-            try:
-                msg = self.message_queue.get_nowait()
-                if 'messages' not in st.session_state:
-                    st.session_state.messages = []
-                st.session_state.messages.append(msg)
-            except queue.Empty:
-                break
+        """GUI hook: see gui_adapter (the only place streamlit is imported)"""
+        from gui_adapter import process_client_queue
+        process_client_queue(self)
 
     def get_stats(self):
         with self.lock:
-            avg_latency = 0.0
-            if self.stats['latency_samples']:
-                avg_latency = sum(self.stats['latency_samples']) / len(self.stats['latency_samples'])
+            # Windowed view (last 1024 samples) + lifetime histogram percentiles
+            latency_window = self.stats['latency'].window_summary()
+            lifetime = self.stats['latency'].lifetime_summary()
             packet_loss_rate = (self.stats['packet_loss'] / self.stats['sent_count'] * 100) if self.stats['sent_count'] else 0.0
             out_of_order_rate = (self.stats['out_of_order'] / self.stats['received_count'] * 100) if self.stats['received_count'] else 0.0
 
@@ -491,12 +678,21 @@ class ChatClient:
                 'packet_loss_rate': packet_loss_rate,
                 'out_of_order': self.stats['out_of_order'],
                 'out_of_order_rate': out_of_order_rate,
-                'avg_latency': avg_latency,
-                'min_latency': min(self.stats['latency_samples']) if self.stats['latency_samples'] else 0.0,
-                'max_latency': max(self.stats['latency_samples']) if self.stats['latency_samples'] else 0.0,
+                'avg_latency': latency_window['avg'],
+                'min_latency': latency_window['min'],
+                'max_latency': latency_window['max'],
+                'p50_latency': latency_window['p50'],
+                'p95_latency': latency_window['p95'],
+                'p99_latency': latency_window['p99'],
+                'p999_latency': latency_window['p999'],
+                'latency_lifetime': lifetime,
                 'simulated_drops': self.stats['simulated_drops'],
+                'acks_sent': self.stats['acks_sent'],
+                'queued_messages': len(self.send_window.backlog),
                 'configured_loss_rate': self.packet_loss_rate * 100,
                 'ack_timeout': self.ack_timeout,
+                'rto': self.rtt_estimator.rto,
+                'srtt': (self.rtt_estimator.srtt or 0.0) * 1000,
                 'max_retries': self.max_retries,
                 'encrypted_messages': self.stats['encrypted_messages'],
                 'ssl_enabled': self.use_ssl
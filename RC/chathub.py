@@ -0,0 +1,134 @@
+"""
+Headless entry point for ChatHub (no Streamlit). Run from the RC directory:
+    python -m chathub serve --proto udp --port 5555
+    python -m chathub client --proto udp --port 5555 --nickname bob
+The GUI stays `streamlit run GUI.py`.
+"""
+import argparse
+import queue
+import signal
+import sys
+import threading
+
+from chatserver import ChatServer
+from chatclient import ChatClient
+from outbound import POLICIES, DROP_OLDEST
+from udp_workers import UDPWorkerPool
+
+QUIET_LEVELS = ('WARNING', 'ERROR')
+
+
+def drain_server(server, quiet=False):
+    """Print pending log entries and discard the GUI-only queues (they would grow forever)"""
+    while True:
+        try:
+            entry = server.log_queue.get_nowait()
+        except queue.Empty:
+            break
+        if not quiet or entry['level'] in QUIET_LEVELS:
+            print(f"[{entry['time']}] {entry['level']:<7} {entry['message']}", flush=True)
+    for pending in (server.clients_queue, server.conversations_queue):
+        while True:
+            try:
+                pending.get_nowait()
+            except queue.Empty:
+                break
+
+
+def serve(args):
+    if args.workers > 1:
+        if args.proto != 'UDP':
+            print("❌ --workers needs --proto udp", file=sys.stderr)
+            return 2
+        server = UDPWorkerPool(args.host, args.port, args.workers, use_ssl=not args.no_encryption)
+    else:
+        server = ChatServer(args.host, args.port, args.proto, use_ssl=not args.no_encryption,
+                            tcp_mode=args.tcp_mode, outbound_policy=args.outbound_policy)
+    server.packet_loss_rate = args.loss
+    server.metrics_port = args.metrics_port
+    server.message_log_dir = args.log_dir
+    if args.proto == 'UDP':
+        server.crypto_workers = args.crypto_workers
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    if not server.start():
+        drain_server(server)
+        return 1
+    try:
+        while not stop.wait(0.2):
+            drain_server(server, args.quiet)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        drain_server(server, args.quiet)
+    return 0
+
+
+def client(args):
+    """Line-oriented client: stdin lines are sent, received messages are printed"""
+    chat = ChatClient(args.host, args.port, args.nickname, args.proto, use_ssl=not args.no_encryption)
+    chat.packet_loss_rate = args.loss
+    if not chat.connect():
+        print(f"❌ Connection failed: {chat.last_error}", file=sys.stderr)
+        return 1
+
+    def read_stdin():
+        for line in sys.stdin:
+            if line.strip():
+                chat.send_message(line.rstrip('\n'))
+        chat.disconnect()
+
+    threading.Thread(target=read_stdin, daemon=True).start()
+    try:
+        while chat.connected:
+            try:
+                msg = chat.message_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            print(f"[{msg['time']}] {msg['text']}", flush=True)
+    except KeyboardInterrupt:
+        chat.disconnect()
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='chathub', description="ChatHub headless server and client")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def common(p, host):
+        p.add_argument('--proto', type=str.upper, choices=['TCP', 'UDP'], default='TCP')
+        p.add_argument('--host', default=host)
+        p.add_argument('--port', type=int, default=5555)
+        p.add_argument('--no-encryption', action='store_true', help="plain TCP / unencrypted UDP")
+        p.add_argument('--loss', type=float, default=0.0, help="simulated UDP packet loss rate (0..1)")
+
+    p = sub.add_parser('serve', help="run a chat server")
+    common(p, '0.0.0.0')
+    p.add_argument('--tcp-mode', choices=['threaded', 'eventloop'], default='threaded')
+    p.add_argument('--outbound-policy', choices=POLICIES, default=DROP_OLDEST,
+                   help="what to do when a TCP client's outbound queue is full")
+    p.add_argument('--metrics-port', type=int, default=None, help="serve Prometheus metrics on this port")
+    p.add_argument('--log-dir', default=None, help="keep a durable message log here (enables /history)")
+    p.add_argument('--workers', type=int, default=1,
+                   help="UDP only: worker processes sharing the port (SO_REUSEPORT), one per core")
+    p.add_argument('--crypto-workers', type=int, default=0,
+                   help="encrypted UDP only: threads decrypting/encrypting each batch (0: inline)")
+    p.add_argument('--quiet', action='store_true', help="only print warnings and errors")
+    p.set_defaults(func=serve)
+
+    p = sub.add_parser('client', help="connect, send stdin lines, print received messages")
+    common(p, '127.0.0.1')
+    p.add_argument('--nickname', default='Guest')
+    p.set_defaults(func=client)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
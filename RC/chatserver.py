@@ -4,16 +4,41 @@ from datetime import datetime
 import queue
 import time
 import random
-import streamlit as st
+import secrets
+import select
 import ssl
-from udp_crypto import UDPCrypto
+import sys
+from udp_crypto import UDPCrypto, KeyExchange, PUBLIC_KEY_BYTES, REKEY_MESSAGES, REKEY_BYTES
+from tcp_engine import EventLoopTCPEngine, TCPConnection
+from outbound import OutboundQueue, OutboundOverflow, DROP_OLDEST
+from framing import FrameReader, encode_frame, HEADER, FRAME_NICK, FRAME_MSG
+import datagram
+from datagram import DGRAM_HELLO, DGRAM_MSG, DGRAM_ACK, DGRAM_DISCONNECT, DGRAM_SESSION, DGRAM_RESUME
+from datagram import SESSION_NEW, SESSION_RESUMED, SESSION_UNKNOWN, SESSION_EXPIRED, SESSION_TOKEN_BYTES
+from stats import ClientStats, aggregate
+from metrics import MetricsExporter
+from conversations import ConversationStore
+from message_log import MessageLog, parse_time
+from mailboxes import Mail, Mailboxes
+from udp_io import DatagramBatch
+from crypto_pipeline import CryptoPipeline
+from udp_reliability import RetransmitScheduler, RTTEstimator, SendWindow, AckTracker, ReplayWindow
 
 class ChatServer:
-    def __init__(self, host='0.0.0.0', port=5555, protocol='TCP', use_ssl=True):
+    def __init__(self, host='0.0.0.0', port=5555, protocol='TCP', use_ssl=True, tcp_mode='threaded',
+                 outbound_policy=DROP_OLDEST):
         self.host = host
         self.port = port
         self.protocol = protocol.upper()
         self.use_ssl = use_ssl
+        # Moteur TCP: 'threaded' (un thread par client) ou 'eventloop' (une seule boucle selectors)
+        self.tcp_mode = tcp_mode.lower()
+        self.tcp_engine = None
+        # File d'envoi bornée par client TCP: 'drop_oldest', 'disconnect' ou 'block'
+        self.outbound_policy = outbound_policy
+        self.outbound_max_frames = 1024
+        self.outbound_max_bytes = 4 * 1024 * 1024
+        self.outbound_block_timeout = 5.0
         self.server = None
         self.running = False
         self.log_queue = queue.Queue()
@@ -40,18 +65,57 @@ class ChatServer:
                 self.log(f"⚠️ UDP encryption initialization failed: {e}. Running without encryption.", "WARNING")
                 self.use_ssl = False
         
-        # Stockage des conversations par client
-        self.conversations = {}
+        # Stockage des conversations par client: les 200 derniers messages en mémoire,
+        # les plus anciens dans un segment sur disque (relu par page)
+        self.conversations = ConversationStore(tail=200)
+        
+        # Journal durable (segments append-only sur disque) pour /history, activé par un répertoire
+        self.message_log_dir = None
+        self.message_log = None
+        self.history_limit = 500
         self.conversations_queue = queue.Queue()
+        
+        # Boîtes aux lettres des clients déconnectés (store-and-forward), vidées à la reconnexion
+        self.mailboxes = Mailboxes()
+        self.known_nicknames = set()  # nicknames that connected at least once: the only ones given a mailbox
+        
+        # Salons de discussion: room -> set of member nicknames (fan-out côté serveur)
+        self.rooms = {}
+
+        # self.lock only guards membership (clients, client_map, rooms); per-client
+        # stats have their own lock and UDP reliability state has reliability_lock
+        self.lock = threading.Lock()
 
         # Reliability tracking
-        self.message_id_counter = 0
         self.pending_acks = {}
-        self.received_msg_ids = {}
-        self.lock = threading.Lock()
+        self.replay_windows = {}
+        self.reliability_lock = threading.Lock()
+        # Deadlines of pending_acks entries: the retransmit thread only wakes for expired ones
+        self.retransmit_scheduler = RetransmitScheduler()
+        # Per-peer SRTT/RTTVAR -> adaptive retransmission timeout
+        self.rtt_estimators = {}
+        # Sliding window per UDP peer: send side (per-peer seq + backlog), receive side (cumulative + SACK ACKs)
+        self.window_size = 64
+        self.ack_every = 16
+        self.send_windows = {}
+        self.ack_trackers = {}
+        self.acks_owed = {}
         
         # Statistics per client
         self.client_stats = {}
+        # Counters of disconnected clients, so server-wide totals never go backwards
+        self.retired_stats = ClientStats()
+        self.retired_outbound_dropped = 0  # frames dropped by the outbound queues of disconnected clients
+        
+        # Prometheus text exporter (GET /metrics), started with the server when a port is set
+        self.metrics_host = '0.0.0.0'
+        self.metrics_port = None
+        self.metrics_exporter = None
+        
+        # Moteur threaded + SSL: un verrou par SSLSocket (OpenSSL interdit lecture/écriture concurrentes)
+        self.ssl_locks = {}
+        # Moteur threaded: file d'envoi de chaque client, vidée par son thread d'écriture
+        self.outbound_queues = {}
 
         if self.protocol == 'TCP':
             self.clients = []
@@ -61,11 +125,30 @@ class ChatServer:
             self.clients = {}
             self.client_map = {}
             self.addr_to_nickname = {}
+            # Session tokens: a client that changes address (NAT rebinding, new socket)
+            # sends RESUME with its token and keeps seqs, replay window and pending messages
+            self.sessions = {}        # token -> addr
+            self.session_tokens = {}  # addr -> token
+            self.resume_counters = {} # token -> counter of the last RESUME that moved it (replays carry an old one)
+            # Per-session AES-GCM keys from the X25519 handshake carried by HELLO / SESSION_NEW
+            self.session_crypto = {}  # addr -> SessionCrypto
 
-        # UDP Configuration
-        self.ack_timeout = 2.0
+        # UDP Configuration (ack_timeout is the initial RTO, before the first RTT sample)
+        self.ack_timeout = 1.0
         self.max_retries = 5
         self.packet_loss_rate = 0.30
+        self.udp_rcvbuf = 4 * 1024 * 1024
+        # Datagrams drained per wakeup of the receive thread (see udp_io.DatagramBatch)
+        self.udp_batch = 64
+        # Share the port with other worker processes (udp_workers.UDPWorkerPool)
+        self.udp_reuseport = False
+        self.udp_io = None
+        # AES-GCM of each receive batch and of room fan-outs on this many threads (0: inline)
+        self.crypto_workers = 0
+        self.crypto_pipeline = None
+        # Session keys move to the next epoch after this many messages / bytes in one direction
+        self.rekey_messages = REKEY_MESSAGES
+        self.rekey_bytes = REKEY_BYTES
 
     def simulate_packet_loss(self):
         """Simule la perte de paquets selon le taux configuré"""
@@ -78,183 +161,662 @@ class ChatServer:
         self.log_queue.put({"time": timestamp, "level": level, "message": message})
 
     def update_clients_list(self):
-        if self.protocol == 'TCP':
-            self.clients_queue.put(self.nicknames.copy())
-        else:
-            self.clients_queue.put(list(self.clients.values()))
+        with self.lock:
+            nicknames = self.nicknames.copy() if self.protocol == 'TCP' else list(self.clients.values())
+        self.clients_queue.put(nicknames)
 
     def add_to_conversation(self, nickname, message, is_server=False):
         """Ajoute un message à la conversation d'un client"""
-        if nickname not in self.conversations:
-            self.conversations[nickname] = []
-        
-        timestamp = datetime.now().strftime("%H:%M")
-        self.conversations[nickname].append({
-            'time': timestamp,
+        entry = {
+            'time': datetime.now().strftime("%H:%M"),
             'text': message,
             'is_server': is_server
-        })
+        }
+        self.conversations.append(nickname, entry)
+        if self.message_log is not None:
+            self.message_log.append(nickname, message, is_server)
         
         # Notifier l'interface
         self.conversations_queue.put({
             'nickname': nickname,
-            'message': {
-                'time': timestamp,
-                'text': message,
-                'is_server': is_server
-            }
+            'message': entry
         })
 
+    def get_send_window(self, addr):
+        """Send window of a UDP peer (call with self.reliability_lock held)"""
+        window = self.send_windows.get(addr)
+        if window is None:
+            window = SendWindow(self.window_size)
+            self.send_windows[addr] = window
+        return window
+
+    def get_rtt_estimator(self, addr):
+        """RTT estimator of a UDP peer (call with self.reliability_lock held)"""
+        estimator = self.rtt_estimators.get(addr)
+        if estimator is None:
+            estimator = RTTEstimator(initial_rto=self.ack_timeout)
+            self.rtt_estimators[addr] = estimator
+        return estimator
+
     def init_client_stats(self, nickname):
-        """Initialize statistics for a client"""
-        self.client_stats[nickname] = {
-            'sent_count': 0,
-            'received_count': 0,
-            'ack_count': 0,
-            'retransmissions': 0,
-            'packet_loss': 0,
-            'duplicates': 0,
-            'latency_samples': [],
-            'simulated_drops': 0,
-            'encrypted_messages': 0
-        }
+        """Initialize statistics for a client (call with self.lock held, with the membership change)"""
+        self.client_stats[nickname] = ClientStats()
+
+    def retire_client_stats(self, nickname):
+        """Drop a client's stats, folding its counters into the server-wide totals (call with self.lock held)"""
+        stats = self.client_stats.pop(nickname, None)
+        if stats is not None:
+            self.retired_stats.merge(stats)
+
+    def count(self, nickname, *names, latency=None):
+        """Bump counters of a client: takes only that client's stats lock, never self.lock"""
+        stats = self.client_stats.get(nickname)
+        if stats is not None:
+            stats.count(*names, latency=latency)
 
-    def send_to_client(self, nickname, message):
-        """Envoie un message à un client spécifique"""
+    def send_to_client(self, nickname, message, reply=False):
+        """
+        Envoie un message à un client spécifique (False si hors ligne: il part dans sa boîte aux lettres).
+        reply=True for command replies: only meant for the live connection, so they are
+        not written to the conversation, the message log (/history) or a mailbox.
+        """
         full_msg = f"[SERVER]: {message}"
         send_time = time.time()
         
         try:
             if self.protocol == 'TCP':
-                if nickname in self.client_map:
-                    client = self.client_map[nickname]
-                    tcp_msg = f"{full_msg}|TS:{send_time}|"
+                client = self.client_map.get(nickname)
+                if client is not None:
+                    frame = encode_frame(FRAME_MSG, full_msg.encode('utf-8'), send_time)
+                    if not reply:
+                        frame = Mail(frame)
                     
                     # Log encryption status
                     if self.use_ssl:
                         self.log(f"🔒 Encrypting message for {nickname}", "INFO")
                     
-                    client.send(tcp_msg.encode('utf-8'))
+                    self.queue_tcp(client, nickname, frame)
                     
                     if self.use_ssl:
                         self.log(f"✅ Encrypted message sent to {nickname}", "SUCCESS")
                     else:
                         self.log(f"Server → {nickname}: {message}", "SUCCESS")
                     
-                    self.add_to_conversation(nickname, message, is_server=True)
+                    if not reply:
+                        self.add_to_conversation(nickname, message, is_server=True)
                     
-                    with self.lock:
-                        if nickname in self.client_stats:
-                            self.client_stats[nickname]['sent_count'] += 1
-                            if self.use_ssl:
-                                self.client_stats[nickname]['encrypted_messages'] += 1
+                    if self.use_ssl:
+                        self.count(nickname, 'sent_count', 'encrypted_messages')
+                    else:
+                        self.count(nickname, 'sent_count')
                     return True
             else:
                 # UDP with reliability and encryption
-                if nickname in self.client_map:
-                    addr = self.client_map[nickname]
-                    
-                    with self.lock:
-                        msg_id = self.message_id_counter
-                        self.message_id_counter += 1
-                        if nickname in self.client_stats:
-                            self.client_stats[nickname]['sent_count'] += 1
-                            if self.use_ssl and self.udp_crypto:
-                                self.client_stats[nickname]['encrypted_messages'] += 1
+                addr = self.client_map.get(nickname)
+                if addr is not None:
                     
-                    udp_msg = f"MSG:{msg_id}:{send_time}:{full_msg}"
-                    
-                    # Encrypt if UDP encryption is enabled
                     if self.use_ssl and self.udp_crypto:
-                        try:
-                            udp_msg = self.udp_crypto.encrypt_message(udp_msg)
-                            self.log(f"🔒 Encrypting UDP message for {nickname}", "INFO")
-                        except Exception as e:
-                            self.log(f"⚠️ Encryption failed: {e}. Sending unencrypted.", "WARNING")
-                    
-                    data = udp_msg.encode('utf-8')
-                    
-                    if not self.simulate_packet_loss():
-                        self.server.sendto(data, addr)
+                        self.count(nickname, 'sent_count', 'encrypted_messages')
                     else:
-                        with self.lock:
-                            if nickname in self.client_stats:
-                                self.client_stats[nickname]['simulated_drops'] += 1
-                        self.log(f"[SIMULATED DROP] Server → {nickname}", "WARNING")
+                        self.count(nickname, 'sent_count')
                     
-                    with self.lock:
-                        self.pending_acks[(addr, msg_id)] = {
-                            'data': data,
-                            'timestamp': send_time,
-                            'retries': 0,
-                            'nickname': nickname
-                        }
+                    if self.udp_crypto:
+                        self.log(f"🔒 Encrypting UDP message for {nickname}", "INFO")
+                    
+                    payload = full_msg.encode('utf-8')
+                    self.send_udp(addr, nickname, payload if reply else Mail(payload))
                     
                     if self.use_ssl and self.udp_crypto:
                         self.log(f"✅ Encrypted message sent to {nickname}", "SUCCESS")
                     else:
                         self.log(f"Server → {nickname}: {message}", "SUCCESS")
                     
-                    self.add_to_conversation(nickname, message, is_server=True)
+                    if not reply:
+                        self.add_to_conversation(nickname, message, is_server=True)
                     return True
+            
+            # Not connected: keep it in the nickname's mailbox until it reconnects
+            if reply:
+                return False
+            if nickname not in self.known_nicknames:
+                self.log(f"⚠️ {nickname} never connected: message not queued", "WARNING")
+                return False
+            if self.mailboxes.put(nickname, full_msg.encode('utf-8'), send_time):
+                self.add_to_conversation(nickname, message, is_server=True)
+                self.log(f"📬 {nickname} is offline: message queued ({self.mailboxes.pending(nickname)} waiting)", "INFO")
             return False
         except Exception as e:
             self.log(f"Failed to send message to {nickname}: {e}", "ERROR")
             return False
 
-    def handle_client_tcp(self, client, nickname):
-        while self.running:
+    def handle_room_command(self, nickname, text):
+        """
+        Room commands sent by clients as chat text:
+        /join <room>, /leave <room>, /rooms, #<room> <message>, /history ...
+        Returns True if text was a room command (not a message to the server).
+        """
+        if text == '/history' or text.startswith('/history '):
+            self.send_history(nickname, text[9:].split())
+        elif text.startswith('/join '):
+            self.join_room(nickname, text[6:].strip())
+        elif text.startswith('/leave '):
+            self.leave_room(nickname, text[7:].strip())
+        elif text == '/rooms':
+            with self.lock:
+                listing = ', '.join(f"#{room} ({len(members)})" for room, members in sorted(self.rooms.items()))
+            self.send_to_client(nickname, f"Rooms: {listing or 'none'}", reply=True)
+        elif text.startswith('#') and ' ' in text:
+            room, message = text[1:].split(' ', 1)
+            with self.lock:
+                is_member = nickname in self.rooms.get(room, ())
+            if not is_member:
+                self.send_to_client(nickname, f"You are not in #{room} (use /join {room})", reply=True)
+                return True
+            self.add_to_conversation(nickname, f"[#{room}] {message}", is_server=False)
+            self.broadcast_to_room(room, f"{nickname}: {message}", sender=nickname)
+        else:
+            return False
+        return True
+
+    def send_history(self, nickname, args):
+        """
+        /history [N] | /history since <time> | /history #room [N] | /history #room since <time>
+        Replayed from the message log (memory-mapped segments); time is a Unix
+        timestamp, an ISO date/time or HH:MM today.
+        """
+        if self.message_log is None:
+            self.send_to_client(nickname, "History is not enabled on this server", reply=True)
+            return
+        key = nickname
+        if args and args[0].startswith('#'):
+            room = args.pop(0)[1:]
+            with self.lock:
+                is_member = nickname in self.rooms.get(room, ())
+            if not is_member:
+                self.send_to_client(nickname, f"You are not in #{room} (use /join {room})", reply=True)
+                return
+            key = '#' + room
+        try:
+            if args and args[0] == 'since':
+                records = self.message_log.since(parse_time(' '.join(args[1:])), key, limit=self.history_limit)
+            else:
+                records = self.message_log.last(key, min(int(args[0]) if args else 20, self.history_limit))
+        except (ValueError, IndexError):
+            self.send_to_client(nickname, "Usage: /history [N] | /history since <time> | /history #room [N]", reply=True)
+            return
+        
+        for record in records:
+            when = datetime.fromtimestamp(record['timestamp']).strftime('%d/%m %H:%M')
+            if key != nickname:
+                text = f"{key} {record['text']}"
+            elif record['is_server']:
+                text = f"[SERVER]: {record['text']}"
+            else:
+                text = f"{nickname}: {record['text']}"
             try:
-                data = client.recv(2048)
-                if not data:
-                    self.remove_client_tcp(client)
-                    break
-                
-                msg = data.decode('utf-8').strip()
-                if not msg:
+                if not self.deliver_to_client(nickname, f"[history {when}] {text}"):
+                    return
+            except OSError:
+                return
+        self.send_to_client(nickname, f"End of history ({len(records)} messages)", reply=True)
+
+    def deliver_to_client(self, nickname, text):
+        """Send text as is: no [SERVER] prefix, no conversation or log entry. False if not connected"""
+        payload = text.encode('utf-8')
+        if self.protocol == 'TCP':
+            client = self.client_map.get(nickname)
+            if client is None:
+                return False
+            self.queue_tcp(client, nickname, encode_frame(FRAME_MSG, payload, time.time()))
+        else:
+            addr = self.client_map.get(nickname)
+            if addr is None:
+                return False
+            self.send_udp(addr, nickname, payload)
+        self.count(nickname, 'sent_count')
+        return True
+
+    def flush_mailbox(self, nickname):
+        """
+        Deliver what was queued while nickname was offline, in one batch:
+        TCP frames are concatenated into a single outbound write, UDP messages
+        take their seqs under one lock (the rest waits in the send backlog).
+        """
+        queued = self.mailboxes.take(nickname)
+        if not queued:
+            return 0
+        payloads = [Mail(f"[offline {datetime.fromtimestamp(queued_at).strftime('%d/%m %H:%M')}] ".encode('utf-8') + payload)
+                    for queued_at, payload in queued]
+        try:
+            if self.protocol == 'TCP':
+                client = self.client_map.get(nickname)
+                if client is None:
+                    raise OSError("not connected")
+                now = time.time()
+                self.queue_tcp(client, nickname, Mail(b''.join(encode_frame(FRAME_MSG, payload, now) for payload in payloads)))
+            else:
+                addr = self.client_map.get(nickname)
+                if addr is None:
+                    raise OSError("not connected")
+                self.send_udp_batch(addr, nickname, payloads)
+        except OSError as e:
+            # Gone again before the flush: put everything back
+            for queued_at, payload in queued:
+                self.mailboxes.put(nickname, payload, queued_at)
+            self.log(f"⚠️ Mailbox flush to {nickname} failed: {e}", "WARNING")
+            return 0
+        
+        encrypted = self.use_ssl and (self.protocol == 'TCP' or self.udp_crypto is not None)
+        stats = self.client_stats.get(nickname)
+        if stats is not None:
+            for name in (('sent_count', 'encrypted_messages') if encrypted else ('sent_count',)):
+                stats.add(name, len(payloads))
+        self.log(f"📬 Delivered {len(payloads)} queued message(s) to {nickname}", "SUCCESS")
+        return len(payloads)
+
+    def salvage_frames(self, nickname, frames):
+        """Move the messages of unsent Mail frames (or batches of frames) to the nickname's mailbox"""
+        count = 0
+        now = time.time()
+        for data in frames:
+            if not isinstance(data, Mail):
+                continue  # welcome, /history replay, command reply: only for that connection
+            pos = 0
+            while pos + HEADER.size <= len(data):
+                _, frame_type, length, _ = HEADER.unpack_from(data, pos)
+                if frame_type == FRAME_MSG and self.mailboxes.put(nickname, bytes(data[pos + HEADER.size:pos + HEADER.size + length]), now):
+                    count += 1
+                pos += HEADER.size + length
+        return count
+
+    def join_room(self, nickname, room):
+        if not room or ' ' in room:
+            return False
+        with self.lock:
+            members = self.rooms.setdefault(room, set())
+            members.add(nickname)
+            count = len(members)
+        self.log(f"{nickname} joined #{room}", "INFO")
+        # Only the member is notified: announcing every join to the whole room is O(n²) for large rooms
+        self.send_to_client(nickname, f"Joined #{room} ({count} members)", reply=True)
+        return True
+
+    def leave_room(self, nickname, room):
+        with self.lock:
+            members = self.rooms.get(room)
+            if not members or nickname not in members:
+                return False
+            members.discard(nickname)
+            if not members:
+                del self.rooms[room]
+        self.log(f"{nickname} left #{room}", "INFO")
+        if nickname in self.client_map:
+            self.send_to_client(nickname, f"Left #{room}", reply=True)
+        return True
+
+    def leave_all_rooms(self, nickname):
+        """Called when a client disconnects"""
+        with self.lock:
+            joined = [room for room, members in self.rooms.items() if nickname in members]
+        for room in joined:
+            self.leave_room(nickname, room)
+
+    def broadcast_to_room(self, room, message, sender=None):
+        """
+        Fan-out of one message to every member of a room (except the sender).
+        The text is encoded once; over TCP the frame is built once and the same
+        bytes are queued on every connection (TLS still encrypts per connection).
+        Over UDP each datagram is sealed per peer, because its per-peer seq is
+        authenticated as associated data. Returns the number of members reached.
+        """
+        with self.lock:
+            members = [m for m in self.rooms.get(room, ()) if m != sender]
+        if self.message_log is not None:
+            self.message_log.append('#' + room, message)
+        if not members:
+            return 0
+        
+        payload = Mail(f"[#{room}] {message}".encode('utf-8'))
+        delivered = []
+        if self.protocol == 'TCP':
+            frame = Mail(encode_frame(FRAME_MSG, payload, time.time()))
+            for member in members:
+                client = self.client_map.get(member)
+                if client is None:
                     continue
-                
-                # Log decryption
-                if self.use_ssl:
-                    self.log(f"🔓 Decrypted message from {nickname}", "INFO")
-                
-                receive_time = time.time()
-                latency = None
-                
-                if '|TS:' in msg:
-                    parts = msg.split('|TS:')
-                    msg = parts[0]
-                    if len(parts) >= 2:
-                        try:
-                            send_time = float(parts[1].split('|')[0])
-                            latency = (receive_time - send_time) * 1000
-                        except:
-                            pass
-                
-                if msg.startswith(nickname + ': '):
-                    clean_msg = msg.replace(nickname + ': ', '', 1)
+                try:
+                    self.queue_tcp(client, member, frame)
+                    delivered.append(member)
+                except Exception as e:
+                    self.log(f"Failed to send #{room} message to {member}: {e}", "ERROR")
+        else:
+            ready = []
+            for member in members:
+                addr = self.client_map.get(member)
+                if addr is None:
+                    continue
+                msg_id = self.reserve_udp(addr, member, payload)
+                if msg_id is not None:
+                    ready.append((addr, member, msg_id, payload))
+                delivered.append(member)
+            self.transmit_udp_many(ready)
+        
+        encrypted = self.use_ssl and (self.protocol == 'TCP' or self.udp_crypto is not None)
+        names = ('sent_count', 'encrypted_messages') if encrypted else ('sent_count',)
+        for member in delivered:
+            self.count(member, *names)
+        
+        self.log(f"#{room} {message} → {len(delivered)} member(s)", "MESSAGE")
+        return len(delivered)
+
+    def send_udp(self, addr, nickname, payload):
+        """Envoie un message fiable à un pair UDP, ou le met en attente si sa fenêtre est pleine"""
+        msg_id = self.reserve_udp(addr, nickname, payload)
+        if msg_id is not None:
+            self._transmit_udp(addr, nickname, msg_id, payload)
+
+    def reserve_udp(self, addr, nickname, payload):
+        """Seq for the next message to a peer, or None if it went to the backlog (window full)"""
+        with self.reliability_lock:
+            window = self.get_send_window(addr)
+            if window.backlog or not window.can_send():
+                window.backlog.append((nickname, payload))
+                return None
+            return window.allocate()
+
+    def send_udp_batch(self, addr, nickname, payloads):
+        """send_udp for several messages, with one window allocation pass"""
+        ready = []
+        with self.reliability_lock:
+            window = self.get_send_window(addr)
+            for payload in payloads:
+                if window.backlog or not window.can_send():
+                    window.backlog.append((nickname, payload))
                 else:
-                    clean_msg = msg
-                
-                with self.lock:
-                    if nickname in self.client_stats:
-                        self.client_stats[nickname]['received_count'] += 1
-                        if self.use_ssl:
-                            self.client_stats[nickname]['encrypted_messages'] += 1
-                        if latency:
-                            self.client_stats[nickname]['latency_samples'].append(latency)
-                            if len(self.client_stats[nickname]['latency_samples']) > 100:
-                                self.client_stats[nickname]['latency_samples'] = \
-                                    self.client_stats[nickname]['latency_samples'][-100:]
+                    ready.append((window.allocate(), payload))
+        self.transmit_udp_many([(addr, nickname, msg_id, payload) for msg_id, payload in ready])
+
+    def drain_send_backlog(self, addr):
+        """Send queued messages of a peer while its window has room"""
+        while True:
+            with self.reliability_lock:
+                window = self.send_windows.get(addr)
+                if not window or not window.backlog or not window.can_send():
+                    return
+                nickname, payload = window.backlog.popleft()
+                msg_id = window.allocate()
+            self._transmit_udp(addr, nickname, msg_id, payload)
+
+    def crypto_for(self, addr):
+        """Keys for data sent to a peer: its session keys, or the static key (no handshake)"""
+        return self.session_crypto.get(addr) or self.udp_crypto
+
+    def resealed_udp(self, addr, msg_id, entry):
+        """
+        Datagram for a retransmission. Session keys move to a new epoch as they
+        are used, so a pending message is sealed again with the current one
+        (the receiver only keeps a few old epochs); static-key datagrams are resent as is.
+        """
+        crypto = self.crypto_for(addr)
+        if crypto is not None and crypto.session:
+            entry['data'] = datagram.pack(DGRAM_MSG, msg_id, entry['send_time'], entry['payload'], crypto)
+        return entry['data']
+
+    def seal_udp(self, addr, msg_id, payload):
+        send_time = time.time()
+        # Encrypt if UDP encryption is enabled (header authenticated as associated data)
+        return datagram.pack(DGRAM_MSG, msg_id, send_time, payload, self.crypto_for(addr)), send_time
+
+    def transmit_udp_many(self, messages):
+        """_transmit_udp for [(addr, nickname, msg_id, payload)], sealed by the crypto pipeline if any"""
+        if self.crypto_pipeline is None:
+            for addr, nickname, msg_id, payload in messages:
+                self._transmit_udp(addr, nickname, msg_id, payload)
+            return
+        sealed = self.crypto_pipeline.map(self.seal_udp, [(addr, msg_id, payload)
+                                                          for addr, nickname, msg_id, payload in messages])
+        for (addr, nickname, msg_id, payload), (data, send_time) in zip(messages, sealed):
+            self._transmit_udp(addr, nickname, msg_id, payload, data, send_time)
+
+    def _transmit_udp(self, addr, nickname, msg_id, payload, data=None, send_time=None):
+        if data is None:
+            data, send_time = self.seal_udp(addr, msg_id, payload)
+        
+        with self.reliability_lock:
+            self.pending_acks[(addr, msg_id)] = {
+                'data': data,
+                'payload': payload,
+                'send_time': send_time,
+                'timestamp': send_time,
+                'retries': 0,
+                'nickname': nickname
+            }
+            self.retransmit_scheduler.schedule((addr, msg_id), send_time + self.get_rtt_estimator(addr).rto)
+        
+        if not self.simulate_packet_loss():
+            self.server.sendto(data, addr)
+        else:
+            self.count(nickname, 'simulated_drops')
+            self.log(f"[SIMULATED DROP] Server → {nickname}", "WARNING")
+
+    def send_session_udp(self, addr, status, token=b''):
+        """Session control datagram (not retransmitted: the client asks again if it is lost)"""
+        self.server.sendto(datagram.pack(DGRAM_SESSION, status, time.time(), token, self.udp_crypto), addr)
+
+    def resume_session_udp(self, addr, token, counter):
+        """
+        RESUME from addr: move the session of token there. The client keeps its
+        nickname, both seq spaces, the replay window, the RTT estimate and
+        the messages waiting for an ACK (retransmitted to the new address now).
+        counter (authenticated in the header) grows with every RESUME a client
+        sends: a captured RESUME replayed from another address cannot move it.
+        """
+        with self.lock:
+            old = self.sessions.get(token)
+            if old is None:
+                nickname = None
+            elif old == addr:
+                nickname = self.clients[addr]  # RESUMED was lost: confirm again
+            elif counter <= self.resume_counters.get(token, 0):
+                self.log(f"⚠️ Replayed RESUME from {addr[0]}:{addr[1]} ignored (counter {counter})", "WARNING")
+                return
+            else:
+                self.resume_counters[token] = counter
+                nickname = self.clients.pop(old)
+                self.clients[addr] = nickname
+                self.client_map[nickname] = addr
+                del self.addr_to_nickname[old]
+                self.addr_to_nickname[addr] = nickname
+                self.sessions[token] = addr
+                self.session_tokens[addr] = self.session_tokens.pop(old)
+                with self.reliability_lock:
+                    for table in (self.replay_windows, self.send_windows, self.ack_trackers,
+                                  self.rtt_estimators, self.acks_owed, self.session_crypto):
+                        if old in table:
+                            table[addr] = table.pop(old)
+                    now = time.time()
+                    moved = [key for key in self.pending_acks if key[0] == old]
+                    for key in moved:
+                        self.pending_acks[(addr, key[1])] = self.pending_acks.pop(key)
+                        self.retransmit_scheduler.cancel(key)
+                        self.retransmit_scheduler.schedule((addr, key[1]), now)
+
+        if nickname is None:
+            self.log(f"⚠️ RESUME with an unknown session from {addr[0]}:{addr[1]}", "WARNING")
+            self.send_session_udp(addr, SESSION_EXPIRED)
+            return
+        self.send_session_udp(addr, SESSION_RESUMED, token)
+        if old != addr:
+            self.count(nickname, 'resumptions')
+            self.log(f"🔁 {nickname} resumed its session: {old[0]}:{old[1]} → {addr[0]}:{addr[1]} ({len(moved)} pending)", "SUCCESS")
+            self.update_clients_list()
+
+    def flush_acks_udp(self, addr=None):
+        """
+        Queue one cumulative ACK (+ SACK blocks) per peer that is owed one (or only
+        to addr); the receive loop sends them with the rest of the batch's datagrams
+        """
+        with self.reliability_lock:
+            if addr is None:
+                owed, self.acks_owed = self.acks_owed, {}
+            else:
+                owed = [addr] if self.acks_owed.pop(addr, None) is not None else []
+            acks = []
+            for peer in owed:
+                tracker = self.ack_trackers.get(peer)
+                if tracker:
+                    acks.append((peer, self.addr_to_nickname.get(peer), tracker.next_expected, tracker.sack_blocks()))
+
+        for peer, nickname, cumulative, blocks in acks:
+            ack_data = datagram.pack(DGRAM_ACK, cumulative, payload=datagram.pack_sack(blocks), crypto=self.crypto_for(peer))
+            if not self.simulate_packet_loss():
+                self.udp_io.queue(ack_data, peer)
+                self.count(nickname, 'acks_sent')
+            else:
+                self.count(nickname, 'simulated_drops')
+                self.log(f"[SIMULATED DROP] ACK to {nickname}", "WARNING")
+
+    def make_outbound_queue(self):
+        return OutboundQueue(self.outbound_max_frames, self.outbound_max_bytes,
+                             self.outbound_policy, self.outbound_block_timeout)
+
+    def get_outbound_queue(self, client):
+        if isinstance(client, TCPConnection):
+            return client.outbound
+        return self.outbound_queues.get(client)
+
+    def queue_tcp(self, client, nickname, frame):
+        """
+        Queue a frame on the client's bounded outbound queue; the I/O layer
+        (event loop or the client's writer thread) writes it. Never writes on
+        the caller's thread, so a stalled client cannot block the sender.
+        """
+        outbound = self.get_outbound_queue(client)
+        try:
+            if isinstance(client, TCPConnection):
+                client.send(frame)
+            elif outbound is not None:
+                outbound.put(frame)
+            else:
+                self.sendall_tcp(client, frame)
+        except OutboundOverflow:
+            self.log(f"⚠️ Outbound queue of {nickname} overflowed ({self.outbound_policy}): disconnecting", "ERROR")
+            if not isinstance(client, TCPConnection):
+                self.remove_client_tcp(client)
+            raise
+
+    def write_client_tcp(self, client, outbound):
+        """Writer thread of a threaded-engine client: drains its outbound queue in batches"""
+        while self.running and not outbound.closed:
+            batch = outbound.wait_take()
+            if not batch:
+                continue
+            try:
+                self.sendall_tcp(client, batch)
+            except Exception:
+                outbound.close()
+                if self.running:
+                    self.remove_client_tcp(client)
+                break
+
+    def sendall_tcp(self, client, data):
+        """sendall to a TCP client; TLS sockets of the threaded engine are written under their lock"""
+        lock = self.ssl_locks.get(client)
+        if lock is None:
+            client.sendall(data)
+        else:
+            with lock:
+                client.sendall(data)
+
+    def recv_tcp(self, client, reader):
+        """
+        Threaded engine read into the client's FrameReader.
+        TLS sockets are also written by other threads (send_to_client, room fan-out),
+        so they are read non-blocking under their lock once select() reports data.
+        Returns the byte count, 0 on EOF, None if nothing could be read yet.
+        """
+        lock = self.ssl_locks.get(client)
+        if lock is None:
+            return reader.recv_from(client)
+        if not client.pending():
+            readable, _, _ = select.select([client], [], [], 1.0)
+            if not readable:
+                return None
+        with lock:
+            client.setblocking(False)
+            try:
+                return reader.recv_from(client)
+            except (ssl.SSLWantReadError, ssl.SSLWantWriteError, BlockingIOError):
+                return None
+            finally:
+                client.setblocking(True)
+
+    def process_message_tcp(self, nickname, payload, send_time):
+        """Traite un message (frame MSG) reçu d'un client TCP (commun aux deux moteurs)"""
+        msg = str(payload, 'utf-8').strip()
+        if not msg:
+            return
+        
+        # Log decryption
+        if self.use_ssl:
+            self.log(f"🔓 Decrypted message from {nickname}", "INFO")
+        
+        latency = None
+        if send_time:
+            latency = (time.time() - send_time) * 1000
+        
+        if msg.startswith(nickname + ': '):
+            clean_msg = msg.replace(nickname + ': ', '', 1)
+        else:
+            clean_msg = msg
+        
+        names = ('received_count', 'encrypted_messages') if self.use_ssl else ('received_count',)
+        self.count(nickname, *names, latency=latency or None)
+        
+        if self.handle_room_command(nickname, clean_msg):
+            return
+        
+        self.log(f"{nickname}: {clean_msg}", "MESSAGE")
+        self.add_to_conversation(nickname, clean_msg, is_server=False)
+
+    def handle_client_tcp(self, client, nickname, reader):
+        while self.running:
+            try:
+                # Les messages arrivent en frames: plusieurs peuvent être fusionnés dans une lecture
+                for frame_type, send_time, payload in reader.frames():
+                    if frame_type == FRAME_MSG:
+                        self.process_message_tcp(nickname, payload, send_time)
                 
-                self.log(f"{nickname}: {clean_msg}", "MESSAGE")
-                self.add_to_conversation(nickname, clean_msg, is_server=False)
+                if self.recv_tcp(client, reader) == 0:
+                    self.remove_client_tcp(client)
+                    break
                 
             except:
                 if self.running:
                     self.remove_client_tcp(client)
                 break
 
+    def register_client_tcp(self, client, nickname):
+        """Enregistre un client TCP après la négociation NICK et envoie le message de bienvenue"""
+        with self.lock:
+            self.clients.append(client)
+            self.nicknames.append(nickname)
+            self.client_map[nickname] = client
+            self.known_nicknames.add(nickname)
+            self.init_client_stats(nickname)
+        self.conversations.reset(nickname)
+        
+        if self.use_ssl:
+            self.log(f"🔒 {nickname} connected with SSL encryption", "SUCCESS")
+        else:
+            self.log(f"{nickname} connected successfully", "SUCCESS")
+        
+        self.update_clients_list()
+        
+        welcome_msg = f"Connected to server! {'🔒 SSL Encryption enabled.' if self.use_ssl else ''} You can now chat with the server."
+        self.queue_tcp(client, nickname, encode_frame(FRAME_MSG, welcome_msg.encode('utf-8'), time.time()))
+        self.flush_mailbox(nickname)
+
     def accept_connections_tcp(self):
         while self.running:
             try:
@@ -272,26 +834,24 @@ class ChatServer:
                         client.close()
                         continue
 
-                client.send("NICK".encode('utf-8'))
-                nickname = client.recv(1024).decode('utf-8').strip()
-                
-                self.clients.append(client)
-                self.nicknames.append(nickname)
-                self.client_map[nickname] = client
-                self.conversations[nickname] = []
-                self.init_client_stats(nickname)
-                
-                if self.use_ssl:
-                    self.log(f"🔒 {nickname} connected with SSL encryption", "SUCCESS")
-                else:
-                    self.log(f"{nickname} connected successfully", "SUCCESS")
-                
-                self.update_clients_list()
+                client.sendall(encode_frame(FRAME_NICK))
+                reader = FrameReader()
+                frame = reader.read_frame(client)
+                if frame is None or frame[0] != FRAME_NICK:
+                    self.log(f"❌ NICK negotiation failed with {addr[0]}:{addr[1]}", "ERROR")
+                    client.close()
+                    continue
+                nickname = str(frame[2], 'utf-8').strip()
                 
-                welcome_msg = f"Connected to server! {'🔒 SSL Encryption enabled.' if self.use_ssl else ''} You can now chat with the server.|TS:{time.time()}|"
-                client.send(welcome_msg.encode('utf-8'))
+                outbound = self.make_outbound_queue()
+                with self.lock:
+                    if isinstance(client, ssl.SSLSocket):
+                        self.ssl_locks[client] = threading.Lock()
+                    self.outbound_queues[client] = outbound
+                threading.Thread(target=self.write_client_tcp, args=(client, outbound), daemon=True).start()
+                self.register_client_tcp(client, nickname)
 
-                threading.Thread(target=self.handle_client_tcp, args=(client, nickname), daemon=True).start()
+                threading.Thread(target=self.handle_client_tcp, args=(client, nickname, reader), daemon=True).start()
             except socket.timeout:
                 continue
             except Exception as e:
@@ -299,284 +859,354 @@ class ChatServer:
                     self.log(f"TCP Accept Error: {e}", "ERROR")
 
     def remove_client_tcp(self, client):
-        if client in self.clients:
+        # Reader, writer and senders of a client may all fail at once: only the first one removes it
+        with self.lock:
+            if client not in self.clients:
+                return
             idx = self.clients.index(client)
             nickname = self.nicknames[idx]
-            self.clients.remove(client)
-            self.nicknames.remove(nickname)
-            if nickname in self.client_map:
+            del self.clients[idx]
+            del self.nicknames[idx]
+            if self.client_map.get(nickname) is client:
                 del self.client_map[nickname]
-            if nickname in self.client_stats:
-                del self.client_stats[nickname]
-            self.log(f"{nickname} disconnected", "WARNING")
-            self.update_clients_list()
-            try:
-                client.close()
-            except:
-                pass
+            self.retire_client_stats(nickname)
+            self.ssl_locks.pop(client, None)
+            outbound = self.outbound_queues.pop(client, None)
+            if outbound is None:
+                outbound = self.get_outbound_queue(client)
+            if outbound is not None:
+                outbound.close()
+                self.retired_outbound_dropped += outbound.dropped
+        if outbound is not None:
+            salvaged = self.salvage_frames(nickname, outbound.drain())
+            if salvaged:
+                self.log(f"📬 {salvaged} unsent message(s) of {nickname} kept in its mailbox", "INFO")
+        self.log(f"{nickname} disconnected", "WARNING")
+        self.leave_all_rooms(nickname)
+        self.update_clients_list()
+        try:
+            client.close()
+        except:
+            pass
 
     def handle_messages_udp(self):
+        # Batched receive: one wakeup drains up to udp_batch datagrams into preallocated
+        # buffers; the ACKs and fast retransmits they trigger leave in one flush per batch
+        udp_io = self.udp_io = DatagramBatch(self.server, self.udp_batch)
         while self.running:
             try:
-                self.server.settimeout(1.0)
-                data, addr = self.server.recvfrom(2048)
-                msg = data.decode('utf-8')
-                
-                # Try to decrypt if encryption is enabled
-                if self.use_ssl and self.udp_crypto and msg.startswith('ENC:'):
-                    try:
-                        msg = self.udp_crypto.decrypt_message(msg)
-                        self.log(f"🔓 Decrypted UDP message from {addr[0]}:{addr[1]}", "INFO")
-                    except Exception as e:
-                        self.log(f"⚠️ Failed to decrypt message: {e}", "ERROR")
-                        continue
+                batch = udp_io.receive(timeout=1.0)
+            except OSError as e:
+                if self.running:
+                    self.log(f"❌ UDP Handler Error: {e}", "ERROR")
+                continue
+            # Pipeline: the batch is decrypted by the crypto threads, then handled here in receive order
+            opened = self.crypto_pipeline.map(self.open_datagram_udp, batch) if self.crypto_pipeline else None
+            for i, (data, addr) in enumerate(batch):
+                try:
+                    self.handle_datagram_udp(data, addr, opened[i] if opened else None)
+                except Exception as e:
+                    if self.running:
+                        self.log(f"❌ UDP Handler Error: {e}", "ERROR")
+            self.flush_acks_udp()
+            udp_io.flush()
+        udp_io.close()
 
-                # Handle DISCONNECT messages
-                if msg.startswith('DISCONNECT:'):
-                    nickname = msg.split(':', 1)[1]
-                    self.log(f"📩 Received DISCONNECT from {nickname} at {addr[0]}:{addr[1]}", "INFO")
-                    
-                    is_connected = False
-                    with self.lock:
-                        is_connected = addr in self.clients
-                    
-                    if is_connected:
-                        self.remove_client_udp(addr)
-                    else:
-                        self.log(f"⚠️ DISCONNECT for unknown address {addr[0]}:{addr[1]}", "WARNING")
-                    continue
+    def open_datagram_udp(self, data, addr):
+        """Parse the binary header; decrypt (and authenticate) the payload if encrypted"""
+        session = self.session_crypto.get(addr)
+        try:
+            return session, datagram.unpack(data, self.udp_crypto, session), None
+        except Exception as e:
+            return session, None, e
 
-                # Handle NEW connections
-                client_exists = False
-                with self.lock:
-                    client_exists = addr in self.clients
-                
-                if not client_exists:
-                    nickname = msg.strip()
-                    
-                    with self.lock:
-                        self.clients[addr] = nickname
-                        self.client_map[nickname] = addr
-                        self.addr_to_nickname[addr] = nickname
-                        self.received_msg_ids[addr] = set()
-                    
-                    self.conversations[nickname] = []
-                    self.init_client_stats(nickname)
-                    
-                    encryption_status = "with AES-256-GCM encryption" if (self.use_ssl and self.udp_crypto) else "No encryption"
-                    self.log(f"✅ {nickname} connected from {addr[0]}:{addr[1]} (UDP - {encryption_status})", "SUCCESS")
-                    self.update_clients_list()
-                    
-                    welcome_msg = f"Connected to server! {'🔒 UDP Encryption enabled (AES-256-GCM)' if (self.use_ssl and self.udp_crypto) else '(UDP mode - no encryption)'}"
-                    with self.lock:
-                        msg_id = self.message_id_counter
-                        self.message_id_counter += 1
-                    welcome_full = f"MSG:{msg_id}:{time.time()}:{welcome_msg}"
-                    
-                    # Encrypt welcome message if encryption enabled
-                    if self.use_ssl and self.udp_crypto:
-                        try:
-                            welcome_full = self.udp_crypto.encrypt_message(welcome_full)
-                        except:
-                            pass
-                    
-                    if not self.simulate_packet_loss():
-                        self.server.sendto(welcome_full.encode('utf-8'), addr)
-                    else:
-                        with self.lock:
-                            if nickname in self.client_stats:
-                                self.client_stats[nickname]['simulated_drops'] += 1
-                        self.log(f"[SIMULATED DROP] Welcome message to {nickname}", "WARNING")
-                    continue
+    def handle_datagram_udp(self, data, addr, opened=None):
+        """
+        One received datagram (a view of a reused buffer: copy what must outlive the call).
+        opened: its open_datagram_udp() result when the crypto pipeline already decrypted it.
+        """
+        session = self.session_crypto.get(addr)
+        if opened is None or opened[0] is not session:
+            # Inline, or a HELLO / RESUME earlier in the batch changed the keys of addr
+            opened = self.open_datagram_udp(data, addr)
+        _, unpacked, e = opened
+        if e is not None:
+            if session is None and datagram.is_session(data):
+                # Session keys in use but unknown address: a client behind a new address
+                self.send_session_udp(addr, SESSION_UNKNOWN)
+                return
+            self.log(f"⚠️ Failed to decode datagram from {addr[0]}:{addr[1]}: {e!r}", "ERROR")
+            return
+        dgram_type, msg_id, send_time, payload = unpacked
+        if session is not None and dgram_type in (DGRAM_MSG, DGRAM_ACK) and not datagram.is_session(data):
+            # A session with its own keys never accepts data sealed with the shared static key
+            self.log(f"⚠️ Dropped statically sealed datagram for the session at {addr[0]}:{addr[1]}", "WARNING")
+            return
+        if self.udp_crypto:
+            self.log(f"🔓 Decrypted UDP message from {addr[0]}:{addr[1]}", "INFO")
 
-                # Handle ACK messages
-                if msg.startswith('ACK:'):
-                    if self.simulate_packet_loss():
-                        with self.lock:
-                            nickname = self.addr_to_nickname.get(addr, "Unknown")
-                            if nickname != "Unknown" and nickname in self.client_stats:
-                                self.client_stats[nickname]['simulated_drops'] += 1
-                        self.log(f"[SIMULATED DROP] ACK from {nickname}", "WARNING")
-                        continue
-                        
-                    try:
-                        msg_id = int(msg.split(':')[1])
-                        with self.lock:
-                            key = (addr, msg_id)
-                            if key in self.pending_acks: #wsal ack meaning nemhi pending
-                                nickname = self.pending_acks[key]['nickname']
-                                send_time = self.pending_acks[key]['timestamp']
-                                latency = (time.time() - send_time) * 1000
-                                
-                                if nickname in self.client_stats:
-                                    self.client_stats[nickname]['ack_count'] += 1
-                                    self.client_stats[nickname]['latency_samples'].append(latency)
-                                    if len(self.client_stats[nickname]['latency_samples']) > 100:
-                                        self.client_stats[nickname]['latency_samples'] = \
-                                            self.client_stats[nickname]['latency_samples'][-100:]
-                                
-                                del self.pending_acks[key]
-                    except Exception as e:
-                        self.log(f"Error processing ACK: {e}", "ERROR")
-                    continue
+        # Handle DISCONNECT messages
+        if dgram_type == DGRAM_DISCONNECT:
+            nickname = str(payload, 'utf-8')
+            self.log(f"📩 Received DISCONNECT from {nickname} at {addr[0]}:{addr[1]}", "INFO")
+            
+            is_connected = False
+            with self.lock:
+                is_connected = addr in self.clients
+            
+            if is_connected:
+                self.remove_client_udp(addr)
+            else:
+                self.log(f"⚠️ DISCONNECT for unknown address {addr[0]}:{addr[1]}", "WARNING")
+            return
 
-                # Handle MSG messages
-                if msg.startswith('MSG:'):
-                    if self.simulate_packet_loss():
-                        with self.lock:
-                            nickname = self.clients.get(addr, "Unknown")
-                            if nickname != "Unknown" and nickname in self.client_stats:
-                                self.client_stats[nickname]['simulated_drops'] += 1
-                        self.log(f"[SIMULATED DROP] Message from {nickname}", "WARNING")
-                        continue
-                    
-                    parts = msg.split(':', 3)
-                    if len(parts) >= 4:
-                        msg_id = int(parts[1])
-                        send_time = float(parts[2])
-                        actual_msg = parts[3]
-                        
-                        nickname = None
-                        with self.lock:
-                            nickname = self.clients.get(addr)
-                        
-                        if not nickname:
-                            self.log(f"⚠️ Received message from unknown address {addr[0]}:{addr[1]}", "WARNING")
+        if dgram_type == DGRAM_RESUME:
+            self.resume_session_udp(addr, bytes(payload), msg_id)
+            return
+
+        # Handle NEW connections
+        client_exists = False
+        with self.lock:
+            client_exists = addr in self.clients
+
+        if not client_exists:
+            if dgram_type != DGRAM_HELLO:
+                # Maybe a known client behind a new address: ask it to resume
+                self.log(f"⚠️ Received message from unknown address {addr[0]}:{addr[1]}", "WARNING")
+                self.send_session_udp(addr, SESSION_UNKNOWN)
+                return
+            nickname, client_public = datagram.split_hello(payload)
+            token = secrets.token_bytes(SESSION_TOKEN_BYTES)
+
+            # X25519 handshake (encrypted mode only): per-session keys, our public key goes back in SESSION_NEW
+            session = None
+            if self.udp_crypto and client_public and len(client_public) == PUBLIC_KEY_BYTES:
+                exchange = KeyExchange()
+                session = exchange.session(client_public, self.udp_crypto.key, initiator=False,
+                                           rekey_messages=self.rekey_messages, rekey_bytes=self.rekey_bytes)
+                session.local_public = exchange.public
+
+            with self.lock:
+                self.clients[addr] = nickname
+                self.client_map[nickname] = addr
+                self.addr_to_nickname[addr] = nickname
+                self.sessions[token] = addr
+                self.session_tokens[addr] = token
+                self.resume_counters[token] = 0
+                if session is not None:
+                    self.session_crypto[addr] = session
+                self.known_nicknames.add(nickname)
+                self.init_client_stats(nickname)
+            with self.reliability_lock:
+                self.replay_windows[addr] = ReplayWindow()
+                self.send_windows[addr] = SendWindow(self.window_size)
+                self.ack_trackers[addr] = AckTracker()
+            
+            self.conversations.reset(nickname)
+            
+            encryption_status = "with AES-256-GCM encryption" if (self.use_ssl and self.udp_crypto) else "No encryption"
+            if session is not None:
+                encryption_status += ", X25519 session keys"
+            self.log(f"✅ {nickname} connected from {addr[0]}:{addr[1]} (UDP - {encryption_status})", "SUCCESS")
+            self.update_clients_list()
+            
+            self.send_session_udp(addr, SESSION_NEW, token + (session.local_public if session else b''))
+            welcome_msg = f"Connected to server! {'🔒 UDP Encryption enabled (AES-256-GCM)' if (self.use_ssl and self.udp_crypto) else '(UDP mode - no encryption)'}"
+            # Seq 0 of the peer's window: delivered reliably like any other message
+            self.send_udp(addr, nickname, welcome_msg.encode('utf-8'))
+            self.flush_mailbox(nickname)
+            return
+
+        if dgram_type == DGRAM_HELLO:
+            # Known address: our SESSION_NEW was lost, send it again (same token and keys)
+            with self.lock:
+                token = self.session_tokens.get(addr)
+                session = self.session_crypto.get(addr)
+            if token is not None:
+                self.send_session_udp(addr, SESSION_NEW, token + (session.local_public if session else b''))
+            return
+
+        # Handle ACK messages
+        if dgram_type == DGRAM_ACK:
+            if self.simulate_packet_loss():
+                nickname = self.addr_to_nickname.get(addr, "Unknown")
+                self.count(nickname, 'simulated_drops')
+                self.log(f"[SIMULATED DROP] ACK from {nickname}", "WARNING")
+                return
+                
+            try:
+                # msg_id is the cumulative ACK; the payload carries SACK blocks
+                sack_blocks = datagram.unpack_sack(payload)
+                now = time.time()
+                with self.reliability_lock:
+                    window = self.send_windows.get(addr)
+                    acked = window.acknowledge(msg_id, sack_blocks) if window else []
+                    rtt_sample = None
+                    for seq in acked:
+                        key = (addr, seq)
+                        entry = self.pending_acks.pop(key, None) #wsal ack meaning nemhi pending
+                        self.retransmit_scheduler.cancel(key)
+                        if entry is None:
                             continue
+                        nickname = entry['nickname']
+                        latency = (now - entry['timestamp']) * 1000
                         
-                        receive_time = time.time()
-                        latency = (receive_time - send_time) * 1000
-                        
-                        is_duplicate = False
-                        with self.lock:
-                            if addr not in self.received_msg_ids:
-                                self.received_msg_ids[addr] = set()
-                            
-                            if msg_id in self.received_msg_ids[addr]:
-                                is_duplicate = True
-                                if nickname in self.client_stats:
-                                    self.client_stats[nickname]['duplicates'] += 1
-                            else:
-                                self.received_msg_ids[addr].add(msg_id)
-                        
-                        ack_data = f"ACK:{msg_id}"
+                        # Karn's rule: an ACK of a retransmitted message is ambiguous
+                        if entry['retries'] == 0 and (rtt_sample is None or seq > rtt_sample[0]):
+                            rtt_sample = (seq, latency)
                         
-                        # Encrypt ACK if encryption enabled
-                        if self.use_ssl and self.udp_crypto:
-                            try:
-                                ack_data = self.udp_crypto.encrypt_message(ack_data)
-                            except:
-                                pass
-                        
-                        if not self.simulate_packet_loss():
-                            self.server.sendto(ack_data.encode('utf-8'), addr)
-                        else:
-                            with self.lock:
-                                if nickname in self.client_stats:
-                                    self.client_stats[nickname]['simulated_drops'] += 1
-                            self.log(f"[SIMULATED DROP] ACK to {nickname}", "WARNING")
-                        
-                        if is_duplicate:
+                        self.count(nickname, 'ack_count', latency=latency)
+                    
+                    # One RTT sample per ACK: the newest message it acknowledges
+                    estimator = self.get_rtt_estimator(addr)
+                    if rtt_sample:
+                        estimator.sample(rtt_sample[1] / 1000)
+                    
+                    # Fast retransmit: seqs below a SACK block are holes; resend them once
+                    # (after one RTT) instead of waiting for their RTO, later losses use the RTO
+                    fast = []
+                    for seq in (window.holes(sack_blocks) if window else []):
+                        key = (addr, seq)
+                        entry = self.pending_acks.get(key)
+                        if entry is None or entry['retries'] or now - entry['timestamp'] < estimator.fast_timeout():
                             continue
-                        
-                        if actual_msg.startswith(nickname + ": "):
-                            clean_msg = actual_msg.replace(nickname + ": ", "", 1)
-                        else:
-                            clean_msg = actual_msg
-                        
-                        with self.lock:
-                            if nickname in self.client_stats:
-                                self.client_stats[nickname]['received_count'] += 1
-                                if self.use_ssl and self.udp_crypto:
-                                    self.client_stats[nickname]['encrypted_messages'] += 1
-                                self.client_stats[nickname]['latency_samples'].append(latency)
-                                if len(self.client_stats[nickname]['latency_samples']) > 100:
-                                    self.client_stats[nickname]['latency_samples'] = \
-                                        self.client_stats[nickname]['latency_samples'][-100:]
-                        
-                        self.log(f"{nickname}: {clean_msg}", "MESSAGE")
-                        self.add_to_conversation(nickname, clean_msg, is_server=False)
+                        entry['timestamp'] = now
+                        entry['retries'] += 1
+                        self.retransmit_scheduler.schedule(key, now + estimator.timeout(entry['retries']))
+                        self.count(entry['nickname'], 'retransmissions')
+                        fast.append(self.resealed_udp(addr, seq, entry))
                 
-            except socket.timeout:
-                continue
+                for data in fast:
+                    if not self.simulate_packet_loss():
+                        self.udp_io.queue(data, addr)
+                
+                # ACKs opened the window: send what was queued behind it
+                self.drain_send_backlog(addr)
             except Exception as e:
-                if self.running:
-                    self.log(f"❌ UDP Handler Error: {e}", "ERROR")
+                self.log(f"Error processing ACK: {e}", "ERROR")
+            return
+
+        # Handle MSG messages
+        if dgram_type == DGRAM_MSG:
+            if self.simulate_packet_loss():
+                nickname = self.clients.get(addr, "Unknown")
+                self.count(nickname, 'simulated_drops')
+                self.log(f"[SIMULATED DROP] Message from {nickname}", "WARNING")
+                return
+            
+            actual_msg = str(payload, 'utf-8')
+            
+            nickname = None
+            with self.lock:
+                nickname = self.clients.get(addr)
+            
+            if not nickname:
+                self.log(f"⚠️ Received message from unknown address {addr[0]}:{addr[1]}", "WARNING")
+                return
+            
+            receive_time = time.time()
+            latency = (receive_time - send_time) * 1000
+            
+            is_duplicate = False
+            with self.reliability_lock:
+                if addr not in self.replay_windows:
+                    self.replay_windows[addr] = ReplayWindow()
+                
+                # Bounded bitmap window: constant memory however long the session lives
+                if not self.replay_windows[addr].accept(msg_id):
+                    is_duplicate = True
+                    self.count(nickname, 'duplicates')
+                
+                tracker = self.ack_trackers.get(addr)
+                if tracker is None:
+                    tracker = self.ack_trackers[addr] = AckTracker()
+                out_of_order = tracker.record(msg_id)
+                self.acks_owed[addr] = self.acks_owed.get(addr, 0) + 1
+                ack_now = is_duplicate or out_of_order or self.acks_owed[addr] >= self.ack_every
+            
+            # ACKs are coalesced: sent at the end of the batch, every ack_every messages,
+            # or for gaps/duplicates (the sender needs the SACK info) - all in the batch's flush
+            if ack_now:
+                self.flush_acks_udp(addr)
+            
+            if is_duplicate:
+                return
+            
+            if actual_msg.startswith(nickname + ": "):
+                clean_msg = actual_msg.replace(nickname + ": ", "", 1)
+            else:
+                clean_msg = actual_msg
+            
+            if self.use_ssl and self.udp_crypto:
+                self.count(nickname, 'received_count', 'encrypted_messages', latency=latency)
+            else:
+                self.count(nickname, 'received_count', latency=latency)
+            
+            if self.handle_room_command(nickname, clean_msg):
+                return
+            
+            self.log(f"{nickname}: {clean_msg}", "MESSAGE")
+            self.add_to_conversation(nickname, clean_msg, is_server=False)
 
     def retransmit_pending_udp(self):
         """Retransmit messages - disconnect ONLY the specific failing client"""
         while self.running:
             try:
-                time.sleep(0.1)
-                current_time = time.time()
-                
-                messages_to_check = []
-                with self.lock:
-                    for key, data in list(self.pending_acks.items()):
-                        addr, msg_id = key
-                        if addr in self.clients:
-                            messages_to_check.append((
-                                addr,
-                                msg_id,
-                                data['data'],
-                                data['timestamp'],
-                                data['retries'],
-                                data['nickname']
-                            ))
+                # Sleeps until the next ACK deadline; only expired entries are returned
+                due = self.retransmit_scheduler.wait_due(timeout=1.0)
+                if not due:
+                    continue
                 
                 to_retransmit = []
                 clients_to_disconnect = {}
+                failed_counts = {}
                 
-                for addr, msg_id, data, timestamp, retries, nickname in messages_to_check:
-                    elapsed = current_time - timestamp
-                    
-                    if elapsed > self.ack_timeout:
-                        if retries < self.max_retries:
-                            to_retransmit.append((addr, msg_id, data, nickname))
+                with self.reliability_lock:
+                    for key in due:
+                        data = self.pending_acks.get(key)
+                        if data is None:
+                            continue
+                        addr, msg_id = key
+                        if addr not in self.clients:
+                            # Client already removed: forget its pending message
+                            del self.pending_acks[key]
+                            continue
+                        
+                        if data['retries'] < self.max_retries:
+                            to_retransmit.append((addr, msg_id, self.resealed_udp(addr, msg_id, data), data['nickname']))
                         else:
-                            clients_to_disconnect[addr] = nickname
-                            self.log(f"⚠️ Client {nickname} ({addr[0]}:{addr[1]}) will be disconnected after {self.max_retries} failed retries", "ERROR")
+                            clients_to_disconnect[addr] = data['nickname']
+                            failed_counts[addr] = failed_counts.get(addr, 0) + 1
 
-                if clients_to_disconnect:
-                    with self.lock:
-                        for addr, nickname in clients_to_disconnect.items():
-                            if nickname in self.client_stats:
-                                failed_count = sum(1 for a, m, d, t, r, n in messages_to_check 
-                                                 if a == addr and (current_time - t) > self.ack_timeout and r >= self.max_retries)
-                                self.client_stats[nickname]['packet_loss'] += failed_count
-                            
-                            keys_to_remove = [k for k in list(self.pending_acks.keys()) if k[0] == addr]
-                            for k in keys_to_remove:
-                                if k in self.pending_acks:
-                                    del self.pending_acks[k]
+                for addr, nickname in clients_to_disconnect.items():
+                    self.log(f"⚠️ Client {nickname} ({addr[0]}:{addr[1]}) will be disconnected after {self.max_retries} failed retries", "ERROR")
+
+                # Their pending messages are moved to the mailbox by remove_client_udp
+                for addr, nickname in clients_to_disconnect.items():
+                    stats = self.client_stats.get(nickname)
+                    if stats is not None:
+                        stats.add('packet_loss', failed_counts[addr])
                 
                 for addr, msg_id, data, nickname in to_retransmit:
                     if addr in clients_to_disconnect:
                         continue
-                        
-                    client_exists = False
-                    with self.lock:
-                        client_exists = addr in self.clients
-                    
-                    if not client_exists:
-                        continue
                     
                     try:
                         if not self.simulate_packet_loss():
                             self.server.sendto(data, addr)
                         else:
-                            with self.lock:
-                                if nickname in self.client_stats:
-                                    self.client_stats[nickname]['simulated_drops'] += 1
+                            self.count(nickname, 'simulated_drops')
                             self.log(f"[SIMULATED DROP] Retransmit to {nickname}", "WARNING")
                         
-                        with self.lock:
+                        with self.reliability_lock:
                             key = (addr, msg_id)
                             if key in self.pending_acks:
-                                self.pending_acks[key]['timestamp'] = time.time()
+                                now = time.time()
+                                self.pending_acks[key]['timestamp'] = now
                                 self.pending_acks[key]['retries'] += 1
-                                if nickname in self.client_stats:
-                                    self.client_stats[nickname]['retransmissions'] += 1
+                                rto = self.get_rtt_estimator(addr).timeout(self.pending_acks[key]['retries'])
+                                self.retransmit_scheduler.schedule(key, now + rto)
+                                self.count(nickname, 'retransmissions')
                     except Exception as e:
                         self.log(f"Retransmit error for {nickname}: {e}", "ERROR")
                         clients_to_disconnect[addr] = nickname
@@ -619,16 +1249,41 @@ class ChatServer:
             if addr in self.addr_to_nickname:
                 del self.addr_to_nickname[addr]
             
-            if nickname in self.client_stats:
-                del self.client_stats[nickname]
+            token = self.session_tokens.pop(addr, None)
+            if token is not None:
+                self.sessions.pop(token, None)
+                self.resume_counters.pop(token, None)
+            self.session_crypto.pop(addr, None)
+            
+            self.retire_client_stats(nickname)
             
-            if addr in self.received_msg_ids:
-                del self.received_msg_ids[addr]
+            with self.reliability_lock:
+                if addr in self.replay_windows:
+                    del self.replay_windows[addr]
+                
+                # Unacknowledged and backlogged chat messages go to the mailbox, in seq order
+                unacked = sorted((k[1], entry['payload']) for k, entry in self.pending_acks.items() if k[0] == addr)
+                for key in [(addr, msg_id) for msg_id, _ in unacked]:
+                    del self.pending_acks[key]
+                    self.retransmit_scheduler.cancel(key)
+                window = self.send_windows.get(addr)
+                undelivered = [payload for _, payload in unacked] + [payload for _, payload in (window.backlog if window else ())]
+                
+                self.rtt_estimators.pop(addr, None)
+                self.send_windows.pop(addr, None)
+                self.ack_trackers.pop(addr, None)
+                self.acks_owed.pop(addr, None)
             
             clients_after = len(self.clients)
             remaining = list(self.clients.values())
         
         if nickname:
+            now = time.time()
+            salvaged = sum(1 for payload in undelivered
+                           if isinstance(payload, Mail) and self.mailboxes.put(nickname, bytes(payload), now))
+            if salvaged:
+                self.log(f"📬 {salvaged} unacknowledged message(s) of {nickname} kept in its mailbox", "INFO")
+            self.leave_all_rooms(nickname)
             self.log(f"✅ Removed {nickname} ({addr[0]}:{addr[1]}). Clients: {clients_before} → {clients_after}", "WARNING")
             if remaining:
                 self.log(f"📋 Remaining clients: {', '.join(remaining)}", "INFO")
@@ -638,6 +1293,10 @@ class ChatServer:
 
     def start(self):
         try:
+            if self.message_log_dir:
+                self.message_log = MessageLog(self.message_log_dir)
+                self.log(f"📜 Message log: {len(self.message_log)} messages in {len(self.message_log.segments)} segment(s) at {self.message_log_dir}", "INFO")
+            
             if self.protocol == 'TCP':
                 self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self.clients = []
@@ -645,7 +1304,6 @@ class ChatServer:
                 self.client_map = {}
                 self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                 self.server.bind((self.host, self.port))
-                self.server.listen()
                 self.running = True
                 
                 if self.use_ssl:
@@ -653,13 +1311,28 @@ class ChatServer:
                 else:
                     self.log(f"TCP Server started on {self.host}:{self.port}", "SUCCESS")
                 
-                threading.Thread(target=self.accept_connections_tcp, daemon=True).start()
+                if self.tcp_mode == 'eventloop':
+                    self.server.listen(1024)
+                    self.tcp_engine = EventLoopTCPEngine(self)
+                    self.log("⚡ TCP engine: single event loop (selectors)", "INFO")
+                    threading.Thread(target=self.tcp_engine.run, daemon=True).start()
+                else:
+                    self.server.listen()
+                    threading.Thread(target=self.accept_connections_tcp, daemon=True).start()
             else:
                 self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
                 self.clients = {}
                 self.client_map = {}
                 self.addr_to_nickname = {}
-                self.received_msg_ids = {}
+                self.replay_windows = {}
+                # Room fan-out makes every member ACK at once: a larger receive buffer
+                # absorbs the burst instead of dropping ACKs (capped by net.core.rmem_max)
+                try:
+                    self.server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.udp_rcvbuf)
+                except OSError:
+                    pass
+                if self.udp_reuseport:
+                    self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
                 self.server.bind((self.host, self.port))
                 self.running = True
                 
@@ -669,8 +1342,23 @@ class ChatServer:
                     self.log(f"UDP Server started on {self.host}:{self.port} (No encryption)", "SUCCESS")
                 
                 self.log(f"⚠️ Packet Loss Simulation: {self.packet_loss_rate*100:.0f}%", "WARNING")
+                if self.crypto_workers > 0 and self.udp_crypto:
+                    self.crypto_pipeline = CryptoPipeline(self.crypto_workers)
+                    self.log(f"🧵 AES-GCM pipeline: {self.crypto_workers} crypto thread(s)", "INFO")
                 threading.Thread(target=self.handle_messages_udp, daemon=True).start()
                 threading.Thread(target=self.retransmit_pending_udp, daemon=True).start()
+            
+            if not getattr(sys, '_is_gil_enabled', lambda: True)():
+                self.log("🧵 Free-threaded interpreter (no GIL): client threads run in parallel", "INFO")
+            
+            if self.metrics_port is not None:
+                try:
+                    self.metrics_exporter = MetricsExporter(self, self.metrics_host, self.metrics_port)
+                    self.metrics_exporter.start()
+                    self.log(f"📈 Metrics exporter on http://{self.metrics_host}:{self.metrics_exporter.port}/metrics", "INFO")
+                except OSError as e:
+                    self.metrics_exporter = None
+                    self.log(f"⚠️ Metrics exporter failed to start: {e}", "WARNING")
             return True
         except Exception as e:
             self.log(f"Start Server Error: {e}", "ERROR")
@@ -678,6 +1366,18 @@ class ChatServer:
 
     def stop(self):
         self.running = False
+        if self.metrics_exporter:
+            self.metrics_exporter.stop()
+            self.metrics_exporter = None
+        if self.message_log is not None:
+            message_log, self.message_log = self.message_log, None
+            message_log.close()
+        if self.tcp_engine:
+            self.tcp_engine.stop()
+            self.tcp_engine = None
+        if self.crypto_pipeline is not None:
+            crypto_pipeline, self.crypto_pipeline = self.crypto_pipeline, None
+            crypto_pipeline.close()
         if self.protocol == 'TCP':
             for c in self.clients[:]:
                 try:
@@ -687,14 +1387,33 @@ class ChatServer:
             self.clients = []
             self.nicknames = []
             self.client_map = {}
+            self.ssl_locks = {}
+            for outbound in self.outbound_queues.values():
+                outbound.close()
+            self.outbound_queues = {}
         else:
             self.clients = {}
             self.client_map = {}
             self.addr_to_nickname = {}
-            self.received_msg_ids = {}
+            self.sessions = {}
+            self.session_tokens = {}
+            self.resume_counters = {}
+            self.session_crypto = {}
+            self.replay_windows = {}
+            self.rtt_estimators = {}
+            self.send_windows = {}
+            self.ack_trackers = {}
+            self.acks_owed = {}
         
         self.client_stats = {}
+        self.retired_stats = ClientStats()
+        self.retired_outbound_dropped = 0
+        self.conversations.close()
+        self.mailboxes.clear()
+        self.known_nicknames = set()
+        self.rooms = {}
         self.pending_acks = {}
+        self.retransmit_scheduler.clear()
         
         if self.server:
             try:
@@ -707,77 +1426,88 @@ class ChatServer:
 
     def get_client_stats(self, nickname):
         """Get statistics for a specific client"""
-        with self.lock:
-            if nickname not in self.client_stats:
-                return None
-            
-            stats = self.client_stats[nickname].copy()
-            
-            avg_latency = 0.0
-            min_latency = 0.0
-            max_latency = 0.0
-            
-            if stats['latency_samples']:
-                avg_latency = sum(stats['latency_samples']) / len(stats['latency_samples'])
-                min_latency = min(stats['latency_samples'])
-                max_latency = max(stats['latency_samples'])
-            
-            packet_loss_rate = (stats['packet_loss'] / stats['sent_count'] * 100) if stats['sent_count'] > 0 else 0.0
-            duplicate_rate = (stats['duplicates'] / stats['received_count'] * 100) if stats['received_count'] > 0 else 0.0
-            
+        client_stats = self.client_stats.get(nickname)
+        if client_stats is None:
+            return None
+        
+        # Aggregated on demand from the client's own stats shard (no global lock);
+        # windowed view (last 1024 samples) + lifetime histogram percentiles
+        stats = client_stats.snapshot()
+        latency_window = stats['latency_window']
+        lifetime = stats['latency_lifetime']
+        
+        packet_loss_rate = (stats['packet_loss'] / stats['sent_count'] * 100) if stats['sent_count'] > 0 else 0.0
+        duplicate_rate = (stats['duplicates'] / stats['received_count'] * 100) if stats['received_count'] > 0 else 0.0
+        
+        rto = self.ack_timeout
+        srtt = 0.0
+        queued_count = 0
+        outbound_bytes = 0
+        outbound_dropped = 0
+        client = self.client_map.get(nickname) if self.protocol == 'TCP' else None
+        if client is not None:
+            outbound = self.get_outbound_queue(client)
+            if outbound:
+                queued_count = len(outbound)
+                outbound_bytes = outbound.bytes
+                outbound_dropped = outbound.dropped
+        
+        with self.reliability_lock:
             pending_count = 0
             for k, v in self.pending_acks.items():
                 if v.get('nickname') == nickname:
                     pending_count += 1
             
-            return {
-                'sent_count': stats['sent_count'],
-                'received_count': stats['received_count'],
-                'ack_count': stats['ack_count'],
-                'retransmissions': stats['retransmissions'],
-                'packet_loss': stats['packet_loss'],
-                'packet_loss_rate': packet_loss_rate,
-                'duplicates': stats['duplicates'],
-                'duplicate_rate': duplicate_rate,
-                'avg_latency': avg_latency,
-                'min_latency': min_latency,
-                'max_latency': max_latency,
-                'pending_messages': pending_count,
-                'simulated_drops': stats['simulated_drops'],
-                'configured_loss_rate': self.packet_loss_rate * 100,
-                'ack_timeout': self.ack_timeout,
-                'max_retries': self.max_retries,
-                'encrypted_messages': stats.get('encrypted_messages', 0),
-                'ssl_enabled': (self.use_ssl and self.protocol == 'TCP') or (self.use_ssl and self.udp_crypto and self.protocol == 'UDP')
-            }
+            addr = self.client_map.get(nickname) if self.protocol == 'UDP' else None
+            estimator = self.rtt_estimators.get(addr)
+            if estimator:
+                rto = estimator.rto
+                srtt = (estimator.srtt or 0.0) * 1000
+            window = self.send_windows.get(addr)
+            if window:
+                queued_count = len(window.backlog)
+        
+        return {
+            'sent_count': stats['sent_count'],
+            'received_count': stats['received_count'],
+            'ack_count': stats['ack_count'],
+            'retransmissions': stats['retransmissions'],
+            'packet_loss': stats['packet_loss'],
+            'packet_loss_rate': packet_loss_rate,
+            'duplicates': stats['duplicates'],
+            'duplicate_rate': duplicate_rate,
+            'avg_latency': latency_window['avg'],
+            'min_latency': latency_window['min'],
+            'max_latency': latency_window['max'],
+            'p50_latency': latency_window['p50'],
+            'p95_latency': latency_window['p95'],
+            'p99_latency': latency_window['p99'],
+            'p999_latency': latency_window['p999'],
+            'latency_lifetime': lifetime,
+            'pending_messages': pending_count,
+            'queued_messages': queued_count,
+            'outbound_bytes': outbound_bytes,
+            'outbound_dropped': outbound_dropped,
+            'outbound_policy': self.outbound_policy,
+            'acks_sent': stats['acks_sent'],
+            'simulated_drops': stats['simulated_drops'],
+            'configured_loss_rate': self.packet_loss_rate * 100,
+            'ack_timeout': self.ack_timeout,
+            'rto': rto,
+            'srtt': srtt,
+            'max_retries': self.max_retries,
+            'encrypted_messages': stats.get('encrypted_messages', 0),
+            'resumptions': stats['resumptions'],
+            'ssl_enabled': (self.use_ssl and self.protocol == 'TCP') or (self.use_ssl and self.udp_crypto and self.protocol == 'UDP')
+        }
 
-    def process_queues(self):
-        while not self.log_queue.empty():
-            try:
-                log = self.log_queue.get_nowait()
-                st.session_state.server_logs.append(log)
-            except queue.Empty:
-                break
+    def get_server_stats(self):
+        """Server-wide counter totals (connected + disconnected clients), summed on demand"""
+        with self.lock:
+            stats = list(self.client_stats.values())
+        return aggregate(stats + [self.retired_stats])
 
-        while not self.clients_queue.empty():
-            try:
-                clients_list = self.clients_queue.get_nowait()
-                st.session_state.connected_clients = clients_list
-            except queue.Empty:
-                break
-        
-        while not self.conversations_queue.empty():
-            try:
-                conv_update = self.conversations_queue.get_nowait()
-                nickname = conv_update['nickname']
-                message = conv_update['message']
-                
-                if 'server_conversations' not in st.session_state:
-                    st.session_state.server_conversations = {}
-                
-                if nickname not in st.session_state.server_conversations:
-                    st.session_state.server_conversations[nickname] = []
-                
-                st.session_state.server_conversations[nickname].append(message)
-            except queue.Empty:
-                break
\ No newline at end of file
+    def process_queues(self):
+        """Streamlit GUI only: streamlit is imported lazily by the adapter, never by a headless server"""
+        from gui_adapter import process_server_queues
+        process_server_queues(self)
@@ -0,0 +1,166 @@
+import collections
+import json
+import os
+import struct
+import tempfile
+import threading
+from array import array
+
+RECORD_HEADER = struct.Struct('!I')  # length of the JSON record that follows
+
+
+FLUSH_BYTES = 64 * 1024
+COMPACT_BYTES = 1024 * 1024  # orphaned bytes before the spill segment is compacted
+
+
+class ConversationStore:
+    """
+    Conversation history of every client with a bounded memory footprint.
+    The last `tail` messages of each client stay in memory; older ones are
+    appended to a spill segment (one append-only scratch file shared by all
+    clients) and only read back, one page at a time, when the UI scrolls up.
+    Memory per client is the tail plus 12 bytes per spilled message (offset
+    and length of its record). Spilled records are written in 64 KB batches.
+    Records orphaned by reset() are reclaimed: the segment is truncated once
+    nothing refers to it, and compacted when orphans outweigh live records.
+    """
+
+    def __init__(self, tail=200, spill_dir=None):
+        self.tail_size = tail
+        self.spill_dir = spill_dir
+        self.lock = threading.Lock()
+        self._tails = {}      # nickname -> deque of the most recent messages
+        self._offsets = {}    # nickname -> array('Q') of spilled record offsets
+        self._lengths = {}    # nickname -> array('I') of spilled record lengths
+        self._fd = None
+        self._path = None
+        self._size = 0              # segment size, including the unflushed batch
+        self._live = 0              # bytes of the records an index still refers to
+        self._batch = bytearray()   # spilled records not written yet
+
+    def __contains__(self, nickname):
+        return nickname in self._tails
+
+    def _spill(self, nickname, message):
+        if self._fd is None:
+            fd, self._path = tempfile.mkstemp(prefix='chathub-conv-', suffix='.seg', dir=self.spill_dir)
+            os.close(fd)
+            self._fd = os.open(self._path, os.O_RDWR | os.O_APPEND)
+            self._size = 0
+        data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        self._batch += RECORD_HEADER.pack(len(data))
+        self._batch += data
+        if len(self._batch) >= FLUSH_BYTES:
+            self._flush()
+        self._offsets.setdefault(nickname, array('Q')).append(self._size + RECORD_HEADER.size)
+        self._lengths.setdefault(nickname, array('I')).append(len(data))
+        self._size += RECORD_HEADER.size + len(data)
+        self._live += RECORD_HEADER.size + len(data)
+
+    def _flush(self):
+        if self._batch:
+            os.write(self._fd, self._batch)
+            self._batch = bytearray()
+
+    def append(self, nickname, message):
+        with self.lock:
+            tail = self._tails.get(nickname)
+            if tail is None:
+                tail = self._tails[nickname] = collections.deque()
+            if len(tail) >= self.tail_size:
+                self._spill(nickname, tail.popleft())
+            tail.append(message)
+
+    def recent(self, nickname):
+        """In-memory tail (oldest first)"""
+        with self.lock:
+            return list(self._tails.get(nickname, ()))
+
+    def spilled(self, nickname):
+        """Number of messages of nickname that only exist in the spill segment"""
+        with self.lock:
+            return len(self._offsets.get(nickname, ()))
+
+    def count(self, nickname):
+        with self.lock:
+            return len(self._offsets.get(nickname, ())) + len(self._tails.get(nickname, ()))
+
+    def page(self, nickname, page=0, page_size=50):
+        """
+        Spilled messages by page, counting back from the newest spilled one:
+        page 0 is what comes right before the in-memory tail. Oldest first.
+        """
+        with self.lock:
+            offsets = self._offsets.get(nickname)
+            if not offsets:
+                return []
+            end = len(offsets) - page * page_size
+            if end <= 0:
+                return []
+            start = max(0, end - page_size)
+            records = [(offsets[i], self._lengths[nickname][i]) for i in range(start, end)]
+            self._flush()
+            fd = self._fd
+            # pread under the lock: close() must not pull the file away mid-read
+            return [json.loads(os.pread(fd, length, offset)) for offset, length in records]
+
+    def reset(self, nickname):
+        """Start a fresh conversation (client registered again); its spilled records are orphaned"""
+        with self.lock:
+            self._tails[nickname] = collections.deque()
+            self._offsets.pop(nickname, None)
+            lengths = self._lengths.pop(nickname, None)
+            if lengths is None:
+                return
+            self._live -= RECORD_HEADER.size * len(lengths) + sum(lengths)
+            if not self._live:
+                # Nothing refers to the segment any more: start it over
+                os.ftruncate(self._fd, 0)
+                self._batch = bytearray()
+                self._size = 0
+            elif self._size - self._live >= max(self._live, COMPACT_BYTES):
+                self._compact()
+
+    def _compact(self):
+        """Copy the records still referenced to a new segment and drop the old one (lock held)"""
+        self._flush()
+        fd, path = tempfile.mkstemp(prefix='chathub-conv-', suffix='.seg', dir=self.spill_dir)
+        os.close(fd)
+        fd = os.open(path, os.O_RDWR | os.O_APPEND)
+        batch = bytearray()
+        size = 0
+        for nickname, offsets in self._offsets.items():
+            moved = array('Q')
+            for offset, length in zip(offsets, self._lengths[nickname]):
+                batch += RECORD_HEADER.pack(length)
+                moved.append(size + len(batch))
+                batch += os.pread(self._fd, length, offset)
+                if len(batch) >= FLUSH_BYTES:
+                    os.write(fd, batch)
+                    size += len(batch)
+                    batch = bytearray()
+            self._offsets[nickname] = moved
+        os.write(fd, batch)
+        os.close(self._fd)
+        try:
+            os.unlink(self._path)
+        except OSError:
+            pass
+        self._fd, self._path = fd, path
+        self._size = self._live = size + len(batch)
+
+    def close(self):
+        """Forget every conversation and delete the spill segment"""
+        with self.lock:
+            self._tails = {}
+            self._offsets = {}
+            self._lengths = {}
+            self._batch = bytearray()
+            self._size = self._live = 0
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+                try:
+                    os.unlink(self._path)
+                except OSError:
+                    pass
@@ -0,0 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CryptoPipeline:
+    """
+    AES-GCM off the thread that runs the protocol. The cryptography library
+    releases the GIL inside encrypt/decrypt, so datagrams of one batch are
+    sealed or opened by `workers` threads at once, then handed back in the
+    order of the batch: the state machine (seqs, replay windows, ACKs) still
+    runs on one thread and sees the datagrams in receive order.
+
+    A batch is cut into one contiguous chunk per thread, the calling thread
+    taking the first one: handing over each datagram alone would cost more
+    than its decryption (about 2 µs for 1 KB).
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='crypto') if workers > 0 else None
+        self.batches = 0
+        self.offloaded = 0
+
+    def map(self, func, items):
+        """[func(*item) for item in items], the chunks after the first computed by the pool"""
+        executor = self.executor
+        if executor is None or len(items) < 2:
+            return [func(*item) for item in items]
+        chunks = min(self.workers + 1, len(items))
+        size = -(-len(items) // chunks)
+        try:
+            futures = [executor.submit(_run_chunk, func, items[start:start + size])
+                       for start in range(size, len(items), size)]
+        except RuntimeError:  # closed meanwhile (server stopping): finish inline
+            return [func(*item) for item in items]
+        results = _run_chunk(func, items[:size])
+        for future in futures:
+            results.extend(future.result())
+        self.batches += 1
+        self.offloaded += len(items) - size
+        return results
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+def _run_chunk(func, items):
+    return [func(*item) for item in items]
@@ -0,0 +1,109 @@
+import struct
+
+# Datagram header: version, type, flags, msg_id, send timestamp (15 bytes)
+# With encryption the header is sent in clear and authenticated as AES-GCM associated data:
+#   header | nonce (12) | ciphertext + tag (16)
+HEADER = struct.Struct('!BBBId')
+VERSION = 1
+MAX_DATAGRAM = 2048  # receive size, and size of the reusable pack/unpack buffers
+
+# ACK payload: SACK blocks [start, end) received above the cumulative ACK (header msg_id)
+SACK_BLOCK = struct.Struct('!II')
+
+DGRAM_HELLO = 1       # client -> server: nickname
+DGRAM_MSG = 2         # chat message (utf-8 text)
+DGRAM_ACK = 3         # cumulative ACK: every msg_id below header msg_id received, + SACK blocks
+DGRAM_DISCONNECT = 4  # client -> server: nickname
+DGRAM_SESSION = 5     # server -> client: session status (header msg_id) + session token
+DGRAM_RESUME = 6      # client -> server: session token, to move the session to a new address
+
+# DGRAM_SESSION status, carried in the header msg_id
+SESSION_NEW = 0       # token of the session created by a HELLO
+SESSION_RESUMED = 1   # the session now lives at the address the RESUME came from
+SESSION_UNKNOWN = 2   # datagram from an address without a session: send RESUME (or HELLO)
+SESSION_EXPIRED = 3   # unknown token: the session is gone, start over with HELLO
+
+SESSION_TOKEN_BYTES = 16
+
+FLAG_ENCRYPTED = 0x01
+FLAG_SESSION = 0x02    # sealed with the per-session keys (X25519 handshake), not the static key
+
+
+class DatagramError(ValueError):
+    pass
+
+
+def pack(dgram_type, msg_id=0, send_time=0.0, payload=b'', crypto=None):
+    """Build a datagram; the payload is encrypted when a UDPCrypto (or SessionCrypto) is given"""
+    flags = (FLAG_ENCRYPTED | (FLAG_SESSION if crypto.session else 0)) if crypto else 0
+    header = HEADER.pack(VERSION, dgram_type, flags, msg_id, send_time)
+    if crypto:
+        return header + crypto.seal(payload, header)
+    return header + payload
+
+
+def pack_into(buf, dgram_type, msg_id=0, send_time=0.0, payload=b'', crypto=None):
+    """
+    pack() into a preallocated buffer (e.g. bytearray(MAX_DATAGRAM)) instead of
+    new bytes: returns a memoryview of the datagram, valid until buf is reused.
+    Allocation per datagram does not grow with the payload, but with
+    cryptography's encrypt_into it is slower than pack() for chat-sized payloads
+    """
+    flags = (FLAG_ENCRYPTED | (FLAG_SESSION if crypto.session else 0)) if crypto else 0
+    header = HEADER.pack(VERSION, dgram_type, flags, msg_id, send_time)
+    buf[:HEADER.size] = header
+    if crypto:
+        end = crypto.seal_into(buf, HEADER.size, payload, header)
+    else:
+        end = HEADER.size + len(payload)
+        buf[HEADER.size:end] = payload
+    return memoryview(buf)[:end]
+
+
+def unpack(data, crypto=None, session=None, buf=None):
+    """
+    Parse a datagram into (type, msg_id, send_time, payload)
+    Encrypted payloads are decrypted and authenticated against the header,
+    with the session keys when the header says so, else the static key.
+    With buf the plaintext is decrypted into it (no new bytes): the payload
+    is then only valid until buf is reused.
+    """
+    if len(data) < HEADER.size:
+        raise DatagramError(f"Datagram too short: {len(data)} bytes")
+    version, dgram_type, flags, msg_id, send_time = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise DatagramError(f"Unsupported datagram version {version}")
+
+    view = memoryview(data)
+    if flags & FLAG_SESSION:
+        if session is None:
+            raise DatagramError("Session-encrypted datagram but no session keys")
+        payload = session.open_into(view[HEADER.size:], view[:HEADER.size], buf)
+    elif flags & FLAG_ENCRYPTED:
+        if crypto is None:
+            raise DatagramError("Encrypted datagram but encryption is disabled")
+        payload = (crypto.open(view[HEADER.size:], view[:HEADER.size]) if buf is None
+                   else crypto.open_into(view[HEADER.size:], view[:HEADER.size], buf))
+    else:
+        payload = view[HEADER.size:]
+    return dgram_type, msg_id, send_time, payload
+
+
+def is_session(data):
+    """True if the datagram was sealed with session keys"""
+    return len(data) >= HEADER.size and bool(data[2] & FLAG_SESSION)
+
+
+def split_hello(payload):
+    """HELLO payload -> (nickname, client public key or None): nickname [NUL public key]"""
+    nickname, sep, public = bytes(payload).partition(b'\0')
+    return str(nickname, 'utf-8').strip(), (public if sep else None)
+
+
+def pack_sack(blocks):
+    return b''.join(SACK_BLOCK.pack(start, end) for start, end in blocks)
+
+
+def unpack_sack(payload):
+    return [SACK_BLOCK.unpack_from(payload, offset)
+            for offset in range(0, len(payload) - SACK_BLOCK.size + 1, SACK_BLOCK.size)]
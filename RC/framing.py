@@ -0,0 +1,101 @@
+import struct
+
+# Frame header: version, frame type, payload length, send timestamp (replaces the old "|TS:" suffix)
+HEADER = struct.Struct('!BBId')
+VERSION = 1
+
+FRAME_NICK = 1  # server -> client: nickname request / client -> server: nickname
+FRAME_MSG = 2   # chat message (utf-8 text)
+
+MAX_PAYLOAD = 1 << 20
+
+
+class FrameError(ValueError):
+    pass
+
+
+def encode_frame(frame_type, payload=b'', send_time=0.0):
+    """Build one frame: fixed header followed by the payload bytes"""
+    if len(payload) > MAX_PAYLOAD:
+        raise FrameError(f"Payload too large: {len(payload)} bytes")
+    return HEADER.pack(VERSION, frame_type, len(payload), send_time) + payload
+
+
+class FrameReader:
+    """
+    Incremental frame parser over a reusable bytearray.
+    Frames are returned as (type, send_time, payload) where payload is a
+    memoryview into the buffer: it is only valid until the next recv/feed,
+    so decode or copy it before reading more data.
+    """
+
+    def __init__(self, size=2048):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0  # first unparsed byte
+        self.end = 0    # end of received data
+
+    def _make_room(self, needed):
+        """Ensure at least `needed` free bytes after self.end"""
+        if len(self.buf) - self.end >= needed:
+            return
+        pending = self.end - self.start
+        if pending + needed <= len(self.buf):
+            # Compact: move the unparsed tail to the front (same buffer, memmove)
+            self.view[:pending] = self.view[self.start:self.end]
+        else:
+            # Grow into a new buffer; outstanding payload views keep the old one alive
+            new_buf = bytearray(max(len(self.buf) * 2, pending + needed))
+            new_buf[:pending] = self.view[self.start:self.end]
+            self.buf = new_buf
+            self.view = memoryview(new_buf)
+        self.start = 0
+        self.end = pending
+
+    def recv_from(self, sock, size=2048):
+        """recv_into the buffer; returns the number of bytes read (0 on EOF)"""
+        self._make_room(size)
+        n = sock.recv_into(self.view[self.end:], size)
+        self.end += n
+        return n
+
+    def feed(self, data):
+        self._make_room(len(data))
+        self.buf[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def next_frame(self):
+        """Return the next complete frame, or None if more data is needed"""
+        available = self.end - self.start
+        if available < HEADER.size:
+            return None
+        version, frame_type, length, send_time = HEADER.unpack_from(self.buf, self.start)
+        if version != VERSION:
+            raise FrameError(f"Unsupported frame version {version}")
+        if length > MAX_PAYLOAD:
+            raise FrameError(f"Frame too large: {length} bytes")
+        if available < HEADER.size + length:
+            if HEADER.size + length > len(self.buf) - self.start:
+                self._make_room(HEADER.size + length - available)
+            return None
+        payload_start = self.start + HEADER.size
+        self.start = payload_start + length
+        if self.start == self.end:
+            self.start = self.end = 0
+        return frame_type, send_time, self.view[payload_start:payload_start + length]
+
+    def frames(self):
+        while True:
+            frame = self.next_frame()
+            if frame is None:
+                return
+            yield frame
+
+    def read_frame(self, sock):
+        """Blocking read of one frame from sock; None on EOF"""
+        while True:
+            frame = self.next_frame()
+            if frame is not None:
+                return frame
+            if self.recv_from(sock) == 0:
+                return None
@@ -0,0 +1,53 @@
+"""
+Streamlit side of ChatServer/ChatClient: the only module (with GUI.py) that
+imports streamlit, so headless servers and load-test clients never pay for it.
+"""
+import queue
+import streamlit as st
+
+
+def process_server_queues(server):
+    """Drain a ChatServer's log/clients/conversation queues into the session state"""
+    while not server.log_queue.empty():
+        try:
+            log = server.log_queue.get_nowait()
+            st.session_state.server_logs.append(log)
+        except queue.Empty:
+            break
+
+    while not server.clients_queue.empty():
+        try:
+            clients_list = server.clients_queue.get_nowait()
+            st.session_state.connected_clients = clients_list
+        except queue.Empty:
+            break
+    
+    while not server.conversations_queue.empty():
+        try:
+            conv_update = server.conversations_queue.get_nowait()
+            nickname = conv_update['nickname']
+            message = conv_update['message']
+            
+            if 'server_conversations' not in st.session_state:
+                st.session_state.server_conversations = {}
+            
+            if nickname not in st.session_state.server_conversations:
+                st.session_state.server_conversations[nickname] = []
+            
+            st.session_state.server_conversations[nickname].append(message)
+            # Same bound as the server's in-memory tail; older messages are paged from its store
+            del st.session_state.server_conversations[nickname][:-server.conversations.tail_size]
+        except queue.Empty:
+            break
+
+
+def process_client_queue(client):
+    """Move a ChatClient's received messages into the session state"""
+    while not client.message_queue.empty():
+        try:
+            msg = client.message_queue.get_nowait()
+            if 'messages' not in st.session_state:
+                st.session_state.messages = []
+            st.session_state.messages.append(msg)
+        except queue.Empty:
+            break
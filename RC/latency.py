@@ -0,0 +1,177 @@
+import bisect
+import math
+from array import array
+
+PERCENTILES = (50.0, 95.0, 99.0, 99.9)
+
+
+def percentile_key(p):
+    """50.0 -> 'p50', 99.9 -> 'p999'"""
+    return 'p' + f"{p:g}".replace('.', '')
+
+
+class LatencyHistogram:
+    """
+    Log-linear (HDR-style) histogram of latencies, recorded in microseconds.
+    Values below 64 us get exact buckets; above that each power of two is
+    split into 32 linear sub-buckets (~3% relative error). Counts are kept
+    sparse, bucket index -> count: latencies cluster in a few dozen buckets,
+    so an idle client costs an empty dict and merging walks only the buckets
+    that have samples.
+    """
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+    SUB_BITS = 6
+    SUB_COUNT = 1 << SUB_BITS   # 64
+    HALF = SUB_COUNT // 2       # 32
+    MAX_US = (1 << 36) - 1      # ~19 hours
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def _index(self, us):
+        """Bucket of a latency in whole microseconds (negative clock skew -> 0, clamped to MAX_US)"""
+        if us < self.SUB_COUNT:
+            return us if us > 0 else 0
+        if us > self.MAX_US:
+            us = self.MAX_US
+        # == SUB_COUNT + (shift - 1) * HALF + ((us >> shift) - HALF)
+        shift = us.bit_length() - self.SUB_BITS
+        return (shift << 5) + (us >> shift)
+
+    def _bucket_value(self, index):
+        """Midpoint (us) of the bucket"""
+        if index < self.SUB_COUNT:
+            return float(index)
+        shift, sub = divmod(index - self.SUB_COUNT, self.HALF)
+        shift += 1
+        low = (sub + self.HALF) << shift
+        return low + ((1 << shift) - 1) / 2
+
+    def record(self, latency_ms):
+        index = self._index(int(latency_ms * 1000))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += latency_ms
+        if latency_ms < self.min:
+            self.min = latency_ms
+        if latency_ms > self.max:
+            self.max = latency_ms
+
+    def merge(self, other):
+        """Add the samples of another histogram to this one"""
+        counts = self.counts
+        for index, n in other.counts.items():
+            counts[index] = counts.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def cumulative(self, bounds_ms):
+        """Cumulative sample counts at each upper bound (Prometheus 'le' buckets), by bucket midpoint"""
+        below = [0] * (len(bounds_ms) + 1)
+        for index, n in self.counts.items():
+            below[bisect.bisect_left(bounds_ms, self._bucket_value(index) / 1000)] += n
+        total = 0
+        result = []
+        for n in below[:-1]:
+            total += n
+            result.append(total)
+        return result
+
+    def percentiles(self, points=PERCENTILES):
+        """{p: latency_ms} for each point, walking the buckets once"""
+        result = {p: 0.0 for p in points}
+        if not self.count:
+            return result
+        targets = sorted((max(1, math.ceil(p / 100 * self.count)), p) for p in points)
+        seen = 0
+        t = 0
+        for index, n in sorted(self.counts.items()):
+            seen += n
+            while t < len(targets) and seen >= targets[t][0]:
+                # Clamp to the exact extremes, the bucket midpoint may overshoot them
+                result[targets[t][1]] = min(max(self._bucket_value(index) / 1000, self.min), self.max)
+                t += 1
+            if t == len(targets):
+                break
+        return result
+
+
+class LatencyRing:
+    """
+    Ring buffer of the most recent latencies (windowed view), at most size
+    samples. It grows with the first samples and wraps once full, so a
+    client that never reports a latency costs no buffer at all.
+    """
+    __slots__ = ('samples', 'size', 'next')
+
+    def __init__(self, size=1024):
+        self.samples = array('d')
+        self.size = size
+        self.next = 0
+
+    def record(self, latency_ms):
+        samples = self.samples
+        if len(samples) < self.size:
+            samples.append(latency_ms)
+        else:
+            samples[self.next] = latency_ms
+        self.next += 1
+        if self.next == self.size:
+            self.next = 0
+
+    def values(self):
+        return self.samples
+
+
+class LatencyStats:
+    """
+    Lifetime histogram + windowed ring of one latency series.
+    Replaces the old per-site lists trimmed with samples[-100:]; callers hold
+    their own lock (record() runs under ClientStats.lock on the server, under
+    ChatClient.lock on the client).
+    """
+
+    __slots__ = ('lifetime', 'window')
+
+    def __init__(self, window=1024):
+        self.lifetime = LatencyHistogram()
+        self.window = LatencyRing(window)
+
+    def record(self, latency_ms):
+        self.lifetime.record(latency_ms)
+        self.window.record(latency_ms)
+
+    def __len__(self):
+        return self.lifetime.count
+
+    def lifetime_summary(self):
+        h = self.lifetime
+        summary = {
+            'count': h.count,
+            'avg': h.total / h.count if h.count else 0.0,
+            'min': h.min if h.count else 0.0,
+            'max': h.max,
+        }
+        for p, value in h.percentiles().items():
+            summary[percentile_key(p)] = value
+        return summary
+
+    def window_summary(self):
+        """Exact stats over the last `window` samples (sorted on demand, only when read)"""
+        values = sorted(self.window.values())
+        n = len(values)
+        summary = {
+            'count': n,
+            'avg': sum(values) / n if n else 0.0,
+            'min': values[0] if n else 0.0,
+            'max': values[-1] if n else 0.0,
+        }
+        for p in PERCENTILES:
+            summary[percentile_key(p)] = values[max(1, math.ceil(p / 100 * n)) - 1] if n else 0.0
+        return summary
@@ -0,0 +1,441 @@
+"""
+Headless load generator for ChatHub.
+Run from the RC directory:  python loadgen.py [options]
+
+Starts a local ChatServer process, then N ChatClient peers spread over a few
+load processes. Peers are paired in two-member rooms: each peer sends ping
+messages to its room at --rate per second (sizes drawn from --size), its
+partner answers each one with a pong of the same size, and the round trip is
+timed by the pinger. Reports throughput, RTT percentiles, retransmissions,
+CPU and RSS for each mode (tcp, tls, udp, udp-aes); --json keeps the results
+for comparing versions.
+"""
+import argparse
+import heapq
+import json
+import os
+import platform
+import queue
+import random
+import resource
+import select
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from datagram import MAX_DATAGRAM
+
+# --json paths are relative to where the tool was started, not to RC
+LAUNCH_DIR = os.getcwd()
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'tcp': ('TCP', False),
+    'tls': ('TCP', True),
+    'udp': ('UDP', False),
+    'udp-aes': ('UDP', True),
+}
+# Largest UDP text: room prefix, nickname, header and AES-GCM overhead must fit in MAX_DATAGRAM
+UDP_MAX_SIZE = MAX_DATAGRAM - 160
+READY_TIMEOUT = 30.0
+
+
+def size_sampler(spec, limit=None):
+    """
+    Message size distribution: 'N' (fixed), 'uniform:A:B' or 'exp:MEAN';
+    returns a function drawing one size (at least 1, at most limit)
+    """
+    kind, _, params = spec.partition(':')
+    if not params:
+        size = int(kind)
+        draw = lambda: size
+    elif kind == 'uniform':
+        low, high = (int(v) for v in params.split(':'))
+        draw = lambda: random.randint(low, high)
+    elif kind == 'exp':
+        mean = float(params)
+        draw = lambda: int(random.expovariate(1.0 / mean))
+    else:
+        raise ValueError(f"unknown size distribution {spec!r} (N, uniform:A:B, exp:MEAN)")
+    if limit is None:
+        return lambda: max(1, draw())
+    return lambda: min(limit, max(1, draw()))
+
+
+def percentiles(samples):
+    """p50/p90/p99/max/mean (ms) of RTT samples"""
+    if not samples:
+        return {'p50': None, 'p90': None, 'p99': None, 'max': None, 'mean': None, 'count': 0}
+    samples = sorted(samples)
+
+    def at(q):
+        return round(samples[min(len(samples) - 1, int(len(samples) * q))], 3)
+
+    return {'p50': at(0.5), 'p90': at(0.9), 'p99': at(0.99), 'max': round(samples[-1], 3),
+            'mean': round(sum(samples) / len(samples), 3), 'count': len(samples)}
+
+
+def proc_usage(pid):
+    """(CPU seconds, VmRSS KB, VmHWM KB) of a process from /proc; None where unavailable"""
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        rss_kb = hwm_kb = None
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss_kb = int(line.split()[1])
+                elif line.startswith('VmHWM:'):
+                    hwm_kb = int(line.split()[1])
+        return cpu, rss_kb, hwm_kb
+    except (OSError, ValueError, IndexError):
+        return None, None, None
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def serve(args):
+    """Child process: a ChatServer; 'stop' on stdin prints its counter totals as JSON and stops it"""
+    from chatserver import ChatServer
+
+    server = ChatServer('127.0.0.1', args.port, args.proto, use_ssl=args.ssl, tcp_mode=args.tcp_mode)
+    server.packet_loss_rate = args.loss
+    if not server.start():
+        sys.exit(1)
+    print('READY', flush=True)
+    while True:
+        for pending in (server.log_queue, server.clients_queue, server.conversations_queue):
+            while True:
+                try:
+                    pending.get_nowait()
+                except queue.Empty:
+                    break
+        readable, _, _ = select.select([sys.stdin], [], [], 0.5)
+        if readable:
+            line = sys.stdin.readline()
+            if not line or line.strip() == 'stop':
+                break
+    print(json.dumps(server.get_server_stats()), flush=True)
+    server.stop()
+
+
+def run_peers(args):
+    """
+    Child process: peers --first .. --first+--count-1. Prints READY once they
+    have joined their rooms, starts on 'go', prints its results as JSON
+    """
+    from chatclient import ChatClient
+
+    limit = UDP_MAX_SIZE if args.proto == 'UDP' else None
+    draw_size = size_sampler(args.size, limit)
+    inbox = queue.Queue()  # every peer of the process delivers here
+    peers = {}
+    for index in range(args.first, args.first + args.count):
+        client = ChatClient('127.0.0.1', args.port, f"peer{index}", args.proto, use_ssl=args.ssl)
+        client.packet_loss_rate = args.loss
+        client.message_queue = inbox
+        if not client.connect():
+            print(json.dumps({'error': f"peer{index} failed to connect: {client.last_error}"}), flush=True)
+            return
+        peers[index] = client
+    for index, client in peers.items():
+        client.send_message(f"/join load-{index // 2}")
+    joined = 0
+    deadline = time.time() + READY_TIMEOUT
+    while joined < len(peers) and time.time() < deadline:
+        try:
+            entry = inbox.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if 'Joined #load-' in entry['text']:
+            joined += 1
+    if joined < len(peers):
+        print(json.dumps({'error': f"{len(peers) - joined} peer(s) never joined their room"}), flush=True)
+        return
+    print('READY', flush=True)
+    sys.stdin.readline()
+
+    start = time.perf_counter()
+    measure_from = start + args.warmup
+    stop_at = measure_from + args.duration
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    pings = delivered = delivered_bytes = send_errors = 0
+    rtts = []
+
+    def next_time(now):
+        if args.arrivals == 'poisson':
+            return now + random.expovariate(args.rate)
+        return now + 1.0 / args.rate
+
+    # Constant arrivals start with a random phase, so the peers do not send in lockstep
+    schedule = [(start + random.random() / args.rate, index) for index in peers]
+    heapq.heapify(schedule)
+
+    def handle(text, now):
+        nonlocal delivered, delivered_bytes, send_errors
+        # "[#load-K] peerI: ping|pong <perf_counter of the pinger> <padding>"
+        if not text.startswith('[#load-'):
+            return
+        try:
+            _, rest = text.split('] ', 1)
+            sender, body = rest.split(': ', 1)
+            kind, stamp, padding = body.split(' ', 2)
+            receiver = int(sender[4:]) ^ 1
+        except ValueError:
+            return
+        if measure_from <= now < stop_at:
+            delivered += 1
+            delivered_bytes += len(padding)
+        if kind == 'ping' and receiver in peers:
+            if not peers[receiver].send_message(f"#load-{receiver // 2} pong {stamp} {padding}"):
+                send_errors += 1
+        elif kind == 'pong' and float(stamp) >= measure_from:
+            rtts.append((now - float(stamp)) * 1000)
+
+    drain_until = stop_at + args.drain
+    while True:
+        now = time.perf_counter()
+        if now >= drain_until:
+            break
+        wait = drain_until - now
+        if now < stop_at:
+            wait = min(wait, max(0.0, schedule[0][0] - now))
+        try:
+            entry = inbox.get(timeout=wait)
+            handle(entry['text'], time.perf_counter())
+        except queue.Empty:
+            pass
+        now = time.perf_counter()
+        while now < stop_at and schedule[0][0] <= now:
+            due, index = heapq.heappop(schedule)
+            sent_at = time.perf_counter()
+            padding = 'x' * draw_size()
+            if peers[index].send_message(f"#load-{index // 2} ping {sent_at:.6f} {padding}"):
+                if sent_at >= measure_from:
+                    pings += 1
+            else:
+                send_errors += 1
+            heapq.heappush(schedule, (next_time(max(due, now - 1.0)), index))
+
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    stats = [client.get_stats() for client in peers.values()]
+    print(json.dumps({
+        'pings': pings,
+        'delivered': delivered,
+        'delivered_bytes': delivered_bytes,
+        'rtts': [round(rtt, 3) for rtt in rtts],
+        'retransmissions': sum(s['retransmissions'] for s in stats),
+        'packet_loss': sum(s['packet_loss'] for s in stats),
+        'send_errors': send_errors,
+        'disconnected': sum(not client.connected for client in peers.values()),
+        'cpu_seconds': (usage_after.ru_utime + usage_after.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime),
+        'max_rss_kb': usage_after.ru_maxrss,
+    }), flush=True)
+    for client in peers.values():
+        client.disconnect()
+
+
+def run_mode(mode, args, port):
+    """One load run against a fresh server; returns its results (dict)"""
+    proto, use_ssl = MODES[mode]
+    server = subprocess.Popen(
+        [sys.executable, __file__, '_serve', '--proto', proto, '--port', str(port), '--loss', str(args.loss),
+         '--tcp-mode', args.tcp_mode] + (['--ssl'] if use_ssl else []),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    if server.stdout.readline().strip() != 'READY':
+        server.kill()
+        return {'mode': mode, 'error': "server failed to start"}
+
+    loads = []
+    try:
+        procs = max(1, min(args.procs, args.peers // 2))
+        pairs = args.peers // 2
+        first = 0
+        for i in range(procs):
+            count = 2 * (pairs // procs + (i < pairs % procs))
+            loads.append(subprocess.Popen(
+                [sys.executable, __file__, '_peers', '--proto', proto, '--port', str(port), '--first', str(first),
+                 '--count', str(count), '--rate', str(args.rate), '--size', args.size, '--arrivals', args.arrivals,
+                 '--warmup', str(args.warmup), '--duration', str(args.duration), '--drain', str(args.drain),
+                 '--loss', str(args.loss)] + (['--ssl'] if use_ssl else []),
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True))
+            first += count
+        for proc in loads:
+            line = proc.stdout.readline().strip()
+            if line != 'READY':
+                return {'mode': mode, 'error': json.loads(line)['error'] if line else "load process failed"}
+
+        cpu_start, _, _ = proc_usage(server.pid)
+        for proc in loads:
+            proc.stdin.write('go\n')
+            proc.stdin.flush()
+        # Server RSS sampled during the run; CPU over warmup + duration + drain
+        rss_peak_kb = 0
+        end = time.time() + args.warmup + args.duration + args.drain
+        while time.time() < end:
+            _, rss_kb, _ = proc_usage(server.pid)
+            rss_peak_kb = max(rss_peak_kb, rss_kb or 0)
+            time.sleep(0.2)
+        results = [proc.stdout.readline() for proc in loads]
+        cpu_end, rss_kb, hwm_kb = proc_usage(server.pid)
+        server.stdin.write('stop\n')
+        server.stdin.flush()
+        server_stats = json.loads(server.stdout.readline() or '{}')
+    finally:
+        for proc in loads:
+            proc.stdin.close()
+            proc.wait()
+        server.stdin.close()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+    try:
+        results = [json.loads(line) for line in results]
+    except ValueError:
+        return {'mode': mode, 'error': "load process failed"}
+    errors = [result['error'] for result in results if 'error' in result]
+    if errors:
+        return {'mode': mode, 'error': errors[0]}
+
+    elapsed = args.warmup + args.duration + args.drain
+    delivered = sum(result['delivered'] for result in results)
+    rtts = [rtt for result in results for rtt in result['rtts']]
+    pings = sum(result['pings'] for result in results)
+    load_cpu = sum(result['cpu_seconds'] for result in results)
+    return {
+        'mode': mode,
+        'protocol': proto,
+        'encrypted': use_ssl,
+        'messages_per_s': round(delivered / args.duration, 1),
+        'bytes_per_s': round(sum(result['delivered_bytes'] for result in results) / args.duration, 1),
+        'pings': pings,
+        'answered': len(rtts),
+        'rtt_ms': percentiles(rtts),
+        'retransmissions': {
+            'clients': sum(result['retransmissions'] for result in results),
+            'server': server_stats.get('retransmissions'),
+        },
+        'packet_loss': sum(result['packet_loss'] for result in results) + server_stats.get('packet_loss', 0),
+        'send_errors': sum(result['send_errors'] for result in results),
+        'disconnected': sum(result['disconnected'] for result in results),
+        'server': {
+            'cpu_seconds': round(cpu_end - cpu_start, 3) if cpu_start is not None else None,
+            'cpu_percent': round((cpu_end - cpu_start) / elapsed * 100, 1) if cpu_start is not None else None,
+            'rss_mb': round(rss_peak_kb / 1024, 1) if rss_peak_kb else None,
+            'peak_rss_mb': round(hwm_kb / 1024, 1) if hwm_kb else None,
+            'counters': server_stats,
+        },
+        'load': {
+            'processes': len(results),
+            'cpu_seconds': round(load_cpu, 3),
+            'cpu_percent': round(load_cpu / elapsed * 100, 1),
+            'peak_rss_mb': round(max(result['max_rss_kb'] for result in results) / 1024, 1),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command')
+
+    p = sub.add_parser('_serve')
+    p.add_argument('--proto', default='TCP')
+    p.add_argument('--port', type=int)
+    p.add_argument('--ssl', action='store_true')
+    p.add_argument('--loss', type=float, default=0.0)
+    p.add_argument('--tcp-mode', default='threaded')
+    p.set_defaults(func=serve)
+
+    p = sub.add_parser('_peers')
+    p.add_argument('--proto', default='TCP')
+    p.add_argument('--port', type=int)
+    p.add_argument('--ssl', action='store_true')
+    p.add_argument('--first', type=int)
+    p.add_argument('--count', type=int)
+    p.add_argument('--rate', type=float)
+    p.add_argument('--size')
+    p.add_argument('--arrivals')
+    p.add_argument('--warmup', type=float)
+    p.add_argument('--duration', type=float)
+    p.add_argument('--drain', type=float)
+    p.add_argument('--loss', type=float, default=0.0)
+    p.set_defaults(func=run_peers)
+
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--peers', type=int, default=16, help="simulated clients (rounded up to an even number)")
+    parser.add_argument('--rate', type=float, default=20.0, help="pings per second per peer (each one is answered)")
+    parser.add_argument('--arrivals', choices=['constant', 'poisson'], default='poisson')
+    parser.add_argument('--size', default='256', help="message size in bytes: N, uniform:A:B or exp:MEAN")
+    parser.add_argument('--duration', type=float, default=10.0, help="measured seconds")
+    parser.add_argument('--warmup', type=float, default=2.0, help="seconds of load before measuring")
+    parser.add_argument('--drain', type=float, default=1.0, help="seconds to collect late answers")
+    parser.add_argument('--loss', type=float, default=0.0, help="simulated UDP packet loss rate (server and peers)")
+    parser.add_argument('--tcp-mode', choices=['threaded', 'eventloop'], default='threaded')
+    parser.add_argument('--procs', type=int, default=4, help="load processes sharing the peers")
+    parser.add_argument('--port', type=int, default=6300)
+    parser.add_argument('--json', metavar='PATH', help="write the results as JSON here ('-': stdout, no table)")
+
+    args = parser.parse_args()
+    if args.command:
+        args.func(args)
+        return
+
+    size_sampler(args.size)  # fail early on a bad spec
+    args.peers += args.peers % 2
+    table = args.json != '-'
+    if table:
+        print(f"{args.peers} peers x {args.rate:g} pings/s ({args.arrivals}), size {args.size}, "
+              f"{args.duration:g}s measured, {os.cpu_count()} CPUs")
+        print(f"{'mode':<8} {'msg/s':>9} {'MB/s':>7} {'p50 ms':>7} {'p99 ms':>7} {'answered':>9} {'retrans':>8} "
+              f"{'srv CPU%':>8} {'srv MB':>7} {'load CPU%':>9}")
+    runs = []
+    for i, mode in enumerate(args.modes):
+        run = run_mode(mode, args, args.port + i)
+        runs.append(run)
+        if not table:
+            continue
+        if 'error' in run:
+            print(f"{mode:<8} {run['error']}")
+            continue
+        rtt = run['rtt_ms']
+        retransmissions = run['retransmissions']['clients'] + (run['retransmissions']['server'] or 0)
+        print(f"{mode:<8} {run['messages_per_s']:>9,.0f} {run['bytes_per_s'] / 1e6:>7.2f} "
+              f"{rtt['p50'] if rtt['p50'] is not None else float('nan'):>7.2f} "
+              f"{rtt['p99'] if rtt['p99'] is not None else float('nan'):>7.2f} "
+              f"{run['answered']:>4,}/{run['pings']:<4,} {retransmissions:>8,} "
+              f"{run['server']['cpu_percent'] or 0:>8.1f} {run['server']['rss_mb'] or 0:>7.1f} "
+              f"{run['load']['cpu_percent']:>9.1f}")
+
+    if args.json:
+        report = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'version': git_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'config': {key: getattr(args, key) for key in
+                       ('modes', 'peers', 'rate', 'arrivals', 'size', 'duration', 'warmup', 'drain', 'loss',
+                        'tcp_mode', 'procs')},
+            'runs': runs,
+        }
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        else:
+            with open(os.path.join(LAUNCH_DIR, args.json), 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
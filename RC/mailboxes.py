@@ -0,0 +1,86 @@
+import collections
+import threading
+import time
+
+
+class Mail(bytes):
+    """
+    Payload (or TCP frame) of a chat message addressed to one user. Only these
+    go to the mailbox when the connection drops before they are delivered:
+    welcome banners, /history replays and command replies are not kept.
+    """
+    __slots__ = ()
+
+
+class Mailboxes:
+    """
+    Store-and-forward of messages for nicknames that are not connected.
+    One bounded mailbox per nickname (max_messages / max_bytes; the oldest
+    message is dropped to make room, like the outbound queues) and at most
+    max_mailboxes nicknames (the least recently filled mailbox is evicted).
+    Messages are kept as encoded payloads with the time they were queued,
+    and taken all at once when the nickname connects again.
+    """
+
+    def __init__(self, max_messages=256, max_bytes=256 * 1024, max_mailboxes=10000):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_mailboxes = max_mailboxes
+        self.lock = threading.Lock()
+        self.boxes = collections.OrderedDict()  # nickname -> deque of (queued at, payload)
+        self.sizes = {}                         # nickname -> bytes in its mailbox
+        self.bytes = 0
+        self.dropped = 0
+
+    def __contains__(self, nickname):
+        return nickname in self.boxes
+
+    def __len__(self):
+        """Messages waiting in every mailbox"""
+        with self.lock:
+            return sum(len(box) for box in self.boxes.values())
+
+    def pending(self, nickname):
+        with self.lock:
+            return len(self.boxes.get(nickname, ()))
+
+    def put(self, nickname, payload, queued_at=None):
+        """Queue one payload (bytes) for nickname; False if it is larger than a whole mailbox"""
+        queued_at = time.time() if queued_at is None else queued_at
+        with self.lock:
+            if len(payload) > self.max_bytes:
+                self.dropped += 1
+                return False
+            box = self.boxes.get(nickname)
+            if box is None:
+                if len(self.boxes) >= self.max_mailboxes:
+                    evicted, old = self.boxes.popitem(last=False)
+                    self.bytes -= self.sizes.pop(evicted)
+                    self.dropped += len(old)
+                box = self.boxes[nickname] = collections.deque()
+                self.sizes[nickname] = 0
+            else:
+                self.boxes.move_to_end(nickname)
+            size = self.sizes[nickname]
+            while box and (len(box) >= self.max_messages or size + len(payload) > self.max_bytes):
+                size -= len(box.popleft()[1])
+                self.dropped += 1
+            box.append((queued_at, payload))
+            self.bytes += size + len(payload) - self.sizes[nickname]
+            self.sizes[nickname] = size + len(payload)
+        return True
+
+    def take(self, nickname):
+        """Empty the mailbox of nickname: [(queued at, payload)], oldest first"""
+        with self.lock:
+            box = self.boxes.pop(nickname, None)
+            if box is None:
+                return []
+            self.bytes -= self.sizes.pop(nickname)
+        return list(box)
+
+    def clear(self):
+        with self.lock:
+            self.boxes.clear()
+            self.sizes.clear()
+            self.bytes = 0
@@ -0,0 +1,267 @@
+import bisect
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import date, datetime
+
+# Record: body length (key + text), seq, timestamp, is_server, key length,
+# log position of the previous record with the same key | key | text
+RECORD = struct.Struct('!IQdBHQ')
+NO_PREV = (1 << 64) - 1
+SEGMENT_SUFFIX = '.log'
+
+
+def parse_time(text):
+    """Unix timestamp, ISO date/time or HH:MM[:SS] (today) -> timestamp; ValueError otherwise"""
+    text = text.strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        pass
+    clock = datetime.strptime(text, '%H:%M:%S' if text.count(':') == 2 else '%H:%M').time()
+    return datetime.combine(date.today(), clock).timestamp()
+
+
+class Segment:
+    """One segment file; named after the seq of its first record"""
+    __slots__ = ('base', 'start', 'path', 'size', 'view')
+
+    def __init__(self, base, start, path, size=0):
+        self.base = base
+        self.start = start  # log position of its first byte
+        self.path = path
+        self.size = size
+        self.view = None    # mmap of the first view.size bytes, remapped as the segment grows
+
+
+class MessageLog:
+    """
+    Durable, segmented, append-only log of chat messages.
+    Records are keyed by nickname (or '#room') and rolled into a new segment
+    file every segment_bytes. A log position is a byte offset across all
+    segments; each record stores the position of the previous record with
+    the same key, so the last N messages of a key cost N reads whatever the
+    interleaving. Two sparse in-memory indexes locate older history: per key,
+    every index_interval-th record (ordinal, timestamp, position); globally,
+    every time_interval-th record. Records are read through memory-mapped
+    segments, never loaded wholesale. The indexes are rebuilt from the
+    segments when the log is opened (a torn last record is cut off).
+    """
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024, index_interval=32, time_interval=256,
+                 fsync=False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.time_interval = time_interval
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.segments = []
+        self.starts = []       # log position of each segment, for bisect
+        self.key_last = {}     # key -> (number of records, position of the last one)
+        self.key_index = {}    # key -> [(ordinal, timestamp, position)]
+        self.time_index = []   # [(timestamp, seq, position)]
+        self.next_seq = 0
+        self._fd = None
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def __len__(self):
+        return self.next_seq
+
+    def _segment_path(self, base):
+        return os.path.join(self.directory, f"{base:020d}{SEGMENT_SUFFIX}")
+
+    def _add_segment(self, segment):
+        self.segments.append(segment)
+        self.starts.append(segment.start)
+
+    def _end(self):
+        if not self.segments:
+            return 0
+        return self.segments[-1].start + self.segments[-1].size
+
+    def _recover(self):
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            path = os.path.join(self.directory, name)
+            segment = Segment(int(name[:-len(SEGMENT_SUFFIX)]), self._end(), path, os.path.getsize(path))
+            self._add_segment(segment)
+            valid = 0
+            for seq, timestamp, is_server, key, prev, pos, text, end in self._scan(segment, 0, segment.size):
+                self._index(key, timestamp, segment.start + pos, seq)
+                self.next_seq = seq + 1
+                valid = end
+            if valid < segment.size:
+                # Torn write at the end of the log (crash mid-append): cut it off.
+                # Unmap first: a mapped file cannot be truncated on Windows; the next read remaps it
+                if segment.view is not None:
+                    segment.view.close()
+                    segment.view = None
+                with open(path, 'r+b') as f:
+                    f.truncate(valid)
+                segment.size = valid
+
+        if not self.segments:
+            self._add_segment(Segment(self.next_seq, 0, self._segment_path(self.next_seq)))
+        self._fd = os.open(self.segments[-1].path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def _index(self, key, timestamp, position, seq):
+        n, _ = self.key_last.get(key, (0, NO_PREV))
+        if n % self.index_interval == 0:
+            self.key_index.setdefault(key, []).append((n, timestamp, position))
+        self.key_last[key] = (n + 1, position)
+        if seq % self.time_interval == 0:
+            self.time_index.append((timestamp, seq, position))
+
+    def _roll(self):
+        if self.fsync:
+            os.fsync(self._fd)
+        os.close(self._fd)
+        segment = Segment(self.next_seq, self._end(), self._segment_path(self.next_seq))
+        self._add_segment(segment)
+        self._fd = os.open(segment.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def append(self, key, text, is_server=False, timestamp=None):
+        """Append one message; returns its seq"""
+        key_bytes = key.encode('utf-8')
+        body = text.encode('utf-8')
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            if self._fd is None:
+                raise ValueError("Message log is closed")
+            segment = self.segments[-1]
+            if segment.size and segment.size + RECORD.size + len(key_bytes) + len(body) > self.segment_bytes:
+                self._roll()
+                segment = self.segments[-1]
+            seq = self.next_seq
+            prev = self.key_last.get(key, (0, NO_PREV))[1]
+            record = RECORD.pack(len(key_bytes) + len(body), seq, timestamp, is_server, len(key_bytes),
+                                 prev) + key_bytes + body
+            os.write(self._fd, record)
+            if self.fsync:
+                os.fsync(self._fd)
+            self._index(key, timestamp, segment.start + segment.size, seq)
+            segment.size += len(record)
+            self.next_seq += 1
+        return seq
+
+    def _view(self, segment, size):
+        """mmap covering at least the first `size` bytes of a segment"""
+        view = segment.view
+        if view is None or len(view) < size:
+            with open(segment.path, 'rb') as f:
+                view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            segment.view = view
+        return view
+
+    def _scan(self, segment, pos, size):
+        """Records of one segment from pos: (seq, timestamp, is_server, key, prev, pos, text pos, end)"""
+        if size == 0:
+            return
+        view = self._view(segment, size)
+        while pos + RECORD.size <= size:
+            length, seq, timestamp, is_server, key_length, prev = RECORD.unpack_from(view, pos)
+            end = pos + RECORD.size + length
+            if end > size or key_length > length:
+                return
+            text = pos + RECORD.size + key_length
+            yield seq, timestamp, bool(is_server), view[pos + RECORD.size:text].decode('utf-8'), prev, pos, text, end
+            pos = end
+
+    def _read_at(self, segments, starts, position):
+        """Record at a log position, and the position of the previous record with its key"""
+        segment = segments[bisect.bisect_right(starts, position) - 1]
+        pos = position - segment.start
+        view = self._view(segment, pos + RECORD.size)
+        length, seq, timestamp, is_server, key_length, prev = RECORD.unpack_from(view, pos)
+        end = pos + RECORD.size + length
+        view = self._view(segment, end)
+        text = pos + RECORD.size + key_length
+        return {
+            'seq': seq,
+            'timestamp': timestamp,
+            'key': view[pos + RECORD.size:text].decode('utf-8'),
+            'text': view[text:end].decode('utf-8'),
+            'is_server': bool(is_server),
+        }, prev
+
+    def _walk_back(self, position, count=None, since=None):
+        """Follow the back pointers of one key from position; newest first"""
+        with self.lock:
+            segments = list(self.segments)
+            starts = list(self.starts)
+        records = []
+        while position != NO_PREV and (count is None or len(records) < count):
+            record, position = self._read_at(segments, starts, position)
+            if since is not None and record['timestamp'] < since:
+                break
+            records.append(record)
+        return records
+
+    def last(self, key, n):
+        """The last n messages of key, oldest first"""
+        with self.lock:
+            total, position = self.key_last.get(key, (0, NO_PREV))
+        if not total or n <= 0:
+            return []
+        records = self._walk_back(position, count=n)
+        records.reverse()
+        return records
+
+    def since(self, timestamp, key=None, limit=1000):
+        """Messages of key (or of every key) written at or after timestamp, oldest first, at most limit"""
+        if key is None:
+            return self._since_all(timestamp, limit)
+        with self.lock:
+            total, position = self.key_last.get(key, (0, NO_PREV))
+            if not total:
+                return []
+            entries = self.key_index[key]
+            # Start walking back from the index entry that lies `limit` records past the first match
+            i = bisect.bisect_left(entries, timestamp, key=lambda entry: entry[1])
+            stop = i + limit // self.index_interval + 1
+            if stop < len(entries):
+                position = entries[stop][2]
+        records = self._walk_back(position, since=timestamp)
+        records.reverse()
+        return records[:limit]
+
+    def _since_all(self, timestamp, limit):
+        """Every key: forward scan from the time index entry right before timestamp"""
+        with self.lock:
+            i = bisect.bisect_left(self.time_index, timestamp, key=lambda entry: entry[0])
+            position = self.time_index[i - 1][2] if i else 0
+            segments = [(segment, segment.size) for segment in self.segments]
+        records = []
+        for segment, size in segments:
+            if segment.start + size <= position:
+                continue
+            for seq, record_time, is_server, key, prev, pos, text, end in self._scan(
+                    segment, max(0, position - segment.start), size):
+                if record_time < timestamp:
+                    continue
+                records.append({
+                    'seq': seq,
+                    'timestamp': record_time,
+                    'key': key,
+                    'text': segment.view[text:end].decode('utf-8'),
+                    'is_server': is_server,
+                })
+                if len(records) >= limit:
+                    return records
+        return records
+
+    def close(self):
+        with self.lock:
+            if self._fd is not None:
+                if self.fsync:
+                    os.fsync(self._fd)
+                os.close(self._fd)
+                self._fd = None
@@ -0,0 +1,135 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from stats import aggregate, aggregate_latency
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds (seconds) of the exported latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ClientStats counter -> (metric name, help)
+COUNTERS = (
+    ('sent_count', 'chat_messages_sent_total', "Messages sent to clients"),
+    ('received_count', 'chat_messages_received_total', "Messages received from clients"),
+    ('encrypted_messages', 'chat_encrypted_messages_total', "Messages sent or received encrypted (TLS or AES-GCM)"),
+    ('ack_count', 'chat_acks_received_total', "UDP messages acknowledged by clients"),
+    ('acks_sent', 'chat_acks_sent_total', "UDP ACK datagrams sent"),
+    ('retransmissions', 'chat_retransmissions_total', "UDP retransmissions (timeout and fast retransmit)"),
+    ('duplicates', 'chat_duplicates_total', "Duplicate UDP messages dropped by the replay window"),
+    ('packet_loss', 'chat_packet_loss_total', "UDP messages given up after max retries"),
+    ('simulated_drops', 'chat_simulated_drops_total', "Datagrams dropped by the packet loss simulation"),
+    ('resumptions', 'chat_session_resumptions_total', "UDP sessions moved to a new client address"),
+)
+
+
+def snapshot(server):
+    """
+    Copy what a scrape needs. The locks are only held for the copies;
+    totals and histograms are computed afterwards from per-client stats.
+    """
+    with server.lock:
+        connected = len(server.clients)
+        rooms = len(server.rooms)
+        clients = list(server.clients)
+        stats = list(server.client_stats.values())
+        retired_dropped = server.retired_outbound_dropped
+    with server.reliability_lock:
+        pending_acks = len(server.pending_acks)
+        windows = list(server.send_windows.values())
+
+    outbound = [server.get_outbound_queue(client) for client in clients] if server.protocol == 'TCP' else []
+    outbound = [queue for queue in outbound if queue is not None]
+    return {
+        'connected': connected,
+        'rooms': rooms,
+        'totals': aggregate(stats + [server.retired_stats]),
+        'latency': aggregate_latency(stats + [server.retired_stats]),
+        'pending_acks': pending_acks,
+        'send_backlog': sum(len(window.backlog) for window in windows),
+        'outbound_frames': sum(len(queue) for queue in outbound),
+        'outbound_bytes': sum(queue.bytes for queue in outbound),
+        'outbound_dropped': retired_dropped + sum(queue.dropped for queue in outbound),
+        'mailbox_messages': len(server.mailboxes),
+        'mailbox_bytes': server.mailboxes.bytes,
+        'mailbox_dropped': server.mailboxes.dropped,
+    }
+
+
+def render(server):
+    """Text exposition format of the server's current stats"""
+    snap = snapshot(server)
+    labels = f'protocol="{server.protocol.lower()}"'
+    lines = []
+
+    def metric(name, kind, help, value):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.append(f"{name}{{{labels}}} {value}")
+
+    metric('chat_up', 'gauge', "1 while the server is running", int(server.running))
+    metric('chat_connected_clients', 'gauge', "Connected clients", snap['connected'])
+    metric('chat_rooms', 'gauge', "Rooms with at least one member", snap['rooms'])
+    for key, name, help in COUNTERS:
+        metric(name, 'counter', help, snap['totals'][key])
+    metric('chat_pending_acks', 'gauge', "UDP messages sent and not yet acknowledged", snap['pending_acks'])
+    metric('chat_send_backlog', 'gauge', "UDP messages waiting for room in a send window", snap['send_backlog'])
+    metric('chat_outbound_queued_frames', 'gauge', "Frames queued to TCP clients", snap['outbound_frames'])
+    metric('chat_outbound_queued_bytes', 'gauge', "Bytes queued to TCP clients", snap['outbound_bytes'])
+    metric('chat_outbound_dropped_frames_total', 'counter',
+           "Frames dropped by the overflow policy of TCP outbound queues", snap['outbound_dropped'])
+    metric('chat_mailbox_messages', 'gauge', "Messages waiting for offline clients", snap['mailbox_messages'])
+    metric('chat_mailbox_bytes', 'gauge', "Bytes waiting for offline clients", snap['mailbox_bytes'])
+    metric('chat_mailbox_dropped_total', 'counter',
+           "Queued messages dropped because a mailbox was full", snap['mailbox_dropped'])
+
+    histogram = snap['latency']
+    name = 'chat_message_latency_seconds'
+    lines.append(f"# HELP {name} Message latency (one-way receive latency and UDP ACK round trips)")
+    lines.append(f"# TYPE {name} histogram")
+    for bound, n in zip(LATENCY_BUCKETS, histogram.cumulative([b * 1000 for b in LATENCY_BUCKETS])):
+        lines.append(f'{name}_bucket{{{labels},le="{bound:g}"}} {n}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.total / 1000:.6f}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """
+    Minimal HTTP listener serving GET /metrics for a ChatServer (Prometheus
+    text format). Runs in its own daemon thread; each scrape is rendered
+    on demand from the server's stats.
+    """
+
+    def __init__(self, chat_server, host='0.0.0.0', port=9464):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                try:
+                    body = render(chat_server).encode('utf-8')
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Pas de log par scrape
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,109 @@
+import collections
+import threading
+import time
+
+# Overflow policies of a full outbound queue
+DROP_OLDEST = 'drop_oldest'  # discard the oldest queued frame to make room
+DISCONNECT = 'disconnect'    # give up on the slow client
+BLOCK = 'block'              # wait (up to block_timeout) for the I/O layer to drain it
+POLICIES = (DROP_OLDEST, DISCONNECT, BLOCK)
+
+
+class OutboundOverflow(OSError):
+    """Raised by put() when the client has to be disconnected"""
+    pass
+
+
+class OutboundQueue:
+    """
+    Bounded queue of encoded frames waiting to be written to one TCP client.
+    Producers (send_to_client, room fan-out) only enqueue; the I/O layer
+    (event loop or the client's writer thread) drains it in batches with
+    take(). Frames are dropped whole, so the stream framing stays intact.
+    """
+
+    def __init__(self, max_frames=1024, max_bytes=4 * 1024 * 1024, policy=DROP_OLDEST, block_timeout=5.0):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.frames = collections.deque()
+        self.bytes = 0
+        self.dropped = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def _full(self, size):
+        return self.frames and (len(self.frames) >= self.max_frames or self.bytes + size > self.max_bytes)
+
+    def put(self, frame, can_block=True):
+        """
+        Queue one frame. A full queue applies the policy; `block` only waits
+        when can_block (never on the event loop thread) and falls back to
+        dropping the oldest frame otherwise.
+        Raises OutboundOverflow when the client must be disconnected.
+        """
+        with self.cond:
+            if self.closed:
+                raise OutboundOverflow("Connection closed")
+            if self._full(len(frame)):
+                if self.policy == DISCONNECT:
+                    self.dropped += 1
+                    raise OutboundOverflow(f"Outbound queue full ({len(self.frames)} frames)")
+                if self.policy == BLOCK and can_block:
+                    deadline = time.time() + self.block_timeout
+                    while self._full(len(frame)) and not self.closed:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            self.dropped += 1
+                            raise OutboundOverflow(f"Outbound queue still full after {self.block_timeout}s")
+                        self.cond.wait(remaining)
+                    if self.closed:
+                        raise OutboundOverflow("Connection closed")
+                while self._full(len(frame)):
+                    self.bytes -= len(self.frames.popleft())
+                    self.dropped += 1
+            self.frames.append(frame)
+            self.bytes += len(frame)
+            self.cond.notify_all()
+
+    def take(self, max_bytes=65536):
+        """Pop queued frames (at least one, up to max_bytes) as one batch; b'' if empty"""
+        with self.cond:
+            if not self.frames:
+                return b''
+            batch = [self.frames.popleft()]
+            size = len(batch[0])
+            while self.frames and size + len(self.frames[0]) <= max_bytes:
+                frame = self.frames.popleft()
+                batch.append(frame)
+                size += len(frame)
+            self.bytes -= size
+            self.cond.notify_all()
+        return batch[0] if len(batch) == 1 else b''.join(batch)
+
+    def wait_take(self, timeout=1.0, max_bytes=65536):
+        """Writer thread side: wait for frames (or close) and take a batch"""
+        with self.cond:
+            if not self.frames and not self.closed:
+                self.cond.wait(timeout)
+        return self.take(max_bytes)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def drain(self):
+        """Pop every frame still queued (frames the client never got)"""
+        with self.cond:
+            frames = list(self.frames)
+            self.frames.clear()
+            self.bytes = 0
+            self.cond.notify_all()
+        return frames
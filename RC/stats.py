@@ -0,0 +1,81 @@
+import threading
+from latency import LatencyStats, LatencyHistogram
+
+# Counters kept for every connected client
+CLIENT_COUNTERS = (
+    'sent_count',
+    'received_count',
+    'ack_count',
+    'retransmissions',
+    'packet_loss',
+    'duplicates',
+    'acks_sent',
+    'simulated_drops',
+    'encrypted_messages',
+    'resumptions',
+)
+
+
+class ClientStats:
+    """
+    Counters + latency series of one client, guarded by their own lock.
+    Each client is its own shard: threads updating different clients never
+    contend (and never take ChatServer.lock, which is left to membership
+    changes). Readers aggregate with snapshot() on demand.
+    """
+    __slots__ = ('counts', 'latency', 'lock')
+
+    def __init__(self):
+        self.counts = dict.fromkeys(CLIENT_COUNTERS, 0)
+        self.latency = LatencyStats()
+        self.lock = threading.Lock()
+
+    def count(self, *names, latency=None):
+        """Bump each named counter by one (and record a latency sample) in one lock hold"""
+        with self.lock:
+            counts = self.counts
+            for name in names:
+                counts[name] += 1
+            if latency is not None:
+                self.latency.record(latency)
+
+    def add(self, name, n):
+        with self.lock:
+            self.counts[name] += n
+
+    def merge(self, other):
+        """Fold the counters and lifetime latency of another client in (retired totals)"""
+        with other.lock, self.lock:
+            for name, value in other.counts.items():
+                self.counts[name] += value
+            self.latency.lifetime.merge(other.latency.lifetime)
+
+    def snapshot(self):
+        """Consistent copy: counters + windowed and lifetime latency summaries"""
+        with self.lock:
+            snapshot = dict(self.counts)
+            snapshot['latency_window'] = self.latency.window_summary()
+            snapshot['latency_lifetime'] = self.latency.lifetime_summary()
+        return snapshot
+
+
+def aggregate(stats):
+    """
+    Sum the counters of several ClientStats (server-wide totals).
+    Reads without taking the client locks: a reader must not queue behind
+    every busy writer, and a total that is a few updates behind is fine.
+    """
+    totals = dict.fromkeys(CLIENT_COUNTERS, 0)
+    for client in stats:
+        for name, value in client.counts.copy().items():
+            totals[name] += value
+    return totals
+
+
+def aggregate_latency(stats):
+    """Lifetime latency histogram of several ClientStats merged into one (sparse: only buckets with samples)"""
+    merged = LatencyHistogram()
+    for client in stats:
+        with client.lock:
+            merged.merge(client.latency.lifetime)
+    return merged
@@ -0,0 +1,308 @@
+import selectors
+import socket
+import ssl
+import threading
+from framing import FrameReader, encode_frame, FRAME_NICK, FRAME_MSG
+from outbound import OutboundOverflow
+
+
+class TCPConnection:
+    """
+    One client connection served by EventLoopTCPEngine.
+    Exposes send()/close() like a socket so ChatServer can keep it in
+    self.clients / self.client_map exactly like a threaded client socket.
+    """
+    __slots__ = ('engine', 'sock', 'addr', 'nickname', 'state', 'reader', 'outbound', 'wbuf', 'closed')
+
+    def __init__(self, engine, sock, addr, state, outbound):
+        self.engine = engine
+        self.sock = sock
+        self.addr = addr
+        self.nickname = None
+        self.state = state  # 'handshake' -> 'nick' -> 'open'
+        self.reader = FrameReader(1024)
+        self.outbound = outbound  # bounded OutboundQueue, filled by any thread
+        self.wbuf = bytearray()   # batch being written (event loop thread only)
+        self.closed = False
+
+    def send(self, data):
+        """Queue a frame for the event loop; the socket is written when it is writable"""
+        if self.closed:
+            raise OSError("Connection closed")
+        try:
+            # The loop thread must never block: 'block' falls back to dropping the oldest frame there
+            self.outbound.put(data, can_block=not self.engine._in_loop())
+        except OutboundOverflow:
+            self.engine.drop_connection(self)
+            raise
+        self.engine.request_write(self)
+        return len(data)
+
+    sendall = send
+
+    def close(self):
+        self.engine.close_connection(self)
+
+
+class EventLoopTCPEngine:
+    """
+    Serves every TCP client of a ChatServer from a single selectors loop.
+    Handles the non-blocking TLS handshake, NICK negotiation and message
+    dispatch; registration, stats and conversations stay in ChatServer.
+    """
+
+    def __init__(self, server, select_timeout=1.0):
+        self.server = server
+        self.select_timeout = select_timeout
+        self.selector = selectors.DefaultSelector()
+        self.connections = set()
+        self.running = False
+        self._loop_thread = None
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+    def _in_loop(self):
+        return threading.get_ident() == self._loop_thread
+
+    def _wakeup(self):
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # Le loop est déjà réveillé (ou arrêté)
+
+    def _call_in_loop(self, func, conn):
+        if self._in_loop():
+            func(conn)
+        else:
+            with self._pending_lock:
+                self._pending.append((func, conn))
+            self._wakeup()
+
+    def request_write(self, conn):
+        self._call_in_loop(self._enable_write, conn)
+
+    def drop_connection(self, conn):
+        """Disconnect a client (e.g. outbound queue overflow) and let ChatServer clean it up"""
+        if self.running:
+            self._call_in_loop(self._drop, conn)
+        else:
+            self._drop(conn)
+
+    def close_connection(self, conn):
+        if self.running:
+            self._call_in_loop(self._close_now, conn)
+        else:
+            self._close_now(conn)
+
+    def stop(self):
+        self.running = False
+        self._wakeup()
+
+    def run(self):
+        self._loop_thread = threading.get_ident()
+        self.running = True
+        listener = self.server.server
+        listener.setblocking(False)
+        self.selector.register(listener, selectors.EVENT_READ, None)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, self)
+
+        try:
+            while self.running and self.server.running:
+                try:
+                    events = self.selector.select(self.select_timeout)
+                except OSError:
+                    break
+                for key, mask in events:
+                    if key.data is None:
+                        self._accept(listener)
+                    elif key.data is self:
+                        self._drain_wakeup()
+                    else:
+                        conn = key.data
+                        if mask & selectors.EVENT_READ:
+                            self._on_readable(conn)
+                        if mask & selectors.EVENT_WRITE and not conn.closed:
+                            self._on_writable(conn)
+                self._run_pending()
+        finally:
+            self.running = False
+            self._run_pending()
+            for conn in list(self.connections):
+                self._close_now(conn)
+            try:
+                self.selector.close()
+            except Exception:
+                pass
+            self._wake_r.close()
+            self._wake_w.close()
+
+    def _drain_wakeup(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        for func, conn in pending:
+            func(conn)
+
+    def _accept(self, listener):
+        # Drain the whole backlog on each wakeup
+        while True:
+            try:
+                sock, addr = listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if self.server.running:
+                    self.server.log(f"TCP Accept Error: {e}", "ERROR")
+                return
+
+            self.server.log(f"Connection from {addr[0]}:{addr[1]}", "INFO")
+            sock.setblocking(False)
+            state = 'nick'
+            if self.server.use_ssl and self.server.ssl_context:
+                try:
+                    sock = self.server.ssl_context.wrap_socket(
+                        sock, server_side=True, do_handshake_on_connect=False)
+                    state = 'handshake'
+                except Exception as e:
+                    self.server.log(f"❌ SSL handshake failed: {e}", "ERROR")
+                    sock.close()
+                    continue
+
+            conn = TCPConnection(self, sock, addr, state, self.server.make_outbound_queue())
+            self.connections.add(conn)
+            if state == 'handshake':
+                self.selector.register(sock, selectors.EVENT_READ | selectors.EVENT_WRITE, conn)
+                self._do_handshake(conn)
+            else:
+                self.selector.register(sock, selectors.EVENT_READ, conn)
+                conn.send(encode_frame(FRAME_NICK))
+
+    def _do_handshake(self, conn):
+        try:
+            conn.sock.do_handshake()
+        except ssl.SSLWantReadError:
+            self._set_events(conn, selectors.EVENT_READ)
+            return
+        except ssl.SSLWantWriteError:
+            self._set_events(conn, selectors.EVENT_READ | selectors.EVENT_WRITE)
+            return
+        except Exception as e:
+            self.server.log(f"❌ SSL handshake failed: {e}", "ERROR")
+            self._close_now(conn)
+            return
+
+        self.server.log(f"🔐 SSL handshake completed with {conn.addr[0]}:{conn.addr[1]}", "SUCCESS")
+        conn.state = 'nick'
+        self._set_events(conn, selectors.EVENT_READ)
+        conn.send(encode_frame(FRAME_NICK))
+
+    def _recv(self, conn):
+        """
+        Read what is currently available into the connection's FrameReader.
+        Returns the byte count, 0 on EOF, None if nothing was ready yet.
+        """
+        total = 0
+        try:
+            while True:
+                n = conn.reader.recv_from(conn.sock)
+                if not n:
+                    return total if total else 0
+                total += n
+                # Un SSLSocket peut garder des octets déchiffrés en réserve
+                if not (isinstance(conn.sock, ssl.SSLSocket) and conn.sock.pending()):
+                    return total
+        except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+            return total if total else None
+
+    def _on_readable(self, conn):
+        if conn.state == 'handshake':
+            self._do_handshake(conn)
+            return
+
+        try:
+            received = self._recv(conn)
+        except Exception:
+            received = 0
+
+        if received is None:
+            return
+        if not received:
+            self._drop(conn)
+            return
+
+        try:
+            for frame_type, send_time, payload in conn.reader.frames():
+                if conn.state == 'nick':
+                    if frame_type != FRAME_NICK:
+                        raise ValueError("Expected NICK frame")
+                    conn.nickname = str(payload, 'utf-8').strip()
+                    conn.state = 'open'
+                    self.server.register_client_tcp(conn, conn.nickname)
+                elif frame_type == FRAME_MSG:
+                    self.server.process_message_tcp(conn.nickname, payload, send_time)
+        except Exception:
+            self._drop(conn)
+
+    def _on_writable(self, conn):
+        if conn.state == 'handshake':
+            self._do_handshake(conn)
+            return
+
+        # Batch queued frames into one send (up to 64 KB per batch)
+        if not conn.wbuf:
+            conn.wbuf += conn.outbound.take()
+        sent = 0
+        if conn.wbuf:
+            try:
+                sent = conn.sock.send(conn.wbuf)
+                del conn.wbuf[:sent]
+            except (BlockingIOError, ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                return
+            except Exception:
+                sent = None
+
+        if sent is None:
+            self._drop(conn)
+        elif not conn.wbuf and not conn.outbound:
+            self._set_events(conn, selectors.EVENT_READ)
+
+    def _enable_write(self, conn):
+        if not conn.closed and conn.state != 'handshake':
+            self._set_events(conn, selectors.EVENT_READ | selectors.EVENT_WRITE)
+
+    def _set_events(self, conn, events):
+        try:
+            if self.selector.get_key(conn.sock).events != events:
+                self.selector.modify(conn.sock, events, conn)
+        except (KeyError, ValueError):
+            pass
+
+    def _drop(self, conn):
+        """Peer went away: let ChatServer clean up registered clients"""
+        if conn.nickname is not None and conn in self.server.clients:
+            self.server.remove_client_tcp(conn)
+        self._close_now(conn)
+
+    def _close_now(self, conn):
+        if conn.closed:
+            return
+        conn.closed = True
+        conn.outbound.close()
+        self.connections.discard(conn)
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        try:
+            conn.sock.close()
+        except Exception:
+            pass
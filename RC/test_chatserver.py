@@ -0,0 +1,178 @@
+import os
+import socket
+
+import pytest
+
+import datagram
+from chatserver import ChatServer
+from datagram import DGRAM_HELLO, DGRAM_RESUME, DGRAM_SESSION, SESSION_EXPIRED, SESSION_NEW, SESSION_RESUMED
+from datagram import SESSION_TOKEN_BYTES
+from framing import FRAME_MSG, FrameReader, encode_frame
+from message_log import MessageLog
+from outbound import OutboundQueue
+
+
+def tcp_server(**settings):
+    """TCP ChatServer that is never started: clients are registered by hand"""
+    server = ChatServer('127.0.0.1', 0, 'TCP', use_ssl=False)
+    for name, value in settings.items():
+        setattr(server, name, value)
+    return server
+
+
+def connect(server, nickname):
+    """Fake TCP client: its frames stay in its outbound queue"""
+    client = object()
+    server.outbound_queues[client] = OutboundQueue()
+    with server.lock:
+        server.clients.append(client)
+        server.nicknames.append(nickname)
+        server.client_map[nickname] = client
+        server.init_client_stats(nickname)
+    return client
+
+
+def received(server, client):
+    reader = FrameReader()
+    for frame in server.outbound_queues[client].drain():
+        reader.feed(frame)
+    return [bytes(payload).decode('utf-8') for _, _, payload in reader.frames()]
+
+
+def test_history_has_no_command_replies(tmp_path):
+    server = tcp_server(message_log=MessageLog(str(tmp_path)))
+    client = connect(server, 'carol')
+    server.handle_room_command('carol', '/join lobby')
+    server.add_to_conversation('carol', "hello")
+    server.send_to_client('carol', "welcome back")
+    server.handle_room_command('carol', '/history')
+    server.handle_room_command('carol', '/history')
+    replies = received(server, client)
+    assert replies[0] == "[SERVER]: Joined #lobby (1 members)"
+    history = [text.split('] ', 1)[1] for text in replies if text.startswith('[history ')]
+    assert history == ["carol: hello", "[SERVER]: welcome back"] * 2
+    assert [entry['text'] for entry in server.conversations.recent('carol')] == ["hello", "welcome back"]
+    server.message_log.close()
+
+
+def test_unsent_chat_goes_to_mailbox_in_order():
+    server = tcp_server()
+    client = connect(server, 'dave')
+    server.known_nicknames.add('dave')
+    server.queue_tcp(client, 'dave', encode_frame(FRAME_MSG, b"Connected to server!"))
+    server.send_to_client('dave', "m0")
+    server.send_to_client('dave', "/rooms reply", reply=True)
+    server.rooms['lobby'] = {'dave'}
+    server.broadcast_to_room('lobby', "erin: hi")
+    server.send_to_client('dave', "m1")
+    server.remove_client_tcp(client)
+    # Only chat addressed to dave is kept: not the welcome banner, not the command reply
+    assert [payload for _, payload in server.mailboxes.take('dave')] == [
+        b"[SERVER]: m0", b"[#lobby] erin: hi", b"[SERVER]: m1"]
+
+
+def test_flush_mailbox_order():
+    server = tcp_server()
+    client = connect(server, 'dave')
+    server.known_nicknames.add('dave')
+    server.remove_client_tcp(client)
+    for i in range(5):
+        assert not server.send_to_client('dave', f"m{i}")
+    client = connect(server, 'dave')
+    assert server.flush_mailbox('dave') == 5
+    assert [text.split('] ', 1)[1] for text in received(server, client)] == [
+        f"[SERVER]: m{i}" for i in range(5)]
+    assert server.mailboxes.pending('dave') == 0
+
+
+def test_no_mailbox_for_unknown_nickname():
+    server = tcp_server()
+    assert not server.send_to_client('ghost', "hello?")
+    assert 'ghost' not in server.mailboxes
+
+
+@pytest.fixture
+def udp_server():
+    """Encrypted UDP server on an ephemeral port"""
+    server = ChatServer('127.0.0.1', 0, 'UDP', use_ssl=True)
+    server.packet_loss_rate = 0.0
+    assert server.start()
+    yield server
+    server.stop()
+
+
+def peer():
+    """A client address: each socket is a new (host, port), as after a rebind"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(('127.0.0.1', 0))
+    return sock
+
+
+def session_reply(server, sock, timeout=2.0):
+    """(status, payload) of the next session datagram sock gets, None if none comes"""
+    sock.settimeout(timeout)
+    try:
+        while True:
+            dgram_type, status, _, payload = datagram.unpack(sock.recv(65536), server.udp_crypto)
+            if dgram_type == DGRAM_SESSION:
+                return status, bytes(payload)
+    except socket.timeout:
+        return None
+
+
+def hello(server, sock, nickname):
+    sock.sendto(datagram.pack(DGRAM_HELLO, payload=nickname, crypto=server.udp_crypto), server.server.getsockname())
+    status, payload = session_reply(server, sock)
+    assert status == SESSION_NEW
+    return payload[:SESSION_TOKEN_BYTES]
+
+
+def resume(server, sock, token, counter):
+    data = datagram.pack(DGRAM_RESUME, counter, payload=token, crypto=server.udp_crypto)
+    sock.sendto(data, server.server.getsockname())
+    return data
+
+
+def test_resume_after_rebind(udp_server):
+    server = udp_server
+    a, b = peer(), peer()
+    token = hello(server, a, b"erin")
+    resume(server, b, token, 1)
+    assert session_reply(server, b) == (SESSION_RESUMED, token)
+    addr = b.getsockname()
+    assert server.clients == {addr: 'erin'} and server.client_map['erin'] == addr
+    assert server.sessions[token] == addr
+    resume(server, b, token, 2)  # RESUMED was lost: confirmed again, nothing moves
+    assert session_reply(server, b) == (SESSION_RESUMED, token)
+    assert server.clients == {addr: 'erin'}
+    assert server.client_stats['erin'].counts['resumptions'] == 1
+
+
+def test_resume_unknown_or_expired_token(udp_server):
+    server = udp_server
+    a, b, c = peer(), peer(), peer()
+    token = hello(server, a, b"erin")
+    resume(server, b, os.urandom(SESSION_TOKEN_BYTES), 1)
+    assert session_reply(server, b) == (SESSION_EXPIRED, b"")
+    assert server.clients == {a.getsockname(): 'erin'}
+    server.remove_client_udp(a.getsockname())
+    resume(server, c, token, 2)
+    assert session_reply(server, c) == (SESSION_EXPIRED, b"")
+    assert server.clients == {}
+
+
+def test_replayed_resume_from_another_address(udp_server):
+    server = udp_server
+    a, b, c = peer(), peer(), peer()
+    token = hello(server, a, b"erin")
+    captured = resume(server, b, token, 1)
+    assert session_reply(server, b) == (SESSION_RESUMED, token)
+    c.sendto(captured, server.server.getsockname())
+    assert session_reply(server, c, timeout=0.3) is None
+    assert server.clients == {b.getsockname(): 'erin'}
+    # An older RESUME does not move it back either; a newer one does
+    resume(server, a, token, 1)
+    assert session_reply(server, a, timeout=0.3) is None
+    resume(server, c, token, 2)
+    assert session_reply(server, c) == (SESSION_RESUMED, token)
+    assert server.clients == {c.getsockname(): 'erin'}
@@ -0,0 +1,73 @@
+import os
+
+import conversations
+from conversations import ConversationStore
+
+
+def fill(store, nickname, n):
+    for i in range(n):
+        store.append(nickname, {'text': f"{nickname} {i}"})
+
+
+def texts(messages):
+    return [message['text'] for message in messages]
+
+
+def test_pages_across_tail_and_spill(tmp_path):
+    store = ConversationStore(tail=3, spill_dir=str(tmp_path))
+    fill(store, 'alice', 10)
+    assert texts(store.recent('alice')) == ["alice 7", "alice 8", "alice 9"]
+    assert store.spilled('alice') == 7
+    assert store.count('alice') == 10
+    # Page 0 ends right before the tail; the last page is partial
+    assert texts(store.page('alice', 0, page_size=3)) == ["alice 4", "alice 5", "alice 6"]
+    assert texts(store.page('alice', 1, page_size=3)) == ["alice 1", "alice 2", "alice 3"]
+    assert texts(store.page('alice', 2, page_size=3)) == ["alice 0"]
+    assert store.page('alice', 3, page_size=3) == []
+    assert store.page('bob', 0) == []
+    store.close()
+
+
+def test_tail_only(tmp_path):
+    store = ConversationStore(tail=5, spill_dir=str(tmp_path))
+    fill(store, 'alice', 5)
+    assert store.spilled('alice') == 0
+    assert store.page('alice') == []
+    assert os.listdir(tmp_path) == []  # no segment until something spills
+    store.close()
+
+
+def test_reset_truncates_unreferenced_segment(tmp_path):
+    store = ConversationStore(tail=2, spill_dir=str(tmp_path))
+    fill(store, 'alice', 50)
+    fill(store, 'bob', 50)
+    store.reset('alice')
+    assert store.recent('alice') == [] and store.spilled('alice') == 0
+    assert texts(store.page('bob', 0, page_size=2)) == ["bob 46", "bob 47"]
+    store.reset('bob')
+    [name] = os.listdir(tmp_path)
+    assert os.path.getsize(tmp_path / name) == 0
+    fill(store, 'bob', 4)
+    assert texts(store.page('bob', 0)) == ["bob 0", "bob 1"]
+    store.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_reset_compacts_orphans(tmp_path, monkeypatch):
+    monkeypatch.setattr(conversations, 'COMPACT_BYTES', 0)
+    store = ConversationStore(tail=1, spill_dir=str(tmp_path))
+    fill(store, 'alice', 30)
+    fill(store, 'bob', 10)
+    fill(store, 'carol', 10)
+    store.page('alice')  # flushes the batch
+    [before] = os.listdir(tmp_path)
+    size = os.path.getsize(tmp_path / before)
+    store.reset('alice')  # 29 of 47 records orphaned: more than what is left
+    [after] = os.listdir(tmp_path)
+    assert after != before
+    assert os.path.getsize(tmp_path / after) < size / 2
+    assert texts(store.page('bob', 0, page_size=100)) == [f"bob {i}" for i in range(9)]
+    assert texts(store.page('carol', 1, page_size=4)) == ["carol 1", "carol 2", "carol 3", "carol 4"]
+    fill(store, 'carol', 2)
+    assert texts(store.page('carol', 0, page_size=3)) == ["carol 8", "carol 9", "carol 0"]
+    store.close()
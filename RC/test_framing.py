@@ -0,0 +1,56 @@
+import pytest
+
+from framing import FRAME_MSG, FRAME_NICK, FrameError, FrameReader, HEADER, encode_frame
+
+
+def test_byte_by_byte():
+    data = encode_frame(FRAME_MSG, b"hello", 12.5)
+    reader = FrameReader()
+    for i in range(len(data) - 1):
+        reader.feed(data[i:i + 1])
+        assert reader.next_frame() is None
+    reader.feed(data[-1:])
+    frame_type, send_time, payload = reader.next_frame()
+    assert (frame_type, send_time, bytes(payload)) == (FRAME_MSG, 12.5, b"hello")
+    assert reader.next_frame() is None
+    assert reader.start == reader.end == 0
+
+
+def test_split_header_then_several_frames():
+    data = encode_frame(FRAME_NICK) + encode_frame(FRAME_MSG, b"one") + encode_frame(FRAME_MSG, b"two")
+    reader = FrameReader()
+    reader.feed(data[:HEADER.size - 3])
+    assert list(reader.frames()) == []
+    reader.feed(data[HEADER.size - 3:-2])
+    assert [(t, bytes(p)) for t, _, p in reader.frames()] == [(FRAME_NICK, b""), (FRAME_MSG, b"one")]
+    reader.feed(data[-2:])
+    assert [bytes(p) for _, _, p in reader.frames()] == [b"two"]
+
+
+def test_partial_frame_larger_than_buffer():
+    payload = bytes(range(256)) * 40
+    data = encode_frame(FRAME_MSG, payload)
+    reader = FrameReader(size=64)
+    for start in range(0, len(data), 100):
+        assert reader.next_frame() is None
+        reader.feed(data[start:start + 100])
+    frame_type, _, view = reader.next_frame()
+    assert bytes(view) == payload
+    assert len(reader.buf) >= len(data)
+
+
+def test_compaction_keeps_pending_tail():
+    first, second = encode_frame(FRAME_MSG, b"a" * 40), encode_frame(FRAME_MSG, b"b" * 40)
+    reader = FrameReader(size=80)
+    reader.feed(first + second[:10])
+    assert bytes(reader.next_frame()[2]) == b"a" * 40
+    reader.feed(second[10:])  # moves the 10 pending bytes to the front instead of growing
+    assert len(reader.buf) == 80
+    assert bytes(reader.next_frame()[2]) == b"b" * 40
+
+
+def test_bad_version():
+    reader = FrameReader()
+    reader.feed(b"\x09" + encode_frame(FRAME_MSG, b"x")[1:])
+    with pytest.raises(FrameError):
+        reader.next_frame()
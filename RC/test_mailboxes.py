@@ -0,0 +1,51 @@
+from mailboxes import Mail, Mailboxes
+
+
+def test_take_in_order():
+    boxes = Mailboxes()
+    for i in range(3):
+        boxes.put('alice', b"m%d" % i, queued_at=float(i))
+    assert boxes.pending('alice') == 3 and len(boxes) == 3
+    assert boxes.take('alice') == [(0.0, b"m0"), (1.0, b"m1"), (2.0, b"m2")]
+    assert 'alice' not in boxes
+    assert boxes.take('alice') == []
+    assert boxes.bytes == 0
+
+
+def test_per_nickname_message_bound():
+    boxes = Mailboxes(max_messages=3)
+    for i in range(5):
+        boxes.put('alice', b"m%d" % i)
+    boxes.put('bob', b"b")
+    assert [payload for _, payload in boxes.take('alice')] == [b"m2", b"m3", b"m4"]
+    assert boxes.dropped == 2
+    assert boxes.pending('bob') == 1
+
+
+def test_per_nickname_byte_bound():
+    boxes = Mailboxes(max_bytes=10)
+    boxes.put('alice', b"aaaa")
+    boxes.put('alice', b"bbbb")
+    boxes.put('alice', b"cccc")  # the oldest goes to stay within 10 bytes
+    assert boxes.bytes == 8
+    assert not boxes.put('alice', b"x" * 11)  # larger than a whole mailbox
+    assert boxes.dropped == 2
+    assert [payload for _, payload in boxes.take('alice')] == [b"bbbb", b"cccc"]
+
+
+def test_least_recently_filled_mailbox_evicted():
+    boxes = Mailboxes(max_mailboxes=2)
+    boxes.put('alice', b"a1")
+    boxes.put('bob', b"b1")
+    boxes.put('alice', b"a2")  # alice filled last: bob is now the oldest
+    boxes.put('carol', b"c1")
+    assert 'bob' not in boxes
+    assert boxes.pending('alice') == 2 and boxes.pending('carol') == 1
+    assert boxes.dropped == 1
+    assert boxes.bytes == 6
+
+
+def test_mail_is_bytes():
+    payload = Mail(b"[SERVER]: hi")
+    assert isinstance(payload, bytes) and payload == b"[SERVER]: hi"
+    assert not isinstance(payload + b"!", Mail)  # only the tagged object itself
@@ -0,0 +1,75 @@
+import os
+
+from message_log import MessageLog, RECORD
+
+
+def fill(log, n, key='alice', start=0):
+    for i in range(start, start + n):
+        log.append(key, f"message {i}", timestamp=1000.0 + i)
+
+
+def tear(path, size):
+    """Cut the file to size bytes, like a crash in the middle of an append"""
+    with open(path, 'r+b') as f:
+        f.truncate(size)
+
+
+def test_torn_record_is_cut_off(tmp_path):
+    log = MessageLog(str(tmp_path))
+    fill(log, 3)
+    log.close()
+    path = log.segments[-1].path
+    full = os.path.getsize(path)
+    tear(path, full - 4)
+
+    log = MessageLog(str(tmp_path))
+    assert log.segments[-1].view is None  # unmapped before the truncate, remapped on the next read
+    assert len(log) == 2
+    assert [r['text'] for r in log.last('alice', 10)] == ["message 0", "message 1"]
+    assert os.path.getsize(path) < full - 4
+    # Appends carry on right after the last whole record
+    assert log.append('alice', "after") == 2
+    assert [r['text'] for r in log.last('alice', 2)] == ["message 1", "after"]
+    log.close()
+
+
+def test_torn_header(tmp_path):
+    log = MessageLog(str(tmp_path))
+    fill(log, 2)
+    log.close()
+    path = log.segments[-1].path
+    one = os.path.getsize(path) // 2
+    tear(path, one + RECORD.size - 1)
+
+    log = MessageLog(str(tmp_path))
+    assert len(log) == 1
+    assert os.path.getsize(path) == one
+    log.close()
+
+
+def test_recovery_across_segments(tmp_path):
+    log = MessageLog(str(tmp_path), segment_bytes=256, index_interval=2, time_interval=2)
+    fill(log, 10)
+    fill(log, 5, key='#lobby', start=10)
+    assert len(log.segments) > 2
+    log.close()
+    tear(log.segments[-1].path, os.path.getsize(log.segments[-1].path) - 1)
+
+    log = MessageLog(str(tmp_path), segment_bytes=256, index_interval=2, time_interval=2)
+    assert len(log) == 14
+    assert [r['text'] for r in log.last('alice', 3)] == ["message 7", "message 8", "message 9"]
+    assert [r['seq'] for r in log.last('#lobby', 10)] == [10, 11, 12, 13]
+    assert [r['seq'] for r in log.since(1008.0, 'alice')] == [8, 9]
+    assert log.append('#lobby', "again") == 14
+    log.close()
+
+
+def test_empty_segment(tmp_path):
+    log = MessageLog(str(tmp_path))
+    log.close()
+    tear(log.segments[-1].path, 0)
+    log = MessageLog(str(tmp_path))
+    assert len(log) == 0
+    assert log.last('alice', 5) == []
+    assert log.append('alice', "first") == 0
+    log.close()
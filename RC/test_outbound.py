@@ -0,0 +1,103 @@
+import threading
+import time
+
+import pytest
+
+from outbound import BLOCK, DISCONNECT, DROP_OLDEST, OutboundOverflow, OutboundQueue
+
+
+def test_drop_oldest_counts_drops():
+    queue = OutboundQueue(max_frames=3, policy=DROP_OLDEST)
+    for i in range(5):
+        queue.put(b"frame%d" % i)
+    assert queue.dropped == 2
+    assert len(queue) == 3
+    assert queue.take() == b"frame2frame3frame4"
+    assert queue.bytes == 0
+
+
+def test_drop_oldest_byte_bound():
+    queue = OutboundQueue(max_bytes=10, policy=DROP_OLDEST)
+    queue.put(b"aaaa")
+    queue.put(b"bbbb")
+    queue.put(b"cccccc")  # 14 bytes: the oldest frame goes
+    assert queue.dropped == 1
+    assert queue.bytes == 10
+    queue.put(b"x" * 20)  # larger than the bound on its own: still queued once the queue is empty
+    assert queue.drain() == [b"x" * 20]
+    assert queue.dropped == 3
+
+
+def test_disconnect_signal():
+    queue = OutboundQueue(max_frames=2, policy=DISCONNECT)
+    queue.put(b"a")
+    queue.put(b"b")
+    with pytest.raises(OutboundOverflow):
+        queue.put(b"c")
+    assert queue.dropped == 1
+    assert queue.drain() == [b"a", b"b"]  # queued frames are left as they were
+
+
+def test_block_waits_for_room():
+    queue = OutboundQueue(max_frames=1, policy=BLOCK, block_timeout=5.0)
+    queue.put(b"first")
+    threading.Timer(0.1, queue.take).start()
+    start = time.monotonic()
+    queue.put(b"second")
+    assert time.monotonic() - start >= 0.05
+    assert queue.dropped == 0
+    assert queue.drain() == [b"second"]
+
+
+def test_block_timeout():
+    queue = OutboundQueue(max_frames=1, policy=BLOCK, block_timeout=0.1)
+    queue.put(b"first")
+    with pytest.raises(OutboundOverflow):
+        queue.put(b"second")
+    assert queue.dropped == 1
+
+
+def test_block_without_can_block_drops_oldest():
+    # The event loop thread never waits: it falls back to drop_oldest
+    queue = OutboundQueue(max_frames=1, policy=BLOCK, block_timeout=5.0)
+    queue.put(b"first")
+    start = time.monotonic()
+    queue.put(b"second", can_block=False)
+    assert time.monotonic() - start < 1.0
+    assert queue.dropped == 1
+    assert queue.drain() == [b"second"]
+
+
+def test_close_wakes_blocked_producer():
+    queue = OutboundQueue(max_frames=1, policy=BLOCK, block_timeout=5.0)
+    queue.put(b"first")
+    threading.Timer(0.1, queue.close).start()
+    with pytest.raises(OutboundOverflow):
+        queue.put(b"second")
+    with pytest.raises(OutboundOverflow):
+        queue.put(b"after close")
+
+
+def test_take_batches_and_drain():
+    queue = OutboundQueue()
+    for i in range(4):
+        queue.put(bytes([i]) * 10)
+    assert queue.take(max_bytes=25) == bytes([0]) * 10 + bytes([1]) * 10
+    assert queue.take(max_bytes=5) == bytes([2]) * 10  # at least one frame
+    assert queue.drain() == [bytes([3]) * 10]
+    assert len(queue) == 0 and queue.bytes == 0
+    assert queue.take() == b''
+
+
+def test_wait_take():
+    queue = OutboundQueue()
+    assert queue.wait_take(timeout=0.05) == b''
+    threading.Timer(0.05, queue.put, args=(b"late",)).start()
+    assert queue.wait_take(timeout=5.0) == b"late"
+    queue.close()
+    assert queue.wait_take(timeout=5.0) == b''
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        OutboundQueue(policy='spill')
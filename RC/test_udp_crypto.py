@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+import udp_crypto
+from udp_crypto import NONCE_BYTES, RECV_EPOCHS, SESSION_NONCE, TAG_BYTES, KeyExchange, UDPCrypto
+
+
+def session_pair(**limits):
+    """(client, server) SessionCrypto of one handshake"""
+    psk = UDPCrypto().key
+    client, server = KeyExchange(), KeyExchange()
+    return (client.session(server.public, psk, initiator=True, **limits),
+            server.session(client.public, psk, initiator=False, **limits))
+
+
+def test_directions_have_their_own_key():
+    client, server = session_pair()
+    sealed = client.seal(b"hi", b"ad")
+    assert server.open(sealed, b"ad") == b"hi"
+    with pytest.raises(InvalidTag):
+        client.open(client.seal(b"own"))
+    with pytest.raises(InvalidTag):
+        server.open(sealed, b"other ad")
+
+
+def test_counter_nonces_and_rekey_after_messages():
+    client, server = session_pair(rekey_messages=3)
+    sealed = [client.seal(f"m{n}".encode()) for n in range(7)]
+    assert [SESSION_NONCE.unpack_from(data) for data in sealed] == [
+        (0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (1, 2), (2, 0)]
+    assert client.rekeys == 2
+    assert [server.open(data) for data in sealed] == [f"m{n}".encode() for n in range(7)]
+    assert server.recv_epoch == 2
+
+
+def test_rekey_after_bytes():
+    client, server = session_pair(rekey_bytes=100)
+    client.seal(b"x" * 100)
+    sealed = client.seal(b"y")
+    assert client.send_epoch == 1
+    assert server.open(sealed) == b"y"
+
+
+def test_late_datagrams_of_previous_epochs():
+    client, server = session_pair(rekey_messages=1)
+    sealed = [client.seal(f"m{n}".encode()) for n in range(RECV_EPOCHS + 2)]
+    # Skipping epochs: the key chain is derived forward from the current one
+    assert server.open(sealed[RECV_EPOCHS]) == f"m{RECV_EPOCHS}".encode()
+    assert server.open(sealed[1]) == b"m1"  # still kept
+    assert server.open(sealed[RECV_EPOCHS + 1]) == f"m{RECV_EPOCHS + 1}".encode()
+    with pytest.raises(ValueError):
+        server.open(sealed[1])  # pruned: more than RECV_EPOCHS behind
+
+
+def test_epoch_too_far_ahead():
+    client, server = session_pair(rekey_messages=1)
+    sealed = [client.seal(b"m") for _ in range(RECV_EPOCHS + 2)]
+    with pytest.raises(ValueError):
+        server.open(sealed[RECV_EPOCHS + 1])
+    assert server.recv_epoch == 0
+
+
+def test_forged_epoch_does_not_move_receiver():
+    client, server = session_pair()
+    sealed = bytearray(client.seal(b"m"))
+    SESSION_NONCE.pack_into(sealed, 0, 2, 0)
+    with pytest.raises(InvalidTag):
+        server.open(bytes(sealed))
+    assert server.recv_epoch == 0
+    assert 2 not in server.recv_keys
+
+
+def test_seal_into_open_into():
+    client, server = session_pair(rekey_messages=2)
+    buf = bytearray(256)
+    out = bytearray(256)
+    for n in range(5):
+        plaintext = f"message {n}".encode()
+        end = client.seal_into(buf, 8, plaintext, b"ad")
+        assert end == 8 + NONCE_BYTES + len(plaintext) + TAG_BYTES
+        assert bytes(server.open_into(buf[8:end], b"ad", out)) == plaintext
+
+
+def test_concurrent_epochs_out_of_order(monkeypatch):
+    # One message per epoch: datagram n is sealed under epoch n
+    client, server = session_pair(rekey_messages=1)
+    sealed = [client.seal(f"m{n}".encode()) for n in range(4)]
+    assert server.open(sealed[0]) == b"m0"
+
+    # Both threads derive their keys from epoch 0, then epoch 1 commits before epoch 2
+    both_decrypted = threading.Barrier(2)
+    real_aesgcm = udp_crypto.AESGCM
+
+    class SlowAESGCM:
+        def __init__(self, key):
+            self.aead = real_aesgcm(key)
+
+        def decrypt(self, nonce, data, associated_data):
+            plaintext = self.aead.decrypt(nonce, data, associated_data)
+            name = threading.current_thread().name
+            if name.startswith('epoch'):
+                both_decrypted.wait(timeout=5)
+                if name == 'epoch2':
+                    time.sleep(0.05)
+            return plaintext
+
+    monkeypatch.setattr(udp_crypto, 'AESGCM', SlowAESGCM)
+    opened = {}
+    threads = [threading.Thread(target=lambda n=n: opened.__setitem__(n, server.open(sealed[n])), name=f"epoch{n}")
+               for n in (1, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    monkeypatch.setattr(udp_crypto, 'AESGCM', real_aesgcm)
+
+    assert opened == {1: b"m1", 2: b"m2"}
+    assert server.recv_epoch == 2
+    # Each epoch keeps its own key: later epochs still authenticate
+    assert server.open(sealed[1]) == b"m1"
+    assert server.open(sealed[3]) == b"m3"
+    assert server.recv_epoch == 3
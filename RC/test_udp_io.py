@@ -0,0 +1,96 @@
+import socket
+
+import pytest
+
+from udp_io import MSG_DONTWAIT, DatagramBatch
+
+
+@pytest.fixture
+def pair():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sender.bind(('127.0.0.1', 0))
+    yield receiver, sender
+    receiver.close()
+    sender.close()
+
+
+def send(sender, receiver, *payloads):
+    for payload in payloads:
+        sender.sendto(payload, receiver.getsockname())
+
+
+@pytest.mark.skipif(not MSG_DONTWAIT, reason="one datagram per wakeup without MSG_DONTWAIT")
+def test_one_wakeup_drains_the_queue(pair):
+    receiver, sender = pair
+    io = DatagramBatch(receiver, batch_size=8)
+    send(sender, receiver, *[b"d%d" % i for i in range(5)])
+    batch = io.receive(timeout=1.0)
+    assert [bytes(data) for data, _ in batch] == [b"d%d" % i for i in range(5)]
+    assert {addr for _, addr in batch} == {sender.getsockname()}
+    assert (io.wakeups, io.received) == (1, 5)
+    io.close()
+
+
+@pytest.mark.skipif(not MSG_DONTWAIT, reason="one datagram per wakeup without MSG_DONTWAIT")
+def test_partial_batches(pair):
+    receiver, sender = pair
+    io = DatagramBatch(receiver, batch_size=3)
+    send(sender, receiver, *[b"d%d" % i for i in range(5)])
+    first = [bytes(data) for data, _ in io.receive(timeout=1.0)]
+    second = [bytes(data) for data, _ in io.receive(timeout=1.0)]
+    assert (first, second) == ([b"d0", b"d1", b"d2"], [b"d3", b"d4"])
+    assert (io.wakeups, io.received) == (2, 5)
+    io.close()
+
+
+def test_empty_batch_on_timeout(pair):
+    receiver, _ = pair
+    io = DatagramBatch(receiver)
+    assert io.receive(timeout=0.05) == []
+    assert (io.wakeups, io.received) == (0, 0)
+    assert receiver.gettimeout() is None  # stays blocking for the other threads' sendto()
+    io.close()
+
+
+def test_eagain_and_reset_end_or_skip(pair):
+    receiver, _ = pair
+
+    class Flaky:
+        """recvfrom_into: one datagram, an ICMP reset, one datagram, then EAGAIN"""
+
+        def __init__(self):
+            self.results = [b"one", ConnectionResetError(), b"two", BlockingIOError()]
+            self.flags = []
+
+        def recvfrom_into(self, buf, nbytes, flags):
+            self.flags.append(flags)
+            result = self.results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            buf[:len(result)] = result
+            return len(result), ('10.0.0.1', 4000)
+
+    io = DatagramBatch(receiver, batch_size=8)
+    io.sock = Flaky()
+    batch = io._drain()
+    if MSG_DONTWAIT:
+        assert [bytes(data) for data, _ in batch] == [b"one", b"two"]
+        assert io.sock.flags == [MSG_DONTWAIT] * 4
+    else:
+        assert [bytes(data) for data, _ in batch] == [b"one"]
+    io.close()
+
+
+def test_flush_sends_queued_datagrams(pair):
+    receiver, sender = pair
+    io = DatagramBatch(sender)
+    io.queue(b"ack1", receiver.getsockname())
+    io.queue(b"lost", ('256.0.0.1', 9))  # sendto fails: counted as not sent
+    io.queue(b"ack2", receiver.getsockname())
+    assert io.flush() == 2
+    assert io.outgoing == []
+    receiver.settimeout(1.0)
+    assert [receiver.recvfrom(64)[0] for _ in range(2)] == [b"ack1", b"ack2"]
+    io.close()
@@ -0,0 +1,65 @@
+from udp_reliability import AckTracker, ReplayWindow
+
+
+def test_replay_window_duplicates():
+    window = ReplayWindow(size=8)
+    assert window.accept(0)
+    assert window.accept(3)
+    assert not window.accept(3)
+    assert window.accept(1)
+    assert 1 in window and 2 not in window
+    assert not window.accept(0)
+
+
+def test_replay_window_edge_of_window():
+    window = ReplayWindow(size=8)
+    assert window.accept(10)
+    assert window.accept(3)  # offset 7: last slot of the window
+    assert not window.accept(2)  # offset 8: fell behind, treated as a duplicate
+    assert 2 in window
+    assert 11 not in window
+
+
+def test_replay_window_jump_clears_bitmap():
+    window = ReplayWindow(size=8)
+    for seq in range(5):
+        window.accept(seq)
+    assert window.accept(100)  # jump larger than the window
+    assert window.bitmap == 1
+    assert window.accept(99)
+    assert not window.accept(92)
+
+
+def test_ack_tracker_in_order_and_gaps():
+    tracker = AckTracker()
+    assert not tracker.record(0)
+    assert tracker.record(2)
+    assert tracker.record(3)
+    assert tracker.record(6)
+    assert tracker.next_expected == 1
+    assert tracker.sack_blocks() == [(2, 4), (6, 7)]
+    assert not tracker.record(1)  # fills the gap: cumulative ACK slides past 2 and 3
+    assert tracker.next_expected == 4
+    assert tracker.sack_blocks() == [(6, 7)]
+    assert not tracker.record(2)  # old duplicate
+
+
+def test_ack_tracker_sack_limit():
+    tracker = AckTracker()
+    for seq in range(1, 40, 2):
+        tracker.record(seq)
+    assert tracker.sack_blocks(limit=3) == [(1, 2), (3, 4), (5, 6)]
+
+
+def test_ack_tracker_ignores_seqs_past_window():
+    tracker = AckTracker(window=16)
+    assert tracker.record(15)
+    assert tracker.record(16)  # next_expected + window: not tracked
+    assert tracker.record(10 ** 9)
+    assert tracker.sack_blocks() == [(15, 16)]
+    for seq in range(15):
+        tracker.record(seq)
+    assert tracker.next_expected == 16
+    assert tracker.above == 0
+    tracker.record(16)  # retransmission now inside the window
+    assert tracker.next_expected == 17
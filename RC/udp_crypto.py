@@ -1,26 +1,162 @@
 
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import os
+import struct
 import base64
+import hashlib
+import hmac
+import json
+import threading
+
+DEFAULT_SALT = b'chathub_udp_salt_2024'  # Fixed salt (in production, negotiate this)
+DEFAULT_ITERATIONS = 100000
+
+NONCE_BYTES = 12
+TAG_BYTES = 16
+# Static key nonces: random prefix per UDPCrypto instance (many peers share the key) + message counter
+STATIC_NONCE = struct.Struct('!8sI')
+STATIC_COUNTER_LIMIT = 1 << 32
+
+# Per-session keys (X25519 + HKDF): nonce = key epoch (4 bytes) + message counter (8 bytes)
+PUBLIC_KEY_BYTES = 32
+SESSION_NONCE = struct.Struct('!IQ')
+SESSION_INFO = b'chathub udp session v1'
+REKEY_INFO = b'chathub udp rekey v1'
+REKEY_MESSAGES = 1 << 20
+REKEY_BYTES = 1 << 30
+RECV_EPOCHS = 4  # receive keys kept (and max epochs skipped), for datagrams sealed around a rekey
+
+# encrypt_into / decrypt_into write into a caller buffer (cryptography >= 45); older versions copy
+_AEAD_INTO = hasattr(AESGCM, 'encrypt_into')
+
+
+def _encrypt_into(aead, nonce, plaintext, associated_data, buf):
+    """Ciphertext + tag written to buf (exactly len(plaintext) + TAG_BYTES long)"""
+    if _AEAD_INTO:
+        aead.encrypt_into(nonce, plaintext, associated_data, buf)
+    else:
+        buf[:] = aead.encrypt(nonce, plaintext, associated_data)
+
+
+def _decrypt_into(aead, nonce, ciphertext, associated_data, buf):
+    """Plaintext written to the start of buf; returns a memoryview of it"""
+    out = memoryview(buf)[:len(ciphertext) - TAG_BYTES]
+    if _AEAD_INTO:
+        aead.decrypt_into(nonce, ciphertext, associated_data, out)
+    else:
+        out[:] = aead.decrypt(nonce, ciphertext, associated_data)
+    return out
+
+
+# Process-wide cache of derived keys, shared by every UDPCrypto instance
+# Keyed by (sha256(secret), salt, iterations) so the secret itself is not kept as a dict key
+_key_cache = {}
+_key_cache_lock = threading.Lock()
+
+
+def clear_key_cache():
+    with _key_cache_lock:
+        _key_cache.clear()
+
+
+def _key_fingerprint(key, secret):
+    return hmac.new(key, secret, hashlib.sha256).hexdigest()
+
+
+def _load_key_file(key_file, secret, salt, iterations):
+    """Return the key stored in key_file if it was derived with the same parameters"""
+    try:
+        with open(key_file) as f:
+            stored = json.load(f)
+        if stored.get('salt') != salt.hex() or stored.get('iterations') != iterations:
+            return None
+        key = bytes.fromhex(stored['key'])
+        if not hmac.compare_digest(stored.get('fingerprint', ''), _key_fingerprint(key, secret)):
+            return None
+        return key
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_key_file(key_file, key, secret, salt, iterations):
+    """Write the derived key (owner read/write only: the file is as sensitive as the secret)"""
+    try:
+        fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({
+                'salt': salt.hex(),
+                'iterations': iterations,
+                'key': key.hex(),
+                'fingerprint': _key_fingerprint(key, secret)
+            }, f)
+    except OSError:
+        pass
+
+
+def derive_key(shared_secret, salt=DEFAULT_SALT, iterations=DEFAULT_ITERATIONS, key_file=None):
+    """
+    Derive a 256-bit key with PBKDF2-HMAC-SHA256, at most once per process
+    (and once per key file across processes when key_file is given)
+    """
+    secret = shared_secret.encode('utf-8')
+    cache_key = (hashlib.sha256(secret).digest(), salt, iterations)
+
+    # Held during derivation so concurrent constructors wait instead of all deriving
+    with _key_cache_lock:
+        key = _key_cache.get(cache_key)
+        if key is not None:
+            return key
+
+        if key_file:
+            key = _load_key_file(key_file, secret, salt, iterations)
+
+        if key is None:
+            kdf = PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=32,  # 256 bits
+                salt=salt,
+                iterations=iterations,
+            )
+            key = kdf.derive(secret)
+            if key_file:
+                _save_key_file(key_file, key, secret, salt, iterations)
+
+        _key_cache[cache_key] = key
+        return key
+
 
 class UDPCrypto:
-    def __init__(self, shared_secret="ChatHub_UDP_Secret_2024"):
+    session = False  # static key shared by every peer (see SessionCrypto)
+
+    def __init__(self, shared_secret="ChatHub_UDP_Secret_2024", key_file=None):
         """
         Initialize UDP encryption with a shared secret
         In production, use proper key exchange (Diffie-Hellman)
+        The derived key is cached process-wide; key_file (or $CHATHUB_UDP_KEY_FILE)
+        also persists it on disk so new processes skip the PBKDF2 iterations
         """
-        # Derive a 256-bit key from the shared secret
-        salt = b'chathub_udp_salt_2024'  # Fixed salt (in production, negotiate this)
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,  # 256 bits
-            salt=salt,
-            iterations=100000,
-        )
-        self.key = kdf.derive(shared_secret.encode('utf-8'))
+        if key_file is None:
+            key_file = os.environ.get('CHATHUB_UDP_KEY_FILE')
+        self.key = derive_key(shared_secret, key_file=key_file)
         self.aesgcm = AESGCM(self.key)
+        # Nonces are a counter, not os.urandom(12) per message; the random prefix
+        # keeps instances sharing the key apart and is replaced if the counter wraps
+        self.lock = threading.Lock()
+        self.nonce_prefix = os.urandom(8)
+        self.counter = 0
+
+    def next_nonce(self):
+        with self.lock:
+            if self.counter >= STATIC_COUNTER_LIMIT:
+                self.nonce_prefix = os.urandom(8)
+                self.counter = 0
+            nonce = STATIC_NONCE.pack(self.nonce_prefix, self.counter)
+            self.counter += 1
+        return nonce
     
     def encrypt(self, plaintext):
         """
@@ -28,8 +164,8 @@ class UDPCrypto:
         Format: base64(nonce + ciphertext)
         """
         try:
-            # Generate random 12-byte nonce (96 bits - recommended for GCM)
-            nonce = os.urandom(12)
+            # 12-byte nonce (96 bits - recommended for GCM)
+            nonce = self.next_nonce()
             
             # Encrypt the data
             ciphertext = self.aesgcm.encrypt(nonce, plaintext.encode('utf-8'), None)
@@ -58,6 +194,38 @@ class UDPCrypto:
         except Exception as e:
             raise Exception(f"Decryption failed: {e}")
     
+    def seal(self, plaintext, associated_data=None):
+        """
+        Encrypt bytes and return raw nonce + ciphertext (no base64)
+        associated_data (e.g. a datagram header) is authenticated but not encrypted
+        """
+        nonce = self.next_nonce()
+        return nonce + self.aesgcm.encrypt(nonce, plaintext, associated_data)
+    
+    def seal_into(self, buf, offset, plaintext, associated_data=None):
+        """
+        seal() written into buf (a bytearray) at offset instead of new bytes;
+        returns the offset just past the tag
+        """
+        nonce = self.next_nonce()
+        end = offset + NONCE_BYTES + len(plaintext) + TAG_BYTES
+        buf[offset:offset + NONCE_BYTES] = nonce
+        _encrypt_into(self.aesgcm, nonce, plaintext, associated_data, memoryview(buf)[offset + NONCE_BYTES:end])
+        return end
+    
+    def open(self, data, associated_data=None):
+        """
+        Decrypt raw nonce + ciphertext produced by seal()
+        Raises cryptography.exceptions.InvalidTag if data or associated_data was tampered with
+        """
+        data = memoryview(data)
+        return self.aesgcm.decrypt(data[:12], data[12:], associated_data)
+    
+    def open_into(self, data, associated_data, buf):
+        """open() into buf: returns a memoryview of the plaintext, valid until buf is reused"""
+        data = memoryview(data)
+        return _decrypt_into(self.aesgcm, data[:NONCE_BYTES], data[NONCE_BYTES:], associated_data, buf)
+    
     def encrypt_message(self, message):
         """
         Encrypt a message and add encryption marker
@@ -74,4 +242,127 @@ class UDPCrypto:
             raise Exception("Not an encrypted message")
         
         encrypted_data = encrypted_message[4:]  # Remove "ENC:" prefix
-        return self.decrypt(encrypted_data)
\ No newline at end of file
+        return self.decrypt(encrypted_data)
+
+
+def _hkdf(secret, length, salt, info):
+    return HKDF(algorithm=hashes.SHA256(), length=length, salt=salt, info=info).derive(secret)
+
+
+class KeyExchange:
+    """
+    One side of the UDP session handshake: an ephemeral X25519 key pair.
+    The public keys travel in the HELLO and SESSION datagrams, sealed with the
+    static UDPCrypto key, so only holders of the shared secret can take part.
+    """
+
+    def __init__(self):
+        self.private = X25519PrivateKey.generate()
+        self.public = self.private.public_key().public_bytes(serialization.Encoding.Raw,
+                                                             serialization.PublicFormat.Raw)
+
+    def session(self, peer_public, psk, initiator, **limits):
+        """
+        SessionCrypto for this handshake. Both directions get their own key:
+        HKDF-SHA256 over the X25519 shared secret, salted with the static key
+        and bound to both public keys. initiator is the client side.
+        """
+        shared = self.private.exchange(X25519PublicKey.from_public_bytes(peer_public))
+        client_public, server_public = (self.public, peer_public) if initiator else (peer_public, self.public)
+        keys = _hkdf(shared, 64, psk, SESSION_INFO + client_public + server_public)
+        client_key, server_key = keys[:32], keys[32:]
+        if initiator:
+            return SessionCrypto(client_key, server_key, **limits)
+        return SessionCrypto(server_key, client_key, **limits)
+
+
+class SessionCrypto:
+    """
+    AES-256-GCM with the keys of one UDP session (same seal/open interface as
+    UDPCrypto). Nonces are never random: the key epoch and a per-key message
+    counter, so they cannot repeat under a key. After rekey_messages messages
+    or rekey_bytes bytes the send key moves to the next epoch (HKDF of the
+    previous key); the receiver follows the epoch found in the nonce and keeps
+    the previous keys (RECV_EPOCHS) for datagrams still in flight, so
+    rekey_messages should stay well above the send window.
+    """
+    session = True
+
+    def __init__(self, send_key, recv_key, rekey_messages=REKEY_MESSAGES, rekey_bytes=REKEY_BYTES):
+        self.rekey_messages = rekey_messages
+        self.rekey_bytes = rekey_bytes
+        self.lock = threading.Lock()
+        self.send_key = send_key
+        self.send_aead = AESGCM(send_key)
+        self.send_epoch = 0
+        self.counter = 0
+        self.sealed_bytes = 0
+        self.recv_epoch = 0
+        self.recv_keys = {0: recv_key}
+        self.recv_aeads = {0: AESGCM(recv_key)}
+        self.rekeys = 0
+        self.local_public = None  # handshake reply of the server side, sent again if the client asks
+
+    def next_nonce(self, size):
+        """(nonce, send AEAD) for size more bytes, moving to the next epoch first if needed"""
+        with self.lock:
+            if self.counter >= self.rekey_messages or self.sealed_bytes >= self.rekey_bytes:
+                self.send_key = _hkdf(self.send_key, 32, None, REKEY_INFO)
+                self.send_aead = AESGCM(self.send_key)
+                self.send_epoch += 1
+                self.counter = 0
+                self.sealed_bytes = 0
+                self.rekeys += 1
+            nonce = SESSION_NONCE.pack(self.send_epoch, self.counter)
+            self.counter += 1
+            self.sealed_bytes += size
+            return nonce, self.send_aead
+
+    def seal(self, plaintext, associated_data=None):
+        nonce, aead = self.next_nonce(len(plaintext))
+        return nonce + aead.encrypt(nonce, plaintext, associated_data)
+
+    def seal_into(self, buf, offset, plaintext, associated_data=None):
+        nonce, aead = self.next_nonce(len(plaintext))
+        end = offset + NONCE_BYTES + len(plaintext) + TAG_BYTES
+        buf[offset:offset + NONCE_BYTES] = nonce
+        _encrypt_into(aead, nonce, plaintext, associated_data, memoryview(buf)[offset + NONCE_BYTES:end])
+        return end
+
+    def open(self, data, associated_data=None):
+        return self.open_into(data, associated_data, None)
+
+    def open_into(self, data, associated_data, buf):
+        """open() into buf when given (a memoryview of the plaintext is returned), else new bytes"""
+        data = memoryview(data)
+        epoch = SESSION_NONCE.unpack_from(data)[0]
+        with self.lock:
+            aead = self.recv_aeads.get(epoch)
+            if aead is None:
+                if not self.recv_epoch < epoch <= self.recv_epoch + RECV_EPOCHS:
+                    raise ValueError(f"Key epoch {epoch} out of range (current {self.recv_epoch})")
+                # Chain from the current epoch; another thread (crypto pipeline) may move
+                # recv_epoch before this datagram is authenticated, so keep where it started
+                base = self.recv_epoch
+                keys = [self.recv_keys[base]]
+                while len(keys) <= epoch - base:
+                    keys.append(_hkdf(keys[-1], 32, None, REKEY_INFO))
+                aead = AESGCM(keys[-1])
+        if buf is None:
+            plaintext = aead.decrypt(data[:NONCE_BYTES], data[NONCE_BYTES:], associated_data)
+        else:
+            plaintext = _decrypt_into(aead, data[:NONCE_BYTES], data[NONCE_BYTES:], associated_data, buf)
+        if epoch > self.recv_epoch:
+            # Authenticated: move to the new epoch, keep a few older keys for late datagrams
+            with self.lock:
+                if epoch > self.recv_epoch:
+                    for offset, key in enumerate(keys[1:], base + 1):
+                        if offset <= self.recv_epoch:
+                            continue  # already stored by a thread that got there first
+                        self.recv_keys[offset] = key
+                        self.recv_aeads[offset] = aead if offset == epoch else AESGCM(key)
+                    self.recv_epoch = epoch
+                    for old in [e for e in self.recv_keys if e <= epoch - RECV_EPOCHS]:
+                        del self.recv_keys[old]
+                        del self.recv_aeads[old]
+        return plaintext
@@ -0,0 +1,78 @@
+import selectors
+import socket
+
+from datagram import MAX_DATAGRAM
+
+# Non-blocking receive on a blocking socket (Linux, BSD, macOS); without it, one datagram per wakeup
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+
+class DatagramBatch:
+    """
+    Batched I/O on one UDP socket, for the single thread that reads it.
+    Python has no recvmmsg/sendmmsg; instead each wakeup waits once and
+    drains up to batch_size datagrams with recvfrom_into(MSG_DONTWAIT) into
+    preallocated buffers, so the socket mode is never switched (no
+    settimeout per datagram) and no bytes object is allocated per datagram.
+    Datagrams to send (ACKs, fast retransmits) are queued while the batch is
+    handled and sent together by flush().
+    """
+
+    def __init__(self, sock, batch_size=64, buffer_size=MAX_DATAGRAM):
+        self.sock = sock
+        self.sock.settimeout(None)  # blocking: other threads' sendto() wait instead of failing
+        self.batch_size = batch_size
+        self.buffers = [memoryview(bytearray(buffer_size)) for _ in range(batch_size)]
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.outgoing = []
+        self.wakeups = 0
+        self.received = 0
+
+    def receive(self, timeout=None):
+        """
+        Next batch: [(datagram, addr)], waiting up to timeout if none is queued.
+        The datagrams are views of the buffers, valid until the next receive().
+        """
+        batch = self._drain() if MSG_DONTWAIT else []
+        if not batch and self.selector.select(timeout):
+            batch = self._drain()
+        if batch:
+            self.wakeups += 1
+            self.received += len(batch)
+        return batch
+
+    def _drain(self):
+        batch = []
+        for buf in self.buffers:
+            try:
+                nbytes, addr = self.sock.recvfrom_into(buf, 0, MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            except ConnectionResetError:
+                continue  # Windows: ICMP port unreachable for an earlier sendto
+            batch.append((buf[:nbytes], addr))
+            if not MSG_DONTWAIT:
+                break
+        return batch
+
+    def queue(self, data, addr):
+        self.outgoing.append((data, addr))
+
+    def flush(self):
+        """Send the queued datagrams; returns how many were sent"""
+        outgoing, self.outgoing = self.outgoing, []
+        sent = 0
+        for data, addr in outgoing:
+            try:
+                self.sock.sendto(data, addr)
+                sent += 1
+            except OSError:
+                pass  # like a lost datagram: ACKs are resent, retransmits rescheduled
+        return sent
+
+    def close(self):
+        try:
+            self.selector.close()
+        except (OSError, ValueError):
+            pass
@@ -0,0 +1,256 @@
+import collections
+import heapq
+import itertools
+import threading
+import time
+
+
+class RetransmitScheduler:
+    """
+    Deadline heap for UDP retransmissions.
+    schedule() is O(log n); cancel() is O(1) - cancelled entries are skipped
+    when they reach the top of the heap. wait_due() sleeps until the earliest
+    deadline (or until an earlier one is scheduled) and only returns the
+    entries that actually expired.
+    """
+
+    def __init__(self):
+        self._heap = []       # (deadline, seq, key)
+        self._live = {}       # key -> seq of its current heap entry
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._live)
+
+    def schedule(self, key, deadline):
+        """(Re)arm the timer of key; replaces any previous deadline"""
+        with self._cond:
+            seq = next(self._seq)
+            self._live[key] = seq
+            heapq.heappush(self._heap, (deadline, seq, key))
+            if len(self._heap) > 2 * len(self._live) + 64:
+                self._compact()
+            if self._heap[0][1] == seq:
+                self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._live.pop(key, None)
+
+    def clear(self):
+        with self._cond:
+            self._heap = []
+            self._live = {}
+            self._cond.notify_all()
+
+    def wake(self):
+        """Wake a waiting wait_due() (e.g. on shutdown)"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def _compact(self):
+        # Drop cancelled/superseded entries once they outnumber the live ones
+        self._heap = [entry for entry in self._heap if self._live.get(entry[2]) == entry[1]]
+        heapq.heapify(self._heap)
+
+    def _drop_stale_head(self):
+        while self._heap and self._live.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+
+    def next_deadline(self):
+        with self._cond:
+            self._drop_stale_head()
+            return self._heap[0][0] if self._heap else None
+
+    def wait_due(self, timeout=None):
+        """
+        Block until at least one deadline expires (or timeout / wake()).
+        Returns the expired keys, which are removed from the scheduler.
+        """
+        with self._cond:
+            self._drop_stale_head()
+            now = time.time()
+            if not self._heap or self._heap[0][0] > now:
+                wait = timeout
+                if self._heap:
+                    until_next = self._heap[0][0] - now
+                    wait = until_next if timeout is None else min(until_next, timeout)
+                self._cond.wait(wait)
+                self._drop_stale_head()
+                now = time.time()
+
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                deadline, seq, key = heapq.heappop(self._heap)
+                if self._live.get(key) == seq:
+                    del self._live[key]
+                    due.append(key)
+            return due
+
+
+class RTTEstimator:
+    """
+    Smoothed RTT / RTT variance and retransmission timeout of one peer (RFC 6298).
+    Callers apply Karn's rule: only ACKs of never-retransmitted messages are
+    sampled. Backoff is per message: timeout(retries) doubles the RTO per retry.
+    """
+
+    def __init__(self, initial_rto=1.0, min_rto=0.2, max_rto=10.0):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.samples = 0
+
+    def sample(self, rtt):
+        """Feed one RTT measurement (seconds)"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.samples += 1
+        self.rto = min(max(self.srtt + max(0.01, 4 * self.rttvar), self.min_rto), self.max_rto)
+
+    def timeout(self, retries=0):
+        """RTO for a message already retransmitted `retries` times (exponential backoff)"""
+        return min(self.rto * (2 ** retries), self.max_rto)
+
+    def fast_timeout(self):
+        """Age after which a SACK hole may be resent: srtt + 4*rttvar, without the RTO floor"""
+        if self.srtt is None:
+            return self.rto
+        return self.srtt + 4 * self.rttvar
+
+
+class SendWindow:
+    """
+    Per-peer sliding send window.
+    Sequence numbers are allocated per peer; a new message may only be sent
+    while next_seq < lowest unacknowledged seq + size. Messages that do not
+    fit wait in `backlog` until ACKs open the window.
+    """
+
+    def __init__(self, size=64):
+        self.size = size
+        self.next_seq = 0
+        self.in_flight = set()
+        self.backlog = collections.deque()
+
+    def base(self):
+        return min(self.in_flight) if self.in_flight else self.next_seq
+
+    def can_send(self):
+        return self.next_seq < self.base() + self.size
+
+    def allocate(self):
+        seq = self.next_seq
+        self.next_seq += 1
+        self.in_flight.add(seq)
+        return seq
+
+    def acknowledge(self, cumulative, sack_blocks=()):
+        """
+        Apply a cumulative ACK (every seq < cumulative received) and SACK blocks
+        [start, end); returns the newly acknowledged sequence numbers
+        """
+        acked = [seq for seq in self.in_flight
+                 if seq < cumulative or any(start <= seq < end for start, end in sack_blocks)]
+        self.in_flight.difference_update(acked)
+        return acked
+
+    def holes(self, sack_blocks):
+        """In-flight seqs below the highest SACKed one (lost or reordered): fast retransmit candidates"""
+        if not sack_blocks:
+            return []
+        highest = max(end for start, end in sack_blocks)
+        return sorted(seq for seq in self.in_flight if seq < highest)
+
+    def release(self, seq):
+        """Forget a message that was given up on"""
+        self.in_flight.discard(seq)
+
+
+class ReplayWindow:
+    """
+    Fixed-size duplicate/replay window (IPsec/DTLS style).
+    Bit i of `bitmap` is set when seq `highest - i` was received; seqs that
+    fall behind the window are treated as duplicates. Memory is constant per
+    peer and checks are O(1) for a given size. The window must be larger than
+    the sender's SendWindow so a retransmission never falls behind it.
+    """
+
+    def __init__(self, size=1024):
+        self.size = size
+        self.mask = (1 << size) - 1
+        self.highest = -1
+        self.bitmap = 0
+
+    def __contains__(self, seq):
+        if seq > self.highest:
+            return False
+        offset = self.highest - seq
+        return offset >= self.size or bool(self.bitmap >> offset & 1)
+
+    def accept(self, seq):
+        """Record seq; returns False if it is a duplicate or too old for the window"""
+        if seq > self.highest:
+            shift = seq - self.highest
+            self.bitmap = ((self.bitmap << shift) | 1) & self.mask if shift < self.size else 1
+            self.highest = seq
+            return True
+        offset = self.highest - seq
+        if offset >= self.size or self.bitmap >> offset & 1:
+            return False
+        self.bitmap |= 1 << offset
+        return True
+
+
+class AckTracker:
+    """
+    Receive side of the window: builds cumulative ACK + SACK blocks.
+    next_expected is the cumulative ACK (all lower seqs were received);
+    bit i of `above` is set when seq `next_expected + i` was received past
+    the first gap. Seqs `window` or more past next_expected are not tracked
+    (same bound as ReplayWindow): memory stays constant per peer.
+    """
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.next_expected = 0
+        self.above = 0
+
+    def record(self, seq):
+        """Record a received seq; returns True if it arrived out of order"""
+        offset = seq - self.next_expected
+        if offset < 0:
+            return False
+        if offset >= self.window:
+            return True  # too far ahead: not SACKed, the cumulative ACK will cover its retransmission
+        if offset == 0:
+            # Slide past the run of seqs already received after this one
+            above = self.above | 1
+            run = (~above & (above + 1)).bit_length() - 1
+            self.above = above >> run
+            self.next_expected += run
+            return False
+        self.above |= 1 << offset
+        return True
+
+    def sack_blocks(self, limit=8):
+        """Contiguous [start, end) ranges received above the cumulative ACK"""
+        blocks = []
+        bits = self.above
+        start = self.next_expected
+        while bits and len(blocks) < limit:
+            gap = (bits & -bits).bit_length() - 1
+            bits >>= gap
+            start += gap
+            run = (~bits & (bits + 1)).bit_length() - 1
+            blocks.append((start, start + run))
+            bits >>= run
+            start += run
+        return blocks
@@ -0,0 +1,278 @@
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from datetime import datetime
+
+from conversations import ConversationStore
+from stats import CLIENT_COUNTERS
+
+FORWARD_INTERVAL = 0.1  # workers batch their log/conversation events this often
+STATS_INTERVAL = 0.5    # and send a stats snapshot this often
+START_TIMEOUT = 15.0
+
+
+def drain_list(q):
+    items = []
+    while True:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            return items
+
+
+def run_worker(index, host, port, use_ssl, settings, events, commands):
+    """
+    Worker process: one UDP ChatServer bound with SO_REUSEPORT. Its logs,
+    client list, conversations and stats go to the pool through events;
+    commands ('send' from the control UI, 'stop') come back through commands.
+    """
+    from chatserver import ChatServer
+
+    # Ctrl-C reaches the whole process group: the pool stops its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server = ChatServer(host, port, 'UDP', use_ssl=use_ssl)
+    server.udp_reuseport = True
+    for name, value in settings.items():
+        setattr(server, name, value)
+    # One log directory / metrics port per worker: they would collide otherwise
+    if server.message_log_dir:
+        server.message_log_dir = os.path.join(server.message_log_dir, f"worker-{index}")
+    if server.metrics_port is not None:
+        server.metrics_port += index
+
+    started = server.start()
+    events.put(('logs', index, drain_list(server.log_queue)))
+    events.put(('started', index, started))
+    if not started:
+        return
+
+    next_stats = 0.0
+    while True:
+        try:
+            command = commands.get(timeout=FORWARD_INTERVAL)
+        except queue.Empty:
+            command = None
+        if command is not None and command[0] == 'stop':
+            break
+        if command is not None and command[0] == 'send':
+            server.send_to_client(command[1], command[2])
+
+        forward_events(server, index, events)
+        now = time.time()
+        if now >= next_stats:
+            next_stats = now + STATS_INTERVAL
+            forward_stats(server, index, events)
+
+    forward_stats(server, index, events)
+    server.stop()
+    forward_events(server, index, events)
+    events.put(('stopped', index, None))
+
+
+def forward_events(server, index, events):
+    """Worker side: the ChatServer's GUI queues, batched into one event per queue"""
+    logs = drain_list(server.log_queue)
+    if logs:
+        events.put(('logs', index, logs))
+    clients = drain_list(server.clients_queue)
+    if clients:
+        events.put(('clients', index, clients[-1]))
+    conversations = drain_list(server.conversations_queue)
+    if conversations:
+        events.put(('conversations', index, conversations))
+
+
+def forward_stats(server, index, events):
+    with server.lock:
+        nicknames = list(server.client_map)
+    per_client = {nickname: server.get_client_stats(nickname) for nickname in nicknames}
+    events.put(('stats', index, per_client, server.get_server_stats()))
+
+
+class UDPWorkerPool:
+    """
+    Multi-process UDP server: `workers` ChatServer processes bound to the
+    same port with SO_REUSEPORT, the kernel hashing each peer address to one
+    of them, so decryption and bookkeeping of different peers run on
+    different cores. Everything per peer (clients, pending_acks, replay
+    windows, sessions) lives in the worker that owns the peer.
+
+    The pool has the control surface of a ChatServer (log/clients/
+    conversations queues, conversations, get_client_stats, send_to_client,
+    get_server_stats): the workers report through one event queue, merged
+    here by a thread. Rooms, mailboxes, /history and session resumption
+    only see the peers of their own worker (a peer whose address changes
+    may land on another worker and starts a new session there).
+    """
+
+    def __init__(self, host='0.0.0.0', port=5555, workers=2, use_ssl=True):
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.protocol = 'UDP'
+        self.use_ssl = use_ssl
+        self.running = False
+        self.log_queue = queue.Queue()
+        self.clients_queue = queue.Queue()
+        self.conversations_queue = queue.Queue()
+        self.conversations = ConversationStore(tail=200)
+
+        # Applied to every worker's ChatServer
+        self.packet_loss_rate = 0.30
+        self.metrics_port = None
+        self.message_log_dir = None
+        self.udp_batch = 64
+        self.crypto_workers = 0
+
+        self.lock = threading.Lock()
+        self.processes = []
+        self.commands = []
+        self.events = None
+        self.event_thread = None
+        self.worker_clients = {}  # worker -> nicknames
+        self.owners = {}          # nickname -> worker
+        self.client_stats = {}    # nickname -> last get_client_stats() of its worker
+        self.worker_totals = {}   # worker -> get_server_stats() of the worker
+        self.started = {}
+        self.stopped = set()
+
+    def log(self, message, level="INFO"):
+        self.log_queue.put({"time": datetime.now().strftime("%H:%M:%S"), "level": level, "message": message})
+
+    def start(self):
+        if not hasattr(socket, 'SO_REUSEPORT'):
+            self.log("❌ SO_REUSEPORT is not available on this platform: use a single UDP server", "ERROR")
+            return False
+        # spawn, not fork: the pool may run next to other threads (GUI, exporters)
+        context = multiprocessing.get_context('spawn')
+        settings = {
+            'packet_loss_rate': self.packet_loss_rate,
+            'metrics_port': self.metrics_port,
+            'message_log_dir': self.message_log_dir,
+            'udp_batch': self.udp_batch,
+            'crypto_workers': self.crypto_workers,
+        }
+        self.events = context.Queue()
+        self.started = {}
+        self.stopped = set()
+        self.commands = [context.Queue() for _ in range(self.workers)]
+        self.processes = [
+            context.Process(target=run_worker, daemon=True,
+                            args=(index, self.host, self.port, self.use_ssl, settings, self.events, self.commands[index]))
+            for index in range(self.workers)
+        ]
+        for process in self.processes:
+            process.start()
+        self.running = True
+        self.event_thread = threading.Thread(target=self.handle_events, daemon=True)
+        self.event_thread.start()
+
+        deadline = time.time() + START_TIMEOUT
+        while len(self.started) < self.workers and time.time() < deadline:
+            time.sleep(0.05)
+        if len(self.started) < self.workers or not all(self.started.values()):
+            self.log(f"❌ {self.workers - sum(self.started.values())} UDP worker(s) failed to start", "ERROR")
+            self.stop()
+            return False
+        self.log(f"🧵 {self.workers} UDP workers sharing {self.host}:{self.port} (SO_REUSEPORT)", "SUCCESS")
+        return True
+
+    def stop(self):
+        for commands, process in zip(self.commands, self.processes):
+            if process.is_alive():
+                commands.put(('stop',))
+        for process in self.processes:
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.running = False
+        if self.event_thread is not None:
+            self.event_thread.join(timeout=2.0)
+            self.event_thread = None
+        self.processes = []
+        self.commands = []
+        self.conversations.close()
+        self.log("Server stopped", "WARNING")
+
+    def handle_events(self):
+        while self.running or not self.events.empty():
+            try:
+                event = self.events.get(timeout=0.5)
+            except (queue.Empty, OSError, EOFError):
+                continue
+            kind, index = event[0], event[1]
+            if kind == 'logs':
+                for entry in event[2]:
+                    entry['message'] = f"[w{index}] {entry['message']}"
+                    self.log_queue.put(entry)
+            elif kind == 'clients':
+                with self.lock:
+                    self.worker_clients[index] = event[2]
+                    self.owners = {nickname: worker for worker, nicknames in self.worker_clients.items()
+                                   for nickname in nicknames}
+                    for nickname in [n for n in self.client_stats if n not in self.owners]:
+                        del self.client_stats[nickname]
+                    merged = [nickname for worker in sorted(self.worker_clients)
+                              for nickname in self.worker_clients[worker]]
+                self.clients_queue.put(merged)
+            elif kind == 'conversations':
+                for update in event[2]:
+                    self.conversations.append(update['nickname'], update['message'])
+                    self.conversations_queue.put(update)
+            elif kind == 'stats':
+                # Only the owner's snapshot counts: a late one from a worker the
+                # nickname left (or of a client already gone) must not bring it back
+                with self.lock:
+                    for nickname, worker in self.owners.items():
+                        if worker != index:
+                            continue
+                        if nickname in event[2]:
+                            self.client_stats[nickname] = event[2][nickname]
+                        else:
+                            self.client_stats.pop(nickname, None)
+                    self.worker_totals[index] = event[3]
+            elif kind == 'started':
+                self.started[index] = event[2]
+            elif kind == 'stopped':
+                self.stopped.add(index)
+
+    def send_to_client(self, nickname, message):
+        """Hand a server message to the worker that owns nickname (False if no worker has it)"""
+        with self.lock:
+            worker = self.owners.get(nickname)
+        if worker is None or not self.running:
+            return False
+        self.commands[worker].put(('send', nickname, message))
+        return True
+
+    def get_client_stats(self, nickname):
+        """Last snapshot sent by the nickname's worker (at most STATS_INTERVAL old)"""
+        with self.lock:
+            stats = self.client_stats.get(nickname)
+            return dict(stats) if stats is not None else None
+
+    def get_server_stats(self):
+        """Counter totals summed over the workers"""
+        totals = dict.fromkeys(CLIENT_COUNTERS, 0)
+        with self.lock:
+            for worker_totals in self.worker_totals.values():
+                for name, value in worker_totals.items():
+                    totals[name] += value
+        return totals
+
+    def get_worker_stats(self):
+        """Per worker: connected nicknames and counter totals (how the kernel spread the peers)"""
+        with self.lock:
+            return {worker: {'clients': len(self.worker_clients.get(worker, ())),
+                             'received_count': self.worker_totals.get(worker, {}).get('received_count', 0)}
+                    for worker in range(self.workers)}
+
+    def process_queues(self):
+        """Streamlit GUI only (see ChatServer.process_queues)"""
+        from gui_adapter import process_server_queues
+        process_server_queues(self)